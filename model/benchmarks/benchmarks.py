@@ -0,0 +1,227 @@
+"""Benchmarks of the ingest -> preprocess -> dataset pipeline.
+
+Benchmarks are written like asv benchmarks: each class has `params` (one list per parameter)
+and `param_names`, a `setup` run once per combination of parameters, and `time_*` methods
+that run.py times and measures the peak memory of.
+
+The pipeline modules are imported from the workspace created by run.py (see
+synthetic.make_workspace), so every benchmark reads and writes generated data, never the
+real `data/` directory. Fetch benchmarks go to the local StubServer started by run.py.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import synthetic
+
+# Set by run.py before any benchmark runs
+workspace = None
+server = None
+
+_populated = {}
+
+
+def prepare(**config) -> dict:
+    """
+    Generate the workspace data for a configuration, unless it is already there.
+
+    Returns:
+        dict: The system names and their NTD IDs.
+    """
+    if _populated.get('config') != config:
+        _populated['systems'] = synthetic.populate(workspace, **config)
+        _populated['config'] = config
+
+    return _populated['systems']
+
+
+def load_brt(systems: dict) -> list:
+    from transit_data import BRTData
+
+    brts = []
+    for system in systems:
+        brt = BRTData(system)
+        brt.load_existing_data()
+        brts.append(brt)
+
+    return brts
+
+
+class FetchCensus(object):
+    params = ([50, 500], [1, 50])
+    param_names = ['zipcodes', 'batch_size']
+
+    def setup(self, zipcodes, batch_size):
+        self.zipcodes = synthetic.zipcode_names(0, zipcodes)
+
+    def time_save_tables(self, zipcodes, batch_size):
+        from cache import ResponseCache
+        from census_schema import CENSUS_TABLES
+        from fetch import CensusFetcher
+        from transit_data import BRTData
+
+        # A cold cache and no rate limit, so only the client side is measured
+        with tempfile.TemporaryDirectory() as cache_dir:
+            fetcher = CensusFetcher(rate=1e6, burst=1000, cache=ResponseCache(cache_dir))
+            brt = BRTData('fetch_benchmark', self.zipcodes, fetcher, batch_size)
+
+            for table in CENSUS_TABLES:
+                brt.save_table(table)
+
+            fetcher.close()
+
+
+class FetchWalkScore(object):
+    params = ([50, 500],)
+    param_names = ['zipcodes']
+
+    def setup(self, zipcodes):
+        rng = np.random.default_rng(0)
+        self.centroids = {
+            zipcode: (lat, lon)
+            for zipcode, lat, lon in zip(synthetic.zipcode_names(0, zipcodes), rng.uniform(25, 49, zipcodes), rng.uniform(-124, -67, zipcodes))
+        }
+
+    def time_fetch_many(self, zipcodes):
+        from cache import ResponseCache
+        from walkability import WalkScoreClient
+
+        # A cold cache and no rate limit, so only the client side is measured
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = WalkScoreClient('benchmark', rate=1e6, daily_quota=10 ** 9, cache=ResponseCache(cache_dir))
+            client.fetch_many(self.centroids)
+            client.close()
+
+
+class FetchNTD(object):
+    params = ([1000, 10000],)
+    param_names = ['rows']
+    member = '2016-NTD-Metrics_0.xlsx'
+
+    def setup(self, rows):
+        server.add_archive(2016, synthetic.make_ntd_archive(2016, rows, self.member))
+
+    def time_fetch_zip_data(self, rows):
+        from cache import ResponseCache
+        from transit_data import NTDData
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ntd = NTDData(cache=ResponseCache(tmp_dir))
+            ntd.data_dir = tmp_dir
+            ntd.fetch_zip_data(2016, self.member)
+
+
+class LoadData(object):
+    params = ([50, 500, 5000],)
+    param_names = ['zipcodes']
+
+    def setup(self, zipcodes):
+        self.systems = prepare(n_zipcodes=zipcodes)
+
+    def time_load_existing_data(self, zipcodes):
+        for brt in load_brt(self.systems):
+            for metric in synthetic.METRICS:
+                brt.get_data(metric)
+
+
+class ProcessBRT(object):
+    params = ([50, 500, 5000],)
+    param_names = ['zipcodes']
+
+    def setup(self, zipcodes):
+        self.brts = load_brt(prepare(n_zipcodes=zipcodes))
+        for brt in self.brts:
+            for metric in synthetic.METRICS:
+                brt.get_data(metric)
+
+    def time_process_brt_data(self, zipcodes):
+        from preprocess import process_brt_data
+
+        for brt in self.brts:
+            process_brt_data(brt)
+
+
+class AggregateSystems(object):
+    params = ([14, 100, 500],)
+    param_names = ['systems']
+
+    def setup(self, systems):
+        self.brts = load_brt(prepare(n_systems=systems))
+        for brt in self.brts:
+            for metric in synthetic.METRICS:
+                brt.get_data(metric)
+
+    def time_aggregate_systems(self, systems):
+        from aggregate import ZipAggregator
+
+        ZipAggregator().aggregate_systems(self.brts)
+
+
+class CleanTensor(object):
+    params = ([8, 40], [100, 5000])
+    param_names = ['years', 'zipcodes']
+
+    def setup(self, years, zipcodes):
+        rng = np.random.default_rng(0)
+        zipcode_names = synthetic.zipcode_names(0, zipcodes)
+        year_names = synthetic.year_names(years)
+
+        self.tensor = np.stack([
+            synthetic.make_metric_table(metric, zipcode_names, year_names, rng).to_numpy()
+            for metric in synthetic.METRICS
+        ])
+
+    def time_clean_tensor(self, years, zipcodes):
+        from clean import clean_tensor
+
+        clean_tensor(self.tensor, synthetic.METRICS)
+
+
+class ProcessNTD(object):
+    params = ([14, 200, 1000],)
+    param_names = ['systems']
+
+    def setup(self, systems):
+        from transit_data import NTDData
+
+        self.systems = prepare(n_systems=systems, n_zipcodes=5, extra_ntd_rows=1000)
+        self.ntd = NTDData()
+        self.ntd.load_existing_data()
+
+    def time_process_ntd_batch(self, systems):
+        from preprocess import process_ntd_batch
+
+        self.ntd.unload()
+        process_ntd_batch(self.ntd, self.systems)
+
+
+class PreprocessMain(object):
+    params = ([50, 500],)
+    param_names = ['zipcodes']
+
+    def setup(self, zipcodes):
+        prepare(n_zipcodes=zipcodes)
+
+    def time_preprocess_main(self, zipcodes):
+        import preprocess
+
+        preprocess.main()
+
+
+class ProcessMain(object):
+    params = ([50, 500],)
+    param_names = ['zipcodes']
+
+    def setup(self, zipcodes):
+        import preprocess
+
+        prepare(n_zipcodes=zipcodes)
+        if not os.listdir(os.path.join(workspace, "data", "processed")):
+            preprocess.main()
+
+    def time_process_main(self, zipcodes):
+        import process
+
+        process.main()
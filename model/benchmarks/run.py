@@ -0,0 +1,201 @@
+"""Runs the benchmarks of benchmarks.py and stores the results as JSON.
+
+Each `time_*` method is run once to warm up, then timed `--repeat` times, then run once more
+under tracemalloc to record its peak memory. Results go to `benchmarks/results/<commit>.json`
+so that runs of different commits can be compared:
+
+    python run.py                          # all benchmarks
+    python run.py --quick -b Process       # smallest parameters of matching benchmarks only
+    python run.py --compare results/abc1234.json results/def5678.json
+
+Benchmarks run in a temporary workspace (see synthetic.make_workspace) against a local stub
+of the Census API and APTA downloads (see stub_server.py).
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(script_dir, "results")
+
+# Ratio of medians above which --compare reports a regression
+REGRESSION_RATIO = 1.2
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def collect(module, pattern: str = None, quick: bool = False) -> list[tuple]:
+    """
+    Returns the (class, method name, parameter dict) of every benchmark to run.
+    """
+    benchmarks = []
+
+    for name in dir(module):
+        cls = getattr(module, name)
+        if not isinstance(cls, type) or not hasattr(cls, 'params'):
+            continue
+
+        grid = [values[:1] for values in cls.params] if quick else cls.params
+        for method in sorted(attr for attr in dir(cls) if attr.startswith('time_')):
+            if pattern and pattern not in f'{name}.{method}':
+                continue
+
+            for values in itertools.product(*grid):
+                benchmarks.append((cls, method, dict(zip(cls.param_names, values))))
+
+    return benchmarks
+
+
+def measure(cls, method: str, params: dict, repeat: int) -> dict:
+    """
+    Set up a benchmark, then time it and record its peak memory.
+    """
+    bench = cls()
+    args = list(params.values())
+
+    # The pipeline prints progress and tables, which would drown the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        bench.setup(*args)
+        run = getattr(bench, method)
+
+        run(*args)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'benchmark': f'{cls.__name__}.{method}',
+        'params': params,
+        'times': times,
+        'median': statistics.median(times),
+        'min': min(times),
+        'peak_bytes': peak,
+    }
+
+
+def run(pattern: str = None, quick: bool = False, repeat: int = 5, output: str = None) -> str:
+    """
+    Run the benchmarks and write the results.
+
+    Returns:
+        str: The path of the results file.
+    """
+    import synthetic
+    import stub_server
+
+    with tempfile.TemporaryDirectory() as root:
+        sys.path.insert(0, synthetic.make_workspace(root))
+
+        import benchmarks
+        benchmarks.workspace = root
+
+        results = []
+        with stub_server.StubServer() as server, stub_server.patched_urls(server.url):
+            benchmarks.server = server
+
+            for cls, method, params in collect(benchmarks, pattern, quick):
+                result = measure(cls, method, params, repeat)
+                results.append(result)
+
+                print(f"{result['benchmark']} {params}: median {result['median'] * 1000:.1f} ms, "
+                      f"min {result['min'] * 1000:.1f} ms, peak {result['peak_bytes'] / 2**20:.1f} MiB")
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'repeat': repeat,
+        'results': results,
+    }
+
+    output = output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'Results written to {output}')
+    return output
+
+
+def compare(base_path: str, new_path: str, threshold: float = REGRESSION_RATIO) -> bool:
+    """
+    Print the ratio of the median times of two result files.
+
+    Returns:
+        bool: True if any benchmark got slower by more than the threshold ratio.
+    """
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def key(result):
+        return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+    base_results = {key(result): result for result in base['results']}
+    regressed = False
+
+    print(f"{base['commit']} -> {new['commit']}")
+    for result in new['results']:
+        previous = base_results.get(key(result))
+        if previous is None:
+            continue
+
+        ratio = result['median'] / previous['median']
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        elif ratio < 1 / threshold:
+            flag = '  improved'
+
+        print(f"{result['benchmark']} {result['params']}: {previous['median'] * 1000:.1f} -> "
+              f"{result['median'] * 1000:.1f} ms ({ratio:.2f}x){flag}")
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data pipeline.')
+    parser.add_argument('-b', '--bench', help='only run benchmarks whose Class.method contains this string')
+    parser.add_argument('--quick', action='store_true', help='only run the smallest parameters of each benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark (default: 5)')
+    parser.add_argument('--output', help='results path (default: results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        if compare(*args.compare):
+            sys.exit(1)
+        return
+
+    run(args.bench, args.quick, args.repeat, args.output)
+
+if __name__ == "__main__":
+    main()
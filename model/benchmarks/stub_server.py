@@ -0,0 +1,191 @@
+"""Local stand-in for the Census API and the APTA archive downloads.
+
+StubServer serves, on a random local port:
+- /api/access/data/table?g=...&id=... : Census table responses for the requested zipcodes,
+  with every variable of census_schema.CENSUS_TABLES at its usual column.
+- *.zip : a synthetic APTA archive (see synthetic.make_ntd_archive) registered for the year
+  in the path.
+- /score?lat=...&lon=... : a Walk Score API response with a deterministic score per point.
+
+Census and Walk Score responses carry an ETag and are answered 304 when the request's
+If-None-Match matches it. Tests can queue failures in StubServer.faults, each answered to one
+request before the server behaves again, and set StubServer.walkscore_status to make the
+Walk Score API answer with an error status (e.g. 41, quota exceeded), or
+StubServer.walkscore_quota to have it report the quota exceeded after that many scores.
+
+patched_urls points census_schema.CENSUS_TABLES, transit_data.APTA_URL and
+walkability.WALKSCORE_URL at the server for the duration of a benchmark.
+"""
+
+import json
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import synthetic
+
+CENSUS_URL = 'https://data.census.gov'
+
+
+def census_header(table: str, year: str) -> list[str]:
+    """
+    Returns the header of a Census table response: each variable at its legacy column (see
+    census_schema), GEO_ID and NAME first and filler columns in between.
+    """
+    from census_schema import CENSUS_TABLES, field_for_year
+
+    fields = [field_for_year(versions, year) for versions in CENSUS_TABLES[table]['fields'].values()]
+    header = ['GEO_ID', 'NAME'] + [f'{table}_X{i:03d}' for i in range(2, max(index for _, index in fields) + 1)]
+
+    for variable, index in fields:
+        header[index] = variable
+
+    return header
+
+
+class StubServer(object):
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Parameters:
+            latency (float): Seconds to wait before answering each request, to simulate a remote API.
+        """
+        self.latency = latency
+        self.archives = {}
+        self.requests = 0
+
+        # Status codes (or (status code, headers) tuples) answered to the next requests, in order
+        self.faults = []
+        self.walkscore_status = 1
+        # Scores answered before the Walk Score API reports the quota exceeded (None for no limit)
+        self.walkscore_quota = None
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'StubServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_archive(self, year: int, archive: bytes) -> None:
+        self.archives[year] = archive
+
+    def make_handler(self):
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def send_body(self, body: bytes, content_type: str, etag: bool = False) -> None:
+                tag = f'"{zlib.crc32(body):08x}"'
+                if etag and self.headers.get('If-None-Match') == tag:
+                    with stub.lock:
+                        stub.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', tag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if etag:
+                    self.send_header('ETag', tag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_fault(self, fault) -> None:
+                status, headers = fault if isinstance(fault, tuple) else (fault, {})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                with stub.lock:
+                    stub.requests += 1
+                    fault = stub.faults.pop(0) if stub.faults else None
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+
+                if fault is not None:
+                    self.send_fault(fault)
+                    return
+
+                url = urlparse(self.path)
+
+                if url.path.endswith('.zip'):
+                    year = int(re.search(r'(20\d\d)', url.path).group(1))
+                    if year in stub.archives:
+                        self.send_body(stub.archives[year], 'application/zip')
+                        return
+
+                elif url.path == '/api/access/data/table':
+                    query = parse_qs(url.query)
+                    dataset = query['id'][0]
+                    year = re.search(r'(20\d\d)', dataset).group(1)
+                    table = 'ZBP' if dataset.startswith('ZBP') else dataset.split('.')[1]
+                    zipcodes = [geo[-5:] for geo in query['g'][0].split(':')]
+
+                    res = synthetic.census_response(census_header(table, year), zipcodes, f'{table}/{year}')
+                    self.send_body(json.dumps(res).encode(), 'application/json', etag=True)
+                    return
+
+                elif url.path == '/score':
+                    query = parse_qs(url.query)
+                    with stub.lock:
+                        status = stub.walkscore_status
+                        if stub.walkscore_quota is not None:
+                            status = 41 if stub.walkscore_quota == 0 else status
+                            stub.walkscore_quota = max(stub.walkscore_quota - 1, 0)
+
+                    if status != 1:
+                        self.send_body(json.dumps({'status': status}).encode(), 'application/json')
+                        return
+
+                    score = zlib.crc32(f"{query['lat'][0]},{query['lon'][0]}".encode()) % 101
+                    self.send_body(json.dumps({'status': 1, 'walkscore': score}).encode(), 'application/json', etag=True)
+                    return
+
+                self.send_response(404)
+                self.end_headers()
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return StubHandler
+
+
+@contextmanager
+def patched_urls(base_url: str):
+    """
+    Point the Census table URLs and the APTA archive URL at a local server.
+    """
+    import census_schema
+    import transit_data
+    import walkability
+
+    urls = {table: spec['url'] for table, spec in census_schema.CENSUS_TABLES.items()}
+    apta_url = transit_data.APTA_URL
+    walkscore_url = walkability.WALKSCORE_URL
+
+    try:
+        for table, url in urls.items():
+            census_schema.CENSUS_TABLES[table]['url'] = url.replace(CENSUS_URL, base_url)
+        transit_data.APTA_URL = base_url + '/apta'
+        walkability.WALKSCORE_URL = base_url + '/score'
+        yield
+    finally:
+        for table, url in urls.items():
+            census_schema.CENSUS_TABLES[table]['url'] = url
+        transit_data.APTA_URL = apta_url
+        walkability.WALKSCORE_URL = walkscore_url
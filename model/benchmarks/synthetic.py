@@ -0,0 +1,250 @@
+"""Synthetic data generators for the benchmarks.
+
+The generators produce data shaped like the real inputs (Census metric tables, filtered NTD
+tables, Census API responses and APTA archives) at any number of systems, zipcodes and years,
+with a realistic share of Census sentinels, zeros and missing values.
+
+make_workspace builds a throw-away copy of the project tree: `src` links to the real
+modules, so they compute their data paths relative to the workspace, and `data/` holds
+generated data instead of the real one.
+"""
+
+import io
+import os
+import zlib
+from zipfile import ZipFile
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/data"))
+
+# The systems preprocess.main and process.main work on, with their NTD IDs
+SYSTEMS = {
+    'los_angeles': '9154',
+    'boston': '1003',
+    'houston': '6008',
+    'orlando': '4035',
+    'cleveland': '5015',
+    'richmond': '3006',
+    'kansas': '7005',
+    'grand_rapids': '5033',
+    'hartford': '1048',
+    'eugene': '7',
+    'indianapolis': '5050',
+    'albuquerque': '6019',
+    'aspen_westcliffe_glenwood_springs': '8R01-013',
+    'fort_collins': '8011',
+}
+
+METRICS = ['income', 'pop', 'age', 'house_married', 'house_nonfam', 'house_m_single', 'house_f_single', 'car', 'biz']
+
+# (mean, relative spread) of each metric
+DISTRIBUTIONS = {
+    'income': (60000, 0.4),
+    'pop': (20000, 0.6),
+    'age': (38, 0.15),
+    'house_married': (40, 0.3),
+    'house_nonfam': (35, 0.3),
+    'house_m_single': (5, 0.5),
+    'house_f_single': (15, 0.4),
+    'car': (10, 0.8),
+    'biz': (500, 0.8),
+}
+
+SENTINEL = -666666666
+
+# --------------------------------------------
+# NAMES
+# --------------------------------------------
+
+def system_names(n_systems: int) -> dict:
+    """
+    Returns n_systems system names with their NTD IDs: the real systems first, then made-up ones.
+    """
+    systems = dict(list(SYSTEMS.items())[:n_systems])
+    for i in range(len(systems), n_systems):
+        systems[f'system_{i:04d}'] = str(90000 + i)
+
+    return systems
+
+def zipcode_names(system_index: int, n_zipcodes: int) -> list[str]:
+    return [f'{(system_index * 7919 + i) % 100000:05d}' for i in range(n_zipcodes)]
+
+def year_names(n_years: int, first: int = 2013) -> list[int]:
+    return list(range(first, first + n_years))
+
+# --------------------------------------------
+# CENSUS DATA
+# --------------------------------------------
+
+def make_metric_table(metric: str, zipcodes: list[str], years: list[int], rng: np.random.Generator,
+                      sentinel_share: float = 0.01, zero_share: float = 0.01) -> pd.DataFrame:
+    """
+    Returns a raw metric table (years x zipcodes) like BRTData saves them.
+    """
+    mean, spread = DISTRIBUTIONS[metric]
+
+    # Each zipcode has its own level, drifting a little every year
+    level = mean * rng.lognormal(0, spread, size=len(zipcodes))
+    growth = 1 + rng.normal(0.01, 0.02, size=(len(years), 1)).cumsum(axis=0)
+    values = np.round(level * growth, 2)
+
+    cells = rng.random(values.shape)
+    values[cells < sentinel_share] = SENTINEL
+    values[(cells >= sentinel_share) & (cells < sentinel_share + zero_share)] = 0
+
+    if metric == 'biz':
+        values[np.array(years) > 2018] = np.nan
+
+    return pd.DataFrame(values, index=pd.Index(years, name='year'), columns=zipcodes)
+
+def write_raw_tables(data_dir: str, systems: dict, n_zipcodes: int, years: list[int], seed: int = 0) -> None:
+    """
+    Write the raw metric tables of every system to data_dir/raw/<system>/<metric>.csv.
+    """
+    rng = np.random.default_rng(seed)
+
+    for i, system in enumerate(systems):
+        system_dir = os.path.join(data_dir, "raw", system)
+        os.makedirs(system_dir, exist_ok=True)
+        zipcodes = zipcode_names(i, n_zipcodes)
+
+        for metric in METRICS:
+            make_metric_table(metric, zipcodes, years, rng).to_csv(os.path.join(system_dir, f"{metric}.csv"))
+
+def census_response(header: list[str], zipcodes: list[str], key: str) -> dict:
+    """
+    Returns a Census API JSON response for some zipcodes, with deterministic random values.
+
+    Parameters:
+        header (list[str]): Column names; 'GEO_ID' and 'NAME' columns get the zipcode.
+        zipcodes (list[str]): Zipcodes of the rows.
+        key (str): Seed of the values, e.g. the table and year.
+    """
+    rows = [header]
+
+    for zipcode in zipcodes:
+        rng = np.random.default_rng(zlib.crc32(f'{key}/{zipcode}'.encode()))
+        values = rng.uniform(0, 100000, size=len(header)).round(1).astype(str).tolist()
+
+        for column, value in (('GEO_ID', f'860Z200US{zipcode}'), ('NAME', f'ZCTA5 {zipcode}')):
+            if column in header:
+                values[header.index(column)] = value
+        rows.append(values)
+
+    return {'response': {'data': rows}}
+
+# --------------------------------------------
+# NTD DATA
+# --------------------------------------------
+
+def make_ntd_table(year: int, ids: list[str], rng: np.random.Generator, extra_rows: int = 0) -> pd.DataFrame:
+    """
+    Returns a filtered NTD table like NTDData saves it, with one bus row per ID plus extra_rows
+    rows of other agencies, using the column names of the given year.
+    """
+    ids = list(ids) + [str(80000 + i) for i in range(extra_rows)]
+    n = len(ids)
+
+    trips = rng.lognormal(15, 1, size=n).round()
+    miles = rng.lognormal(13, 1, size=n).round()
+
+    # About one value in ten is reported in thousands
+    thousands = rng.random(n) < 0.1
+    trips[thousands] /= 1000
+    miles[thousands] /= 1000
+
+    if year == 2013:
+        # The 2013 sheet has numeric IDs and is loaded without the hyphenated ones
+        numeric = np.array([i.isdigit() for i in ids])
+        return pd.DataFrame({
+            'State': 'XX', 'Name': [f'Agency {i}' for i in ids], 'ID': [float(i) if i.isdigit() else np.nan for i in ids],
+            'UZA Population': rng.integers(50000, 10000000, size=n).astype(float), 'Mode': 'RB',
+            'VOMS': rng.integers(1, 200, size=n), 'Annual Vehicle Revenue Miles': miles,
+            'Unlinked Passenger Trips': trips,
+        })[numeric].set_index('State')
+
+    id_column = 'Legacy NTDID' if year == 2014 else 'Legacy NTD ID'
+    population_column = 'UZA Population' if year == 2014 else 'Primary UZA\n Population'
+    voms_column = 'VOMS' if year == 2014 else 'Mode VOMS'
+    miles_column = 'Annual Vehicle Revenue Miles' if year == 2014 else 'Vehicle Revenue Miles'
+
+    return pd.DataFrame({
+        'Agency': [f'Agency {i}' for i in ids], 'City': [f'City {i}' for i in ids], 'State': 'XX', id_column: ids,
+        population_column: rng.integers(50000, 10000000, size=n), 'Mode': 'RB',
+        voms_column: rng.integers(1, 200, size=n), 'Unlinked Passenger Trips': trips, miles_column: miles,
+    }).set_index('Agency')
+
+def write_ntd_tables(data_dir: str, ids: list[str], years: list[int], extra_rows: int = 0, seed: int = 0) -> None:
+    """
+    Write the filtered NTD tables of every year to data_dir/raw/ntd-ridership.
+    """
+    rng = np.random.default_rng(seed)
+    ntd_dir = os.path.join(data_dir, "raw", "ntd-ridership")
+    os.makedirs(ntd_dir, exist_ok=True)
+
+    for year in years:
+        make_ntd_table(year, ids, rng, extra_rows).to_csv(os.path.join(ntd_dir, f"transit_data_{year}_filtered.csv"))
+
+def make_ntd_archive(year: int, n_rows: int, member: str, seed: int = 0) -> bytes:
+    """
+    Returns an APTA-like zip archive whose member is a Metrics spreadsheet of n_rows agencies,
+    half of them bus rows.
+    """
+    rng = np.random.default_rng(seed)
+    df = make_ntd_table(year, [str(10000 + i) for i in range(n_rows)], rng).reset_index()
+    df['Mode'] = np.where(np.arange(n_rows) % 2 == 0, 'RB', 'MB')
+
+    sheet = io.BytesIO()
+    df.to_excel(sheet, sheet_name='Metrics', index=False)
+
+    archive = io.BytesIO()
+    with ZipFile(archive, 'w') as zf:
+        zf.writestr(member, sheet.getvalue())
+
+    return archive.getvalue()
+
+# --------------------------------------------
+# WORKSPACE
+# --------------------------------------------
+
+def make_workspace(root: str) -> str:
+    """
+    Create a project tree at root whose `src`, `src/data` and `src/models` modules are links to
+    the real ones.
+
+    Returns:
+        str: The path of the workspace's `src/data` directory, to put on sys.path.
+    """
+    os.makedirs(os.path.join(root, "data", "processed"), exist_ok=True)
+
+    for directory in ['', 'data', 'models']:
+        source_dir = os.path.join(os.path.dirname(SRC_DIR), directory)
+        target_dir = os.path.join(root, "src", directory)
+        os.makedirs(target_dir, exist_ok=True)
+
+        for filename in os.listdir(source_dir):
+            target = os.path.join(target_dir, filename)
+            if filename.endswith('.py') and not os.path.exists(target):
+                os.symlink(os.path.join(source_dir, filename), target)
+
+    return os.path.join(root, "src", "data")
+
+def populate(root: str, n_systems: int = 14, n_zipcodes: int = 50, years: list[int] = None, extra_ntd_rows: int = 0) -> dict:
+    """
+    Replace the data of a workspace with freshly generated raw Census and NTD tables.
+
+    Returns:
+        dict: The generated system names and their NTD IDs.
+    """
+    data_dir = os.path.join(root, "data")
+    for dirpath, _, filenames in os.walk(data_dir):
+        for filename in filenames:
+            os.remove(os.path.join(dirpath, filename))
+
+    systems = system_names(n_systems)
+    write_raw_tables(data_dir, systems, n_zipcodes, years or year_names(8))
+    write_ntd_tables(data_dir, list(systems.values()), year_names(8), extra_ntd_rows)
+
+    return systems
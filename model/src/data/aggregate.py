@@ -0,0 +1,231 @@
+"""Module to aggregate the per-zipcode BRTData metrics of a system into one value per year.
+
+The nine metric tables of a system are held in a single float array of shape
+(metric, year, zipcode) (see tensor_store.py), and of several systems into one of shape (system, metric, year,
+zipcode) padded with NaN, so every metric (and system) is cleaned and reduced in one NumPy
+pass.
+
+The array is first cleaned cell by cell with the rules of clean.CLEANING_RULES (Census
+sentinels such as -666666666 are masked, gaps imputed), then each metric is reduced over
+the zipcodes that have a value with one of REDUCERS:
+- mean: unweighted mean (what process_brt_data originally computed for every metric).
+- weighted: mean weighted by each zipcode's population in the same year, so large zipcodes
+  count more than small ones. Used for medians and percentages.
+- median, sum: plain median and total.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from census_schema import METRICS
+from clean import CLEANING_RULES, clean_tensor, quality_report
+
+# Counts keep an unweighted mean, medians and percentages are weighted by population
+DEFAULT_REDUCERS = {
+    'income': 'weighted',
+    'pop': 'mean',
+    'age': 'weighted',
+    'house_married': 'weighted',
+    'house_nonfam': 'weighted',
+    'house_m_single': 'weighted',
+    'house_f_single': 'weighted',
+    'car': 'weighted',
+    'biz': 'mean',
+}
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def build_tensor(brt_data, metrics: list[str] = METRICS) -> tuple:
+    """
+    Returns the metric tables of a BRTData object as one array.
+
+    Parameters:
+        brt_data (BRTData): BRTData object to read the tables of.
+        metrics (list[str]): Metrics to stack.
+
+    Returns:
+        tuple: The float64 array of shape (metric, year, zipcode), the years and the zipcodes.
+    """
+    store = brt_data.get_store(metrics)
+
+    return store.tensor(metrics), store.years, store.zipcodes
+
+def stack_tensors(tensors: list[np.ndarray]) -> np.ndarray:
+    """
+    Stack (metric, year, zipcode) arrays of several systems into one (system, metric, year, zipcode)
+    array. Systems with fewer zipcodes are padded with NaN, which cleaning drops.
+    """
+    width = max(tensor.shape[-1] for tensor in tensors)
+    stacked = np.full((len(tensors),) + tensors[0].shape[:-1] + (width,), np.nan)
+
+    for i, tensor in enumerate(tensors):
+        stacked[i, ..., :tensor.shape[-1]] = tensor
+
+    return stacked
+
+def weighted_constant(brt_data, values: pd.Series, weight_metric: str = 'pop') -> pd.Series:
+    """
+    Reduce a per-zipcode value that is the same every year (e.g. a Walk Score) to one value per
+    year, weighted by each zipcode's value of weight_metric that year.
+
+    Parameters:
+        brt_data (BRTData): BRTData object whose weight metric weighs the zipcodes.
+        values (pandas.Series): The value of each zipcode, NaN where missing.
+        weight_metric (str): Metric whose values weight the zipcodes.
+
+    Returns:
+        pandas.Series: The weighted value of each year of the BRTData object.
+    """
+    store = brt_data.get_store([weight_metric])
+    weights = store.tensor([weight_metric])
+
+    tensor = np.broadcast_to(values.reindex(store.zipcodes).to_numpy(dtype=np.float64), weights.shape)
+    with np.errstate(invalid='ignore'):
+        weights = np.where(weights > 0, weights, 0)
+
+    return pd.Series(reduce_weighted(tensor, ~np.isnan(tensor), weights)[0], index=store.years)
+
+# --------------------------------------------
+# REDUCERS
+# --------------------------------------------
+
+def reduce_mean(values: np.ndarray, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    count = mask.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(mask, values, 0).sum(axis=-1) / np.where(count > 0, count, np.nan)
+
+def reduce_weighted(values: np.ndarray, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    weights = np.where(mask, weights, 0)
+    total = weights.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weighted = (np.where(mask, values, 0) * weights).sum(axis=-1) / total
+
+    # Years without any population data fall back to the unweighted mean
+    return np.where(total > 0, weighted, reduce_mean(values, mask, weights))
+
+def reduce_median(values: np.ndarray, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # All-NaN slices give NaN without a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(np.where(mask, values, np.nan), axis=-1)
+
+def reduce_sum(values: np.ndarray, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    return np.where(mask.any(axis=-1), np.where(mask, values, 0).sum(axis=-1), np.nan)
+
+REDUCERS = {
+    'mean': reduce_mean,
+    'weighted': reduce_weighted,
+    'median': reduce_median,
+    'sum': reduce_sum,
+}
+
+# --------------------------------------------
+# AGGREGATION
+# --------------------------------------------
+
+class ZipAggregator(object):
+    def __init__(self, reducers: dict[str, str] = None, metrics: list[str] = METRICS, weight_metric: str = 'pop',
+                 rules: dict = CLEANING_RULES) -> None:
+        """
+        Aggregates zipcode-level metrics into one value per year.
+
+        Parameters:
+            reducers (dict[str, str]): Reducer name (from REDUCERS) of each metric, overriding DEFAULT_REDUCERS.
+            metrics (list[str]): Metrics to aggregate, in output column order.
+            weight_metric (str): Metric whose values weight the zipcodes for the 'weighted' reducer.
+            rules (dict): Cleaning rules of each metric, see clean.CLEANING_RULES.
+        """
+        self.metrics = metrics
+        self.reducers = {**DEFAULT_REDUCERS, **(reducers or {})}
+        self.weight_metric = weight_metric
+        self.rules = rules
+
+        for metric in metrics:
+            if self.reducers.get(metric, 'mean') not in REDUCERS:
+                raise ValueError(f"Unknown reducer '{self.reducers[metric]}' for '{metric}', expected one of {list(REDUCERS)}")
+
+    def weights(self, tensor: np.ndarray) -> np.ndarray:
+        """
+        Returns the zipcode weights of shape (..., 1, year, zipcode): the weight metric's values,
+        with missing and negative values weighing nothing.
+        """
+        values = tensor[..., self.metrics.index(self.weight_metric), :, :]
+        with np.errstate(invalid='ignore'):
+            weights = np.where(values > 0, values, 0)
+
+        return np.expand_dims(weights, axis=-3)
+
+    def reduce(self, tensor: np.ndarray) -> np.ndarray:
+        """
+        Reduce a cleaned (..., metric, year, zipcode) array to (..., metric, year).
+        """
+        mask = ~np.isnan(tensor)
+        weights = self.weights(tensor) if self.weight_metric in self.metrics else np.ones_like(tensor[..., :1, :, :])
+        result = np.empty(tensor.shape[:-1])
+
+        # One pass per reducer over every metric that uses it
+        for name, reducer in REDUCERS.items():
+            rows = [i for i, metric in enumerate(self.metrics) if self.reducers.get(metric, 'mean') == name]
+            if rows:
+                result[..., rows, :] = reducer(tensor[..., rows, :, :], mask[..., rows, :, :], weights)
+
+        return result
+
+    def aggregate(self, brt_data, quality: bool = False):
+        """
+        Clean and aggregate one system.
+
+        Parameters:
+            brt_data (BRTData): BRTData object to aggregate.
+            quality (bool): Also return the cleaning report of the system.
+
+        Returns:
+            pandas.DataFrame: One row per year and one column per metric, and if quality is set,
+            the cleaning counts indexed by (system, metric).
+        """
+        tensor, years, _ = build_tensor(brt_data, self.metrics)
+        cleaned, counts = clean_tensor(tensor, self.metrics, self.rules)
+
+        df = pd.DataFrame(self.reduce(cleaned).T, index=years, columns=self.metrics)
+        if quality:
+            return df, quality_report(counts, [brt_data.name], self.metrics)
+
+        return df
+
+    def aggregate_systems(self, brt_datas: list, quality: bool = False):
+        """
+        Clean and aggregate several systems in a single pass.
+
+        Parameters:
+            brt_datas (list[BRTData]): BRTData objects to aggregate. They must cover the same years.
+            quality (bool): Also return the cleaning report of every system.
+
+        Returns:
+            pandas.DataFrame: One row per (system, year) and one column per metric, and if quality
+            is set, the cleaning counts indexed by (system, metric).
+        """
+        built = [build_tensor(brt_data, self.metrics) for brt_data in brt_datas]
+        years = built[0][1]
+        systems = [brt_data.name for brt_data in brt_datas]
+
+        cleaned, counts = clean_tensor(stack_tensors([tensor for tensor, _, _ in built]), self.metrics, self.rules)
+        reduced = self.reduce(cleaned)
+
+        index = pd.MultiIndex.from_product([systems, years], names=['system', 'year'])
+        df = pd.DataFrame(reduced.transpose(0, 2, 1).reshape(-1, len(self.metrics)), index=index, columns=self.metrics)
+        if quality:
+            # Padding cells of systems with fewer zipcodes are not part of their data
+            report = quality_report(counts, systems, self.metrics)
+            width = cleaned.shape[-1]
+            padding = np.repeat([(width - tensor.shape[-1]) * len(years) for tensor, _, _ in built], len(self.metrics))
+            report['cells'] -= padding
+            report['missing'] -= padding
+            report['remaining'] -= padding
+            return df, report
+
+        return df
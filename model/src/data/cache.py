@@ -0,0 +1,275 @@
+"""Module to cache raw HTTP payloads on disk.
+
+The ResponseCache class stores each response body under the SHA-256 hash of its URL in
+`data/cache/http/`, next to a small JSON metadata file with the ETag, Last-Modified and
+access time of the entry. Payloads that compress well (e.g. Census JSON) are stored
+gzipped; payloads that do not (e.g. APTA zip archives) are stored as-is so they can be
+read straight from disk.
+
+Large payloads can be opened as files with ResponseCache.open, which reads them straight
+from the cache directory instead of loading them into memory.
+
+Stale entries are revalidated with conditional requests, the least recently used entries
+are evicted once the cache grows past its size cap, and an offline mode serves only
+cached payloads, raising CacheMiss for anything else.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from typing import BinaryIO, Callable
+
+import requests
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a URL is not in the cache."""
+
+
+class ResponseCache(object):
+    def __init__(self, cache_dir: str = None, max_bytes: int = 2 * 1024 ** 3,
+                 max_age: float = None, offline: bool = False) -> None:
+        """
+        Persistent, size-capped cache of HTTP response bodies keyed by URL.
+
+        Parameters:
+            cache_dir (str): Directory to store entries in. Defaults to `data/cache/http/`.
+            max_bytes (int): Maximum total size of stored payloads before LRU eviction.
+            max_age (float): Age in seconds after which an entry is revalidated with the server.
+                Defaults to None, meaning cached entries never go stale.
+            offline (bool): If True, never touch the network and raise CacheMiss on a miss.
+        """
+        if cache_dir is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            cache_dir = os.path.abspath(os.path.join(script_dir, "../../data/cache/http"))
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+
+        self.lock = threading.Lock()
+        self.index = None
+
+        # Bytes downloaded and requests served from disk, for tracing (see tracing.py)
+        self.bytes_fetched = 0
+        self.hits = 0
+
+    def __getstate__(self) -> dict:
+        # Locks can't be pickled; each process rebuilds its own lock and index
+        state = self.__dict__.copy()
+        state['lock'] = None
+        state['index'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    # --------------------------------------------
+    # HELPER FUNCTIONS
+    # --------------------------------------------
+
+    def key(self, url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def payload_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.bin')
+
+    def meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def read_meta(self, key: str) -> dict:
+        try:
+            with open(self.meta_path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write_file(self, path: str, data) -> None:
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        mode = 'wb' if isinstance(data, bytes) else 'w'
+
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load_index(self) -> dict:
+        """
+        Returns a mapping of cache keys to (size, last accessed) tuples, reading the
+        metadata files on first use.
+        """
+        if self.index is None:
+            self.index = {}
+            filenames = os.listdir(self.cache_dir) if os.path.exists(self.cache_dir) else []
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    meta = self.read_meta(filename[:-5])
+                    if meta:
+                        self.index[filename[:-5]] = (meta['size'], meta['accessed'])
+
+        return self.index
+
+    def touch(self, key: str, meta: dict) -> None:
+        meta['accessed'] = time.time()
+        self.write_file(self.meta_path(key), json.dumps(meta))
+
+        with self.lock:
+            self.load_index()[key] = (meta['size'], meta['accessed'])
+
+    def usable(self, key: str, meta: dict) -> bool:
+        """
+        Returns True if an entry can be served without contacting the server.
+        """
+        if not meta or not os.path.exists(self.payload_path(key)):
+            return False
+
+        return self.offline or self.max_age is None or time.time() - meta['fetched'] < self.max_age
+
+    def read_payload(self, key: str, meta: dict) -> bytes:
+        with open(self.payload_path(key), 'rb') as f:
+            data = f.read()
+
+        return gzip.decompress(data) if meta['encoding'] == 'gzip' else data
+
+    def store(self, url: str, response: requests.Response) -> dict:
+        """
+        Store a response body and its validators, then evict entries over the size cap.
+        """
+        key = self.key(url)
+        content = response.content
+
+        # Only keep the compressed payload if it actually saves space
+        compressed = gzip.compress(content, compresslevel=6)
+        encoding = 'gzip' if len(compressed) < 0.9 * len(content) else 'identity'
+        data = compressed if encoding == 'gzip' else content
+
+        # Created on first write so that read-only users don't leave an empty cache behind
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        now = time.time()
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': encoding,
+            'size': len(data),
+            'fetched': now,
+            'accessed': now,
+        }
+
+        self.write_file(self.payload_path(key), data)
+        self.write_file(self.meta_path(key), json.dumps(meta))
+
+        with self.lock:
+            self.load_index()[key] = (meta['size'], now)
+            self.evict()
+
+        return meta
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in max_bytes. Must be called
+        with the lock held.
+        """
+        total = sum(size for size, _ in self.index.values())
+        if total <= self.max_bytes:
+            return
+
+        for key, (size, _) in sorted(self.index.items(), key=lambda item: item[1][1]):
+            for path in (self.payload_path(key), self.meta_path(key)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            del self.index[key]
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # --------------------------------------------
+    # CACHE FUNCTIONS
+    # --------------------------------------------
+
+    def get(self, url: str, fetch: Callable[..., requests.Response]) -> bytes:
+        """
+        Returns the body of a URL from the cache, fetching (or revalidating) it if needed.
+
+        Parameters:
+            url (str): The URL to return the body of.
+            fetch (Callable): Function taking a URL and a dict of request headers, and
+                returning a requests.Response. Only called on a miss or a stale entry.
+
+        Returns:
+            bytes: The response body.
+        """
+        key = self.key(url)
+        meta = self.read_meta(key)
+
+        if self.usable(key, meta):
+            self.touch(key, meta)
+            with self.lock:
+                self.hits += 1
+            return self.read_payload(key, meta)
+        if not os.path.exists(self.payload_path(key)):
+            meta = None
+
+        if self.offline:
+            raise CacheMiss(f"'{url}' is not cached and the cache is in offline mode")
+
+        # Revalidate stale entries with a conditional request
+        headers = {}
+        if meta and meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        response = fetch(url, headers)
+        with self.lock:
+            self.bytes_fetched += len(response.content)
+
+        if response.status_code == 304 and meta:
+            meta['fetched'] = time.time()
+            self.touch(key, meta)
+            return self.read_payload(key, meta)
+
+        # Don't cache errors, but hand them back to the caller like an uncached request would
+        if response.status_code == 200 and response.content:
+            self.store(url, response)
+
+        return response.content
+
+    def open(self, url: str, fetch: Callable[..., requests.Response]) -> BinaryIO:
+        """
+        Returns a readable, seekable file object for the body of a URL, fetching it into the
+        cache first if needed. Uncompressed entries are read directly from disk.
+
+        Parameters:
+            url (str): The URL to return the body of.
+            fetch (Callable): See ResponseCache.get.
+
+        Returns:
+            BinaryIO: A binary file object positioned at the start of the body.
+        """
+        key = self.key(url)
+        meta = self.read_meta(key)
+
+        if self.usable(key, meta):
+            self.touch(key, meta)
+            with self.lock:
+                self.hits += 1
+        else:
+            content = self.get(url, fetch)
+            meta = self.read_meta(key)
+
+            # Responses that were not cached (e.g. errors) are served from memory
+            if meta is None:
+                return BytesIO(content)
+
+        if meta['encoding'] == 'gzip':
+            return gzip.open(self.payload_path(key), 'rb')
+        return open(self.payload_path(key), 'rb')
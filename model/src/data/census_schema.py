@@ -0,0 +1,162 @@
+"""Module describing which Census variables make up each BRTData metric.
+
+Each entry of CENSUS_TABLES maps a Census table to its URL template and to the variable
+name of every metric it provides. Variable names can change between vintages, so each
+metric lists (first year, variable name, legacy index) tuples; the entry with the latest
+first year not after the requested year applies. The legacy index is the column position
+that was hard-coded before the resolver existed (found with the search loops in
+exploratory_analysis.ipynb) and is only used to cross-check the resolved position, or
+as a fallback when a response has no header for the variable.
+
+The ColumnResolver reads the header row of a response once per (table, year) and caches
+the resulting metric -> column index mapping, until the table's spec changes.
+"""
+
+import hashlib
+import json
+import warnings
+
+import numpy as np
+
+CENSUS_TABLES = {
+    'S1901': {
+        'url': 'https://data.census.gov/api/access/data/table?g={geo}&id=ACSST5Y{year}.S1901',
+        'fields': {
+            'income': [('2013', 'S1901_C01_012E', 161)],
+        },
+    },
+    'S0101': {
+        'url': 'https://data.census.gov/api/access/data/table?g={geo}&id=ACSST5Y{year}.S0101',
+        'fields': {
+            'age': [('2013', 'S0101_C01_030E', 140), ('2017', 'S0101_C01_032E', 111)],
+            'pop': [('2013', 'S0101_C01_001E', 270), ('2017', 'S0101_C01_001E', 277)],
+        },
+    },
+    'S2501': {
+        'url': 'https://data.census.gov/api/access/data/table?id=ACSST5Y{year}.S2501&g={geo}',
+        'fields': {
+            'house_married': [('2013', 'S2501_C01_010E', 31), ('2017', 'S2501_C02_010E', 863)],
+            'house_nonfam': [('2013', 'S2501_C01_022E', 11), ('2017', 'S2501_C02_022E', 346)],
+            'house_m_single': [('2013', 'S2501_C01_014E', 174), ('2017', 'S2501_C02_014E', 877)],
+            'house_f_single': [('2013', 'S2501_C01_018E', 118), ('2017', 'S2501_C02_018E', 13)],
+        },
+    },
+    'S0802': {
+        'url': 'https://data.census.gov/api/access/data/table?g={geo}&id=ACSST5Y{year}.S0802',
+        'fields': {
+            'car': [('2013', 'S0802_C04_057E', 114)],
+        },
+    },
+    'ZBP': {
+        'url': 'https://data.census.gov/api/access/data/table?id=ZBP{year}.CB{year_short}00ZBP&g={geo}',
+        # data for this table only until 2018
+        'last_year': '2018',
+        'fields': {
+            'biz': [('2013', 'ESTAB', 15)],
+        },
+    },
+}
+
+# Every metric of CENSUS_TABLES, in the column order of the processed tables
+METRICS = ['income', 'pop', 'age', 'house_married', 'house_nonfam', 'house_m_single', 'house_f_single', 'car', 'biz']
+
+
+def spec_hash(table: str) -> str:
+    """
+    Returns a hash of the URL and variables of a Census table, which changes whenever they do.
+    """
+    return hashlib.sha256(json.dumps(CENSUS_TABLES[table], sort_keys=True).encode()).hexdigest()[:16]
+
+
+def field_for_year(versions: list, year: str) -> tuple:
+    """
+    Returns the (variable name, legacy index) of a metric that applies to a given year.
+
+    Parameters:
+        versions (list): (first year, variable name, legacy index) tuples, sorted by first year.
+        year (str): The year to look up.
+
+    Returns:
+        tuple: The variable name and legacy index that apply to the year.
+    """
+    applicable = [(variable, index) for first_year, variable, index in versions if first_year <= year]
+    if not applicable:
+        raise ValueError(f"No Census variable defined for year {year}")
+
+    return applicable[-1]
+
+
+class ColumnResolver(object):
+    def __init__(self) -> None:
+        # (table, year, spec hash) -> (header, {metric: column index})
+        self.mappings = {}
+
+    def resolve(self, table: str, year: str, header: list) -> dict:
+        """
+        Returns the column index of every metric of a Census table for a given year.
+
+        Parameters:
+            table (str): The key of the table in CENSUS_TABLES.
+            year (str): The year of the response.
+            header (list): The header row (row 0) of the response data.
+
+        Returns:
+            dict: A mapping of metric names to column indexes.
+        """
+        key = (table, year, spec_hash(table))
+        cached = self.mappings.get(key)
+        if cached and cached[0] == header:
+            return cached[1]
+
+        positions = {variable: i for i, variable in enumerate(header)}
+        indexes = {}
+
+        for metric, versions in CENSUS_TABLES[table]['fields'].items():
+            variable, legacy_index = field_for_year(versions, year)
+
+            if variable not in positions:
+                warnings.warn(f"{table} {year}: variable '{variable}' not in response header, "
+                              f"falling back to column {legacy_index} for '{metric}'")
+                indexes[metric] = legacy_index
+                continue
+
+            if positions[variable] != legacy_index:
+                warnings.warn(f"{table} {year}: variable '{variable}' for '{metric}' is at column "
+                              f"{positions[variable]}, previously hard-coded as {legacy_index}")
+
+            indexes[metric] = positions[variable]
+
+        # Only the first header seen for a (table, year) is cached, others are resolved on the fly
+        if not cached:
+            self.mappings[key] = (header, indexes)
+
+        return indexes
+
+    def extract(self, table: str, year: str, responses: dict) -> tuple:
+        """
+        Extracts every metric of a Census table for many zipcodes in one pass.
+
+        Parameters:
+            table (str): The key of the table in CENSUS_TABLES.
+            year (str): The year of the responses.
+            responses (dict): A mapping of zipcodes to single-zipcode JSON responses (or None).
+
+        Returns:
+            tuple: The list of zipcodes with a response, and a mapping of metric names to
+            arrays of values in the same order as the zipcodes.
+        """
+        zipcodes = [zipcode for zipcode, res in responses.items() if res]
+        if not zipcodes:
+            return [], {}
+
+        header = responses[zipcodes[0]]['response']['data'][0]
+        indexes = self.resolve(table, year, header)
+
+        rows = np.array([responses[zipcode]['response']['data'][1] for zipcode in zipcodes], dtype=object)
+        columns = rows[:, list(indexes.values())]
+
+        return zipcodes, {metric: columns[:, i] for i, metric in enumerate(indexes)}
+
+
+# Shared by all BRTData objects so each (table, year) header is only resolved once
+column_resolver = ColumnResolver()
@@ -0,0 +1,194 @@
+"""Module with the declarative data-quality rules applied before aggregation.
+
+Census rules (CLEANING_RULES) apply per cell to (..., metric, year, zipcode) arrays, so one
+call can clean a single system or every system stacked together (see aggregate.stack_tensors):
+
+- Census annotation sentinels (SENTINELS, e.g. -666666666 for "estimate not available") and
+  any other negative value are masked as NaN.
+- Zeros are kept, masked as missing (a median income or age of 0 is not a value), or mark
+  the zipcode as empty for that year (a population of 0), which masks every metric of the
+  zipcode in that year.
+- Missing cells are then imputed along the years of each zipcode: 'interpolate' fills gaps
+  between two known years linearly, 'fill' also extends the first/last known value to the
+  edges, 'none' leaves them missing.
+
+NTD rules (SCALE_RULES) rescale values reported in the wrong unit: a value that deviates from
+its system's mean by more than one standard deviation is multiplied by the rule's factor.
+
+Both report what they changed, which preprocess.main collects into a per-system quality report.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Census annotation values reported in place of an estimate
+SENTINELS = [-999999999, -888888888, -666666666, -555555555, -333333333, -222222222]
+
+CLEANING_RULES = {
+    'income': {'zero': 'missing', 'impute': 'interpolate'},
+    'pop': {'zero': 'empty', 'impute': 'interpolate'},
+    'age': {'zero': 'missing', 'impute': 'interpolate'},
+    'house_married': {'zero': 'keep', 'impute': 'interpolate'},
+    'house_nonfam': {'zero': 'keep', 'impute': 'interpolate'},
+    'house_m_single': {'zero': 'keep', 'impute': 'interpolate'},
+    'house_f_single': {'zero': 'keep', 'impute': 'interpolate'},
+    'car': {'zero': 'keep', 'impute': 'interpolate'},
+    # Business patterns stop in 2018, extending them would invent two years of data
+    'biz': {'zero': 'keep', 'impute': 'none'},
+}
+
+SCALE_RULES = [
+    {
+        'columns': ['unlinked_passenger_trips', 'vehicle_revenue_miles'],
+        'factor': 1000,
+        # Systems whose values vary for other reasons than units
+        'exempt': ['aspen_westcliffe_glenwood_springs', 'hartford', 'richmond'],
+        # Systems whose values are only in the wrong unit up to a given year
+        'until_year': {'cleveland': 2014, 'orlando': 2014},
+    },
+]
+
+QUALITY_COLUMNS = ['cells', 'missing', 'sentinel', 'negative', 'zero', 'empty', 'imputed', 'remaining', 'rescaled']
+
+# --------------------------------------------
+# IMPUTATION
+# --------------------------------------------
+
+def impute_years(values: np.ndarray, edges: bool = False) -> np.ndarray:
+    """
+    Linearly interpolate missing values along the year axis (-2) of an array.
+
+    Parameters:
+        values (numpy.ndarray): Array of shape (..., year, zipcode).
+        edges (bool): Also fill leading and trailing gaps with the nearest known value.
+
+    Returns:
+        numpy.ndarray: A copy of the array with the gaps filled.
+    """
+    n = values.shape[-2]
+    years = np.arange(n).reshape(n, 1)
+    known = ~np.isnan(values)
+
+    # Position of the closest known year before/after each cell (-1/n if there is none)
+    before = np.maximum.accumulate(np.where(known, years, -1), axis=-2)
+    after = np.flip(np.minimum.accumulate(np.flip(np.where(known, years, n), axis=-2), axis=-2), axis=-2)
+
+    before_values = np.take_along_axis(values, np.clip(before, 0, n - 1), axis=-2)
+    after_values = np.take_along_axis(values, np.clip(after, 0, n - 1), axis=-2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interpolated = before_values + (after_values - before_values) * (years - before) / (after - before)
+
+    result = np.where(~known & (before >= 0) & (after < n), interpolated, values)
+
+    if edges:
+        result = np.where(~known & (before < 0) & (after < n), after_values, result)
+        result = np.where(~known & (before >= 0) & (after == n), before_values, result)
+
+    return result
+
+IMPUTERS = {
+    'none': lambda values: values,
+    'interpolate': lambda values: impute_years(values),
+    'fill': lambda values: impute_years(values, edges=True),
+}
+
+# --------------------------------------------
+# CLEANING FUNCTIONS
+# --------------------------------------------
+
+def clean_tensor(tensor: np.ndarray, metrics: list[str], rules: dict = CLEANING_RULES) -> tuple:
+    """
+    Apply the cleaning rules to a (..., metric, year, zipcode) array.
+
+    Parameters:
+        tensor (numpy.ndarray): Raw values, NaN where missing.
+        metrics (list[str]): The metric of each index of the metric axis.
+        rules (dict): Cleaning rules of each metric. Metrics without rules are only sentinel-masked.
+
+    Returns:
+        tuple: The cleaned array, and a dict of QUALITY_COLUMNS -> cell counts of shape (..., metric).
+    """
+    rules = [rules.get(metric, {}) for metric in metrics]
+    zero_rule = np.array([rule.get('zero', 'keep') for rule in rules]).reshape(-1, 1, 1)
+    counts = {}
+
+    def count(mask):
+        return mask.sum(axis=(-2, -1))
+
+    missing = np.isnan(tensor)
+    with np.errstate(invalid='ignore'):
+        sentinel = np.isin(tensor, SENTINELS)
+        negative = (tensor < 0) & ~sentinel
+        zero = tensor == 0
+
+    # A zipcode whose population is 0 in a year has no data for any metric that year
+    empty = (zero & (zero_rule == 'empty')).any(axis=-3, keepdims=True) & ~missing
+
+    zero_missing = zero & (zero_rule == 'missing')
+
+    counts['cells'] = np.broadcast_to(np.prod(tensor.shape[-2:]), tensor.shape[:-2])
+    counts['missing'] = count(missing)
+    counts['sentinel'] = count(sentinel)
+    counts['negative'] = count(negative)
+    counts['zero'] = count(zero_missing)
+    counts['empty'] = count(empty & ~sentinel & ~negative & ~zero_missing)
+
+    cleaned = np.where(sentinel | negative | zero_missing | empty, np.nan, tensor)
+
+    # Imputed per metric, each imputer over every metric that uses it at once
+    gaps = np.isnan(cleaned)
+    for name, imputer in IMPUTERS.items():
+        rows = [i for i, rule in enumerate(rules) if rule.get('impute', 'none') == name]
+        if rows and name != 'none':
+            cleaned[..., rows, :, :] = imputer(cleaned[..., rows, :, :])
+
+    remaining = np.isnan(cleaned)
+    counts['imputed'] = count(gaps & ~remaining)
+    counts['remaining'] = count(remaining)
+
+    return cleaned, counts
+
+def apply_scale_rules(df: pd.DataFrame, rules: list[dict] = SCALE_RULES) -> tuple:
+    """
+    Rescale values reported in the wrong unit.
+
+    Parameters:
+        df (pandas.DataFrame): Values indexed by (system, year).
+        rules (list[dict]): Rules to apply, see SCALE_RULES.
+
+    Returns:
+        tuple: The rescaled DataFrame, and a Series of the number of rescaled values indexed by (system, column).
+    """
+    df = df.copy()
+    system = df.index.get_level_values('system')
+    year = df.index.get_level_values('year')
+    rescaled = {}
+
+    for rule in rules:
+        until = pd.Series(rule.get('until_year', {}), dtype=float).reindex(system).to_numpy()
+        applies = ~system.isin(rule.get('exempt', [])) & ~(year > until)
+
+        for col in rule['columns']:
+            grouped = df.groupby(level='system')[col]
+            off = (abs(grouped.transform('mean') - df[col]) > grouped.transform('std')) & applies
+
+            df.loc[off, col] *= rule['factor']
+            for name, n in off.groupby(level='system').sum().items():
+                rescaled[(name, col)] = rescaled.get((name, col), 0) + int(n)
+
+    return df, pd.Series(rescaled, dtype=int).rename_axis(['system', 'metric'])
+
+def quality_report(counts: dict, systems: list[str], metrics: list[str]) -> pd.DataFrame:
+    """
+    Returns the counts of clean_tensor as a DataFrame indexed by (system, metric).
+
+    Parameters:
+        counts (dict): Counts of shape (system, metric), or (metric,) for a single system.
+        systems (list[str]): The system of each index of the system axis.
+        metrics (list[str]): The metric of each index of the metric axis.
+    """
+    index = pd.MultiIndex.from_product([systems, metrics], names=['system', 'metric'])
+    report = pd.DataFrame({name: np.reshape(values, -1) for name, values in counts.items()}, index=index)
+
+    return report.reindex(columns=QUALITY_COLUMNS, fill_value=0)
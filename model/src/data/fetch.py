@@ -0,0 +1,184 @@
+"""Module to fetch Census API data concurrently.
+
+The CensusFetcher class runs a bounded number of requests at once over a pooled
+requests.Session. A token bucket shared by all worker threads replaces fixed sleeps
+between years, and failed requests are retried with exponential backoff.
+
+A single CensusFetcher can (and should) be shared between BRTData objects so that
+every system draws from the same rate limit. Responses go through a ResponseCache
+(defined in cache.py), so re-running the pipeline does not download them again.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import ResponseCache
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        """
+        Thread-safe token bucket rate limiter.
+
+        Parameters:
+            rate (float): Tokens added per second.
+            capacity (int): Maximum number of tokens that can accumulate (burst size).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Block until a token is available and consume it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class CensusFetcher(object):
+    def __init__(self, max_workers: int = 8, rate: float = 5.0, burst: int = 5,
+                 retries: int = 4, backoff: float = 1.0, timeout: float = 60.0,
+                 cache: ResponseCache = None) -> None:
+        """
+        Concurrent, rate-limited fetcher for JSON API endpoints.
+
+        Parameters:
+            max_workers (int): Maximum number of requests in flight at once.
+            rate (float): Maximum sustained requests per second.
+            burst (int): Maximum number of requests that can be sent back to back.
+            retries (int): Number of retries for failed requests.
+            backoff (float): Base delay in seconds, doubled after each failed attempt.
+            timeout (float): Timeout in seconds for a single request.
+            cache (ResponseCache): Cache for response bodies. Defaults to a ResponseCache in
+                `data/cache/http/`.
+        """
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate, burst)
+        self.cache = cache if cache is not None else ResponseCache()
+
+        # Pool one connection per worker so requests to the same host reuse sockets
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # --------------------------------------------
+    # HELPER FUNCTIONS
+    # --------------------------------------------
+
+    def _get(self, url: str, headers: dict = None) -> requests.Response:
+        """
+        Perform a rate-limited GET request, retrying connection errors and retryable
+        status codes with exponential backoff.
+        """
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            delay = self.backoff * 2 ** attempt
+
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                return response
+
+            # Respect the server's Retry-After header if it asks for a longer wait
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+
+    # --------------------------------------------
+    # FETCH FUNCTIONS
+    # --------------------------------------------
+
+    def fetch(self, url: str) -> dict:
+        """
+        Fetches data from an API endpoint and returns the response in JSON format.
+
+        Parameters:
+            url (str): The URL of the API endpoint to fetch data from.
+
+        Returns:
+            dict: A dictionary containing the JSON response from the API endpoint, or None
+            if the response is empty.
+        """
+        content = self.cache.get(url, self._get)
+
+        # check if response is empty or not in JSON format
+        if not content:
+            return None
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError("API response is not in valid JSON format") from e
+
+    def fetch_many(self, urls: dict) -> dict:
+        """
+        Fetches many API endpoints concurrently.
+
+        Parameters:
+            urls (dict): A mapping of arbitrary keys to URLs.
+
+        Returns:
+            dict: A mapping of the same keys to the JSON responses (or None if empty).
+        """
+        keys = list(urls)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(self.fetch, [urls[key] for key in keys])
+            return dict(zip(keys, results))
+
+    def fetch_iter(self, urls: dict):
+        """
+        Fetches many API endpoints concurrently, yielding each response as soon as it arrives.
+
+        Parameters:
+            urls (dict): A mapping of arbitrary keys to URLs.
+
+        Yields:
+            tuple: (key, JSON response or None if empty), in completion order.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {executor.submit(self.fetch, url): key for key, url in urls.items()}
+
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Do not send the remaining requests if the caller stopped early or failed
+            executor.shutdown(cancel_futures=True)
+
+    def close(self) -> None:
+        """
+        Close the underlying connection pool.
+        """
+        self.session.close()
@@ -0,0 +1,270 @@
+"""Module to keep track of Census downloads cell by cell.
+
+The DownloadJournal is a SQLite database (`data/cache/journal.sqlite` by default) with one
+row per (system, table, year, zipcode) cell. A cell is marked done, with the URL of the
+response holding it, as soon as its request completes, so a download that is interrupted
+resumes where it stopped: cells that are done are never requested again. The journal only
+records which cells are done, not their values: those are extracted again from the cached
+responses (see cache.py) every time a table is saved, so a change to the variables of a
+table (see census_schema.py) applies to cells downloaded before it.
+
+Cells are recorded with a hash of their table's spec: when the spec changes, the cells of
+the old spec are forgotten and fetched again (from the response cache if their URL did not
+change). Cells whose response held no data are marked missing and are retried by the next
+run.
+
+Cells are also the unit of work shared between workers: a worker claims pending cells in a
+transaction, so several processes running make_dataset.py at once never request the same
+cell twice. Claims expire after a lease, so the cells of a worker that crashed are picked
+up by the others.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# spec is the hash of the table's spec the cell was added for, url the request its response answers
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    system TEXT NOT NULL,
+    census_table TEXT NOT NULL,
+    year TEXT NOT NULL,
+    zipcode TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    url TEXT,
+    PRIMARY KEY (system, census_table, year, zipcode)
+)
+"""
+
+# Version of SCHEMA, stored as the database's user_version
+SCHEMA_VERSION = 2
+
+# Number of cells of each system by status, see DownloadJournal.counts
+COUNTS_QUERY = 'SELECT system, status, COUNT(*) FROM cells GROUP BY system, status'
+
+PENDING, CLAIMED, DONE, MISSING = 'pending', 'claimed', 'done', 'missing'
+
+
+class DownloadJournal(object):
+    def __init__(self, path: str = None, lease: float = 600.0) -> None:
+        """
+        Parameters:
+            path (str): Path of the SQLite database. Defaults to `data/cache/journal.sqlite`.
+            lease (float): Seconds after which cells claimed by a worker that did not complete
+                them can be claimed again.
+        """
+        if path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            path = os.path.abspath(os.path.join(script_dir, "../../data/cache/journal.sqlite"))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.lease = lease
+        self.worker = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.lock = threading.Lock()
+
+        # Transactions are managed explicitly, and writers wait for each other instead of failing
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.create()
+
+    # --------------------------------------------
+    # HELPER FUNCTIONS
+    # --------------------------------------------
+
+    def write(self, sql: str, rows: list[tuple]) -> int:
+        """
+        Run a statement for many rows in one write transaction.
+
+        Returns:
+            int: The number of rows changed.
+        """
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.executemany(sql, rows)
+                changed = cursor.rowcount
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+        return changed
+
+    def read(self, sql: str, params: tuple) -> list[tuple]:
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def create(self) -> None:
+        """
+        Create the cells table, replacing one of an older schema. Its cells are lost, but their
+        responses are still in the response cache, so fetching them again is cheap.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if cursor.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                cursor.execute('DROP TABLE IF EXISTS cells')
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            cursor.execute(SCHEMA)
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+
+    # --------------------------------------------
+    # JOURNAL FUNCTIONS
+    # --------------------------------------------
+
+    def add(self, system: str, table: str, spec: str, years: list[str], zipcodes: list[str]) -> None:
+        """
+        Add the cells of a table that are not in the journal yet, as pending. Cells added for
+        another spec of the table are forgotten, and cells that had no data are retried.
+
+        Parameters:
+            system (str): The system of the cells.
+            table (str): The Census table of the cells.
+            spec (str): Hash of the table's spec, see census_schema.spec_hash.
+            years (list[str]): The years of the cells.
+            zipcodes (list[str]): The zipcodes of the cells.
+        """
+        self.write('DELETE FROM cells WHERE system = ? AND census_table = ? AND spec != ?', [(system, table, spec)])
+        self.write(
+            'UPDATE cells SET status = ? WHERE system = ? AND census_table = ? AND status = ?',
+            [(PENDING, system, table, MISSING)]
+        )
+        self.write(
+            'INSERT OR IGNORE INTO cells (system, census_table, year, zipcode, spec) VALUES (?, ?, ?, ?, ?)',
+            [(system, table, year, zipcode, spec) for year in years for zipcode in zipcodes]
+        )
+
+    def claim(self, system: str, table: str, batch_size: int, batches: int) -> list[tuple]:
+        """
+        Claim pending (or expired) cells of a table for this worker.
+
+        Parameters:
+            system (str): The system of the cells.
+            table (str): The Census table of the cells.
+            batch_size (int): Maximum number of zipcodes per batch.
+            batches (int): Maximum number of batches to claim.
+
+        Returns:
+            list[tuple]: (year, zipcodes) batches of claimed cells, each of a single year.
+        """
+        now = time.time()
+        claimable = '(status = ? OR (status = ? AND claimed_at < ?))'
+        claimable_params = (PENDING, CLAIMED, now - self.lease)
+
+        # Selecting and claiming in one write transaction keeps other workers from claiming the same cells
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                rows = cursor.execute(
+                    f'SELECT year, zipcode FROM cells WHERE system = ? AND census_table = ? AND {claimable} '
+                    'ORDER BY year, zipcode LIMIT ?',
+                    (system, table) + claimable_params + (batch_size * batches,)
+                ).fetchall()
+
+                cursor.executemany(
+                    'UPDATE cells SET status = ?, worker = ?, claimed_at = ? '
+                    'WHERE system = ? AND census_table = ? AND year = ? AND zipcode = ?',
+                    [(CLAIMED, self.worker, now, system, table, year, zipcode) for year, zipcode in rows]
+                )
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+        by_year = {}
+        for year, zipcode in rows:
+            by_year.setdefault(year, []).append(zipcode)
+
+        return [
+            (year, zipcodes[i:i + batch_size])
+            for year, zipcodes in by_year.items()
+            for i in range(0, len(zipcodes), batch_size)
+        ]
+
+    def complete(self, system: str, table: str, year: str, urls: dict) -> None:
+        """
+        Record cells that were just downloaded.
+
+        Parameters:
+            system (str): The system of the cells.
+            table (str): The Census table of the cells.
+            year (str): The year of the cells.
+            urls (dict): A mapping of zipcodes to the URL of the response holding their data,
+                or to None if the response had no data for the zipcode.
+        """
+        self.write(
+            'UPDATE cells SET status = ?, worker = NULL, claimed_at = NULL, url = ? '
+            'WHERE system = ? AND census_table = ? AND year = ? AND zipcode = ?',
+            [(MISSING if url is None else DONE, url, system, table, year, zipcode) for zipcode, url in urls.items()]
+        )
+
+    def release(self, system: str, table: str) -> None:
+        """
+        Give back the cells of a table claimed by this worker that it did not complete.
+        """
+        self.write(
+            'UPDATE cells SET status = ?, worker = NULL, claimed_at = NULL '
+            'WHERE system = ? AND census_table = ? AND status = ? AND worker = ?',
+            [(PENDING, system, table, CLAIMED, self.worker)]
+        )
+
+    def remaining(self, system: str, table: str) -> int:
+        """
+        Returns the number of cells of a table that were not downloaded yet, claimed or not.
+        """
+        return self.read(
+            'SELECT COUNT(*) FROM cells WHERE system = ? AND census_table = ? AND status IN (?, ?)',
+            (system, table, PENDING, CLAIMED)
+        )[0][0]
+
+    def counts(self) -> dict:
+        """
+        Returns the number of cells of each system by status.
+
+        Returns:
+            dict: A mapping of systems to {status: count} dicts.
+        """
+        counts = {}
+        for system, status, count in self.read(COUNTS_QUERY, ()):
+            counts.setdefault(system, {})[status] = count
+
+        return counts
+
+    def urls(self, system: str, table: str) -> dict:
+        """
+        Returns the URLs of the responses holding the completed cells of a table.
+
+        Returns:
+            dict: A mapping of (year, zipcode) tuples to URLs. Cells without data are left out.
+        """
+        rows = self.read(
+            'SELECT year, zipcode, url FROM cells WHERE system = ? AND census_table = ? AND status = ?',
+            (system, table, DONE)
+        )
+
+        return {(year, zipcode): url for year, zipcode, url in rows}
+
+    def reset(self, system: str = None) -> None:
+        """
+        Forget the cells of a system (or of every system), so they are downloaded again.
+        """
+        if system is None:
+            self.write('DELETE FROM cells', [()])
+        else:
+            self.write('DELETE FROM cells WHERE system = ?', [(system,)])
+
+    def close(self) -> None:
+        self.connection.close()
@@ -7,12 +7,40 @@ directory under subdirectories for each BRT system.
 A non-BRT-specific subdirectory will also be populated for BRT ridership statistics
 taken from the National Transit Database.
 
+The systems and their zipcodes are listed in registry.SYSTEMS.
+
+If the WALKSCORE_API_KEY environment variable is set, the Walk Score of each zipcode centroid
+is fetched too (see walkability.py) and preprocess.py adds a population-weighted `walkscore`
+column to the processed data of the system. Without a Gazetteer file (see zcta.py), Walk
+Scores are skipped with a warning and the rest of the data is fetched as usual. If the API
+rejects a request, e.g. once the daily quota is used up, the scores fetched so far are saved
+and the remaining systems are fetched without Walk Scores.
+
 This module utilises the BRTData and NTDData classes and their respective functions
-(defined in transit_data.py).
+(defined in transit_data.py). All BRT systems share a single CensusFetcher (defined in
+fetch.py), so Census requests run concurrently under one rate limit, and zipcodes are
+requested in batches of BATCH_SIZE per Census API call.
+
+Census and NTD payloads are cached on disk (see cache.py), so re-running this module only
+downloads what is missing. With offline=True, nothing is downloaded and any payload that
+is not cached raises CacheMiss.
+
+Census downloads are recorded cell by cell in a DownloadJournal (see journal.py): an
+interrupted run resumes with the cells that are still missing, and several processes running
+this module at once split the remaining cells between them instead of requesting them twice.
 """
 
 import os
+import sys
+from cache import ResponseCache
+from fetch import CensusFetcher
+from journal import DownloadJournal
+from registry import LOCATIONS, zipcodes
 from transit_data import BRTData, NTDData
+from walkability import WalkScoreClient, WalkScoreError
+
+# Number of zipcodes per Census API request
+BATCH_SIZE = 50
 
 def save_brt_data(brt_data: BRTData):
     print('Data retrieval starting for:', brt_data.name)
@@ -33,29 +61,52 @@ def save_brt_data(brt_data: BRTData):
     brt_data.save_num_businesses()
     print('Businesses CSV created.')
 
-def main():
-    brt_data = {
-        'cleveland': ['44112', '44104', '44103', '44106', '44114'],
-        'houston': ['77056', '77027', '77024', '77055'],
-        'kansas': ['64106', '64108', '64109', '64110', '64111', '64112', '64113', '64131'],
-        'richmond': ["23220", "23221", "23223", "23224", "23226"],
-        'indianapolis': ["46205", "46208", "46220", "46201", "46203", "46225", "46227"],
-        'eugene': ["97401", "97402", "97403", "97404", "97477"],
-        'albuquerque': ["87102", "87106", "87108", "87109", "87110", "87111", "87112", "87113", "87114", "87120"],
-        'aspen_westcliffe_glenwood_springs': ["81601", "81602", "81611", "81612", "81615", "81621", "81623", "81642", "81652", "81654"],
-        'fort_collins': ["80521", "80524", "80525", "80526", "80528"],
-        'hartford': ["06002", "06032", "06037", "06051", "06052", "06053", "06067", "06074", "06101", "06103", "06105", "06106", "06108", "06109", "06110", "06112", "06114", "06118", "06119", "06120", "06422"],
-        'grand_rapids': ["49301", "49306", "49315", "49316", "49321", "49341", "49345", "49348", "49401", "49404", "49418", "49426", "49428", "49464", "49468", "49503", "49504", "49505", "49506", "49507", "49508", "49509", "49512", "49519", "49525", "49534", "49544", "49546", "49548"],
-        'orlando': ["32801", "32802", "32803", "32804", "32805", "32806", "32808", "32809", "32810", "32811", "32812", "32814", "32816", "32817", "32818", "32819", "32822", "32824", "32827", "32829", "32832", "32835", "32839", "32853", "32854", "32855", "32856", "32857", "32858", "32859", "32860", "32861", "32862", "32867", "32868", "32869", "32872", "32877", "32878", "32885", "32886", "32887", "32890", "32891", "32893", "32896", "32897", "32898", "32899"],
-        'boston': ["02108", "02109", "02110", "02111", "02113", "02114", "02115", "02116", "02118", "02119", "02120", "02121", "02122", "02124", "02125", "02126", "02127", "02128", "02129", "02130", "02131", "02132", "02134", "02135", "02136", "02151", "02163", "02169", "02170", "02171", "02184", "02186", "02199", "02203", "02210", "02215", "02445", "02446"],
-        'los_angeles': ["90004", "90005", "90006", "90007", "90012", "90013", "90014", "90015", "90017", "90018", "90019", "90020", "90021", "90026", "90027", "90028", "90029", "90031", "90032", "90033", "90034", "90035", "90036", "90037", "90038", "90039", "90041", "90042", "90043", "90044", "90045", "90046", "90047", "90048", "90057", "90062", "90063", "90064", "90065", "90066", "90068", "90069", "90071", "90089", "90230", "90291", "90292", "90293", "90401", "90402", "90403", "90404", "90405", "90640", "90650", "90723", "91030", "91040", "91042", "91101", "91103", "91104", "91105", "91106", "91107", "91108", "91201", "91202", "91203", "91204", "91205", "91206", "91207", "91208", "91214", "91331", "91335", "91340", "91342", "91343", "91344", "91345", "91352", "91356", "91364", "91367", "91401", "91402", "91403", "91405", "91406", "91411", "91423", "91436", "91501", "91502", "91504", "91505", "91506", "91601", "91602", "91604", "91605", "91606", "91607"],
-    }
-
-    for system in brt_data:
-        brt = BRTData(system, brt_data[system])
+def walkscore_client(offline: bool = False) -> tuple:
+    """
+    Returns a WalkScoreClient and the ZCTAIndex of the zipcode centroids, or (None, None) if
+    Walk Scores are not fetched: offline, without an API key, or without a Gazetteer file.
+    """
+    # Walk Scores need an API key and the zipcode centroids of the Gazetteer file (see zcta.py)
+    if offline or not os.environ.get('WALKSCORE_API_KEY'):
+        return None, None
+
+    # Imported here: the index needs scipy, which nothing else of the fetch stage uses
+    from zcta import ZCTAIndex
+
+    try:
+        zcta_index = ZCTAIndex.load()
+    except FileNotFoundError as e:
+        print(f'Warning: skipping Walk Scores. {e}', file=sys.stderr)
+        return None, None
+
+    return WalkScoreClient(), zcta_index
+
+def main(offline: bool = False):
+    cache = ResponseCache(offline=offline)
+    fetcher = CensusFetcher(cache=cache)
+    journal = DownloadJournal()
+    walkscore, zcta_index = walkscore_client(offline)
+
+    for system in LOCATIONS:
+        brt = BRTData(system, zipcodes(system), fetcher, BATCH_SIZE, journal=journal)
         save_brt_data(brt)
 
-    ntd = NTDData()
+        if walkscore is not None:
+            try:
+                brt.save_walkscore(walkscore, zcta_index.centroids(brt.zipcodes))
+                print('Walk Score CSV created.')
+            except WalkScoreError as e:
+                # Scores fetched so far are saved, the rest waits for the next run
+                print(f'Warning: skipping Walk Scores from {system} on. {e}', file=sys.stderr)
+                walkscore.close()
+                walkscore = None
+
+    fetcher.close()
+    journal.close()
+    if walkscore is not None:
+        walkscore.close()
+
+    ntd = NTDData(cache)
     ntd.save_data()
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+"""Module to track which processed outputs are out of date.
+
+The BuildManifest records, in `data/manifest.json`, the content hashes that each output was
+built from:
+
+- for each `data/processed/<system>` table: the hash of the system's raw tables, of the NTD
+  tables and of the processing code, plus the hash of the output itself.
+- for `data/dataset`: the hash of each processed table whose rows it contains.
+
+preprocess.main uses it to only re-process stale systems, and process.main uses it to only
+replace the rows of systems whose processed table changed.
+"""
+
+import hashlib
+import json
+import os
+
+from storage import Storage
+
+# Source files whose changes invalidate every processed output: registry.py maps systems to
+# their NTD IDs and census_schema.py sets the column order of the processed tables
+CODE_FILES = ['preprocess.py', 'aggregate.py', 'clean.py', 'transit_data.py', 'storage.py', 'tensor_store.py',
+              'registry.py', 'census_schema.py']
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def hash_files(paths: list[str]) -> str:
+    """
+    Returns a single hash of the names and contents of several files.
+    """
+    digest = hashlib.sha256()
+
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        digest.update(hash_file(path).encode())
+
+    return digest.hexdigest()
+
+
+class BuildManifest(object):
+    def __init__(self, path: str = None, storage: Storage = None) -> None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.data_dir = os.path.abspath(os.path.join(script_dir, "../../data"))
+        self.code_paths = [os.path.join(script_dir, filename) for filename in CODE_FILES]
+
+        self.path = path or os.path.join(self.data_dir, "manifest.json")
+        self.storage = storage if storage is not None else Storage()
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {'processed': {}, 'dataset': {}}
+
+    # --------------------------------------------
+    # HELPER FUNCTIONS
+    # --------------------------------------------
+
+    def table_paths(self, directory: str) -> list[str]:
+        return [self.storage.find(os.path.join(directory, name))[1] for name in self.storage.list(directory)]
+
+    def processed_hash(self, system: str) -> str:
+        """
+        Returns the hash of a system's processed table, or None if it doesn't exist.
+        """
+        path = self.storage.find(os.path.join(self.data_dir, "processed", system))[1]
+        return hash_file(path) if path else None
+
+    def inputs(self, system: str) -> dict:
+        """
+        Returns the current hashes of everything a system's processed table is built from.
+        """
+        return {
+            'raw': hash_files(self.table_paths(os.path.join(self.data_dir, "raw", system))),
+            'ntd': hash_files(self.table_paths(os.path.join(self.data_dir, "raw", "ntd-ridership"))),
+            'code': hash_files(self.code_paths),
+        }
+
+    # --------------------------------------------
+    # MANIFEST FUNCTIONS
+    # --------------------------------------------
+
+    def stale_systems(self, systems: list[str]) -> list[str]:
+        """
+        Returns the systems whose processed table is missing, was changed since it was built,
+        or was built from different inputs or code than the current ones.
+        """
+        stale = []
+
+        for system in systems:
+            entry = self.entries['processed'].get(system)
+            output = self.processed_hash(system)
+
+            if entry is None or output is None or entry['output'] != output or entry['inputs'] != self.inputs(system):
+                stale.append(system)
+
+        return stale
+
+    def record_processed(self, system: str) -> None:
+        """
+        Record that a system's processed table was just built from the current inputs.
+        """
+        self.entries['processed'][system] = {
+            'inputs': self.inputs(system),
+            'output': self.processed_hash(system),
+        }
+
+    def changed_dataset_systems(self, systems: list[str]) -> list[str]:
+        """
+        Returns the systems whose processed table changed since their rows were added to the dataset.
+        """
+        return [
+            system for system in systems
+            if self.entries['dataset'].get(system) != self.processed_hash(system)
+        ]
+
+    def record_dataset(self, systems: list[str]) -> None:
+        """
+        Record the processed tables that the dataset was just built from. Systems that are no
+        longer part of the dataset are forgotten.
+        """
+        self.entries['dataset'] = {system: self.processed_hash(system) for system in systems}
+
+    def save(self) -> None:
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
@@ -1,115 +1,167 @@
 """
 This file processes the raw CSVs downloaded in make_dataset.py for a specific transportation system.
+
+The Census data of every system is cleaned and aggregated in one pass (see
+aggregate.ZipAggregator.aggregate_systems). Systems are independent of each other once the NTD
+data is processed, so main can also split them between worker processes: `python preprocess.py
+--workers 4`, each worker aggregating its share of the systems in one pass. The NTD tables are
+loaded and processed once in the parent process and each worker only receives the rows of its
+own systems.
+
+With --incremental, only systems whose raw data, NTD data or processing code changed since
+their last build (as recorded by manifest.BuildManifest) are processed.
+
+What cleaning changed in each system (see clean.py) is written to `data/quality_report`.
+
+Every stage is traced to TRANSIT_TRACE if it is set (see tracing.py).
 """
 
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from transit_data import BRTData, NTDData
+from registry import LOCATIONS, NTD_IDS
+from aggregate import ZipAggregator, weighted_constant
+from clean import QUALITY_COLUMNS, apply_scale_rules
+from tracing import stage
+from storage import Storage
+from manifest import BuildManifest
 import os
+import sys
+import traceback
 
 # --------------------------------------------
 # HELPER FUNCTIONS
 # --------------------------------------------
 
-def make_average(df, name) -> pd.Series:
-    series_average = df.mean(axis=1)
-    series_average.rename(name, inplace=True)
-
-    return series_average
-
-def export_csv(df, name) -> None:
+def export_csv(df, name, storage: Storage = None) -> None:
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_dir = os.path.abspath(os.path.join(script_dir, "../.."))
     data_dir = os.path.join(project_dir, "data/processed")
     
-    df.to_csv(os.path.join(data_dir, f'{name}.csv'), index=True)
+    # Written in the storage format (CSV unless TRANSIT_STORAGE says otherwise)
+    (storage or Storage()).write(df, os.path.join(data_dir, name))
 
 # --------------------------------------------
 # DATA PROCESSING FUNCTIONS
 # --------------------------------------------
 
-def process_brt_data(brt_data: BRTData) -> pd.DataFrame:
+def process_brt_data(brt_data: BRTData, aggregator: ZipAggregator = None, quality: bool = False):
     """
     Clean and process BRTData for various metrics and return a pandas DataFrame of the resulting average values.
 
     Parameters:
         brt_data (BRTData): BRTData object to process.
+        aggregator (ZipAggregator): Aggregator reducing the zipcodes of each metric. Defaults to
+            population-weighted means for medians and percentages, see aggregate.DEFAULT_REDUCERS.
+        quality (bool): Also return the cleaning report of the system.
 
     Returns:
-        pandas.Dataframe: A pandas DataFrame of the resulting average values for each metric.
+        pandas.Dataframe: A pandas DataFrame of the resulting average values for each metric, and
+        if quality is set, the cleaning counts of each metric.
     """
-    metrics = ['income', 'pop', 'age', 'house_married', 'house_nonfam', 'house_m_single', 'house_f_single', 'car', 'biz']
-    series_list = []
+    # Every metric is cleaned and reduced in one pass over a (metric, year, zipcode) array
+    with stage('preprocess.clean', brt_data.name) as record:
+        result = (aggregator or ZipAggregator()).aggregate(brt_data, quality)
+        record['rows_out'] = len(result[0] if quality else result)
 
-    for metric in metrics:
-        df = brt_data.get_data(metric)
-        
-        # Cleaning
-        df.dropna(axis=1, how='all', inplace=True) # drop cols with all NaN's
-        df = df.loc[:, ~(df < 0).any(axis=0)] # drop cols that feature any negative
-        df = df.loc[:, df.eq(0).mean() <= 0.25] # only keep cols with 25% or fewer values that are still 0
+    # Only systems whose Walk Scores were fetched get the column
+    if 'walkscore' in brt_data.tables:
+        (result[0] if quality else result)['walkscore'] = process_walkscore(brt_data)
 
-        series_average = make_average(df, metric)
-        series_list.append(series_average)
+    return result
 
-    return pd.concat(series_list, axis=1)
+def process_brt_batch(brt_datas: list[BRTData], aggregator: ZipAggregator = None) -> dict:
+    """
+    Clean and process the BRTData of many systems, like process_brt_data with quality set.
+    Systems covering the same years are cleaned and reduced together in a single pass.
 
+    Parameters:
+        brt_datas (list[BRTData]): BRTData objects to process.
+        aggregator (ZipAggregator): Aggregator reducing the zipcodes of each metric, see process_brt_data.
 
-def process_ntd_data(ntd_data: NTDData, system: str) -> pd.DataFrame:
+    Returns:
+        dict: A mapping of system names to their DataFrame of average values and their cleaning counts.
     """
-    Clean and process NTDData and return a pandas DataFrame of the resulting values for a specific system.
+    aggregator = aggregator or ZipAggregator()
+
+    groups = {}
+    for brt_data in brt_datas:
+        groups.setdefault(tuple(brt_data.get_store(aggregator.metrics).years), []).append(brt_data)
+
+    results = {}
+    for group in groups.values():
+        with stage('preprocess.clean', systems=len(group)) as record:
+            df, quality = aggregator.aggregate_systems(group, quality=True)
+            record['rows_out'] = len(df)
+
+        for brt_data in group:
+            brt_df = df.loc[brt_data.name]
+            if 'walkscore' in brt_data.tables:
+                # A new frame, not a write through the slice of the batch frame
+                brt_df = brt_df.assign(walkscore=process_walkscore(brt_data))
+
+            results[brt_data.name] = (brt_df, quality.loc[[brt_data.name]])
+
+    return results
+
+def process_walkscore(brt_data: BRTData) -> pd.Series:
+    """
+    Returns the Walk Score of a system for each year: the latest score of each zipcode, weighted
+    by the zipcode's population that year.
+    """
+    scores = brt_data.get_data('walkscore').iloc[-1]
+    scores.index = scores.index.astype(str)
+
+    return weighted_constant(brt_data, scores)
+
+
+def process_ntd_batch(ntd_data: NTDData, ids: dict[str, str] = NTD_IDS, quality: bool = False):
+    """
+    Clean and process NTDData for many systems at once and return a tidy pandas DataFrame of the
+    resulting values, indexed by (system, year).
+
+    The ID column of each year is normalized once and all systems are selected with a single
+    isin filter, so the cost scales with the size of the NTD tables rather than with the number
+    of systems.
 
     Parameters:
         ntd_data (NTDData): An object containing NTD data.
-        system (str): A string representing the transit system for which data is being processed.
-    
+        ids (dict[str, str]): A mapping of system names to their (legacy) NTD IDs.
+        quality (bool): Also return the cleaning report of every system.
+
     Return type:
-        pandas.DataFrame: A cleaned DataFrame containing summarized and filtered data for the specified system.
+        pandas.DataFrame: A cleaned DataFrame containing summarized and filtered data for every system,
+        and if quality is set, the cleaning counts indexed by (system, metric).
     """
-
-    ids = {
-        # 'brooklyn': '2008',
-        'los_angeles': '9154',
-        'boston': '1003',
-        'houston': '6008',
-        'orlando': '4035',
-        'cleveland': '5015',
-        'richmond': '3006',
-        'kansas': '7005',
-        'grand_rapids': '5033',
-        'hartford': '1048',
-        'eugene': '7',
-        'indianapolis': '5050',
-        'albuquerque': '6019',
-        'aspen_westcliffe_glenwood_springs': '8R01-013',
-        'fort_collins': '8011'
-    }
-    
     years = list(range(2013, 2021))
     cols = ['Unlinked Passenger Trips', 'Primary UZA\n Population', 'UZA Population', 'Mode VOMS', 'VOMS', 'Annual Vehicle Revenue Miles', 'Vehicle Revenue Miles']
-    res_df = pd.DataFrame(columns = cols, index = years)
+    systems = {ntd_id: system for system, ntd_id in ids.items()}
+    frames = []
 
     for year in years:
         df_raw = ntd_data.get_data(f'transit_data_{year}_filtered')
         
         if year == 2013:
             df_raw = df_raw.fillna(0)
-            df_raw['ID'] = df_raw['ID'].astype(int).astype(str)
-            filtered_df = df_raw[df_raw["ID"].astype(str) == ids[system]]
+            id_col = df_raw['ID'].astype(int).astype(str)
         elif year == 2014:
-            filtered_df = df_raw[df_raw["Legacy NTDID"].astype(str) == ids[system]]
+            id_col = df_raw["Legacy NTDID"].astype(str)
         else: 
-            filtered_df = df_raw[df_raw["Legacy NTD ID"].astype(str) == ids[system]]
-        
-        df_year = filtered_df.loc[:, filtered_df.columns.isin(cols)] 
+            id_col = df_raw["Legacy NTD ID"].astype(str)
 
-        # Populate res_df
-        for col in cols:
-            try:
-                res_df.at[year, col] = df_year[col][0]
-            except:
-                res_df.at[year, col] = np.NaN
+        # Keep the first row of each system, with values kept as-is (object) like the per-cell copy did
+        df_year = df_raw.loc[:, df_raw.columns.isin(cols)].astype(object)
+        df_year.index = pd.Index(id_col.map(systems), name='system')
+        df_year = df_year[df_year.index.notna() & ~df_year.index.duplicated()]
+
+        df_year.insert(0, 'year', year)
+        frames.append(df_year.reset_index())
+
+    res_df = pd.concat(frames).set_index(['system', 'year'])
+    res_df = res_df.reindex(index=pd.MultiIndex.from_product([list(ids), years], names=['system', 'year']), columns=cols)
+    res_df = res_df.astype(object)
 
     res_df.rename(columns={'Primary UZA\n Population': 'Primary UZA Population'}, inplace=True)
 
@@ -128,22 +180,34 @@ def process_ntd_data(ntd_data: NTDData, system: str) -> pd.DataFrame:
     res_df = res_df.astype({'uza_population':'float'})
     res_df = res_df.astype({'vehicle_revenue_miles':'float'})
 
-    # Adjusting values off by 3 orders of magnitude somehow
-    mean = res_df.mean()
-    std = res_df.std()
+    # Adjusting values off by 3 orders of magnitude somehow, relative to each system's own mean
+    res_df, rescaled = apply_scale_rules(res_df)
 
-    # Handling edge cases
-    if system in ('cleveland', 'orlando'):
-        res_df.loc[(abs(mean.unlinked_passenger_trips - res_df['unlinked_passenger_trips']) > std.unlinked_passenger_trips) & (res_df.index < 2015), 'unlinked_passenger_trips'] *= 1000
-        res_df.loc[(abs(mean.vehicle_revenue_miles - res_df['vehicle_revenue_miles']) > std.vehicle_revenue_miles) & (res_df.index < 2015), 'vehicle_revenue_miles'] *= 1000
+    if quality:
+        missing = res_df.isna().groupby(level='system', sort=False).sum().stack().rename_axis(['system', 'metric'])
+        report = pd.DataFrame({'cells': len(years), 'missing': missing, 'remaining': missing})
+        report['rescaled'] = rescaled.reindex(report.index, fill_value=0)
 
-    elif system not in ('aspen_westcliffe_glenwood_springs', 'hartford', 'richmond'):
-        res_df.loc[abs(mean.unlinked_passenger_trips - res_df['unlinked_passenger_trips']) > std.unlinked_passenger_trips, 'unlinked_passenger_trips'] *= 1000
-        res_df.loc[abs(mean.vehicle_revenue_miles - res_df['vehicle_revenue_miles']) > std.vehicle_revenue_miles, 'vehicle_revenue_miles'] *= 1000
+        return res_df, report.reindex(columns=QUALITY_COLUMNS, fill_value=0)
 
     return res_df
 
-def process_data(brt_data: BRTData, ntd_data: NTDData, system: str) -> None:
+def process_ntd_data(ntd_data: NTDData, system: str) -> pd.DataFrame:
+    """
+    Clean and process NTDData and return a pandas DataFrame of the resulting values for a specific system.
+
+    Parameters:
+        ntd_data (NTDData): An object containing NTD data.
+        system (str): A string representing the transit system for which data is being processed.
+    
+    Return type:
+        pandas.DataFrame: A cleaned DataFrame containing summarized and filtered data for the specified system.
+    """
+    res_df = process_ntd_batch(ntd_data, {system: NTD_IDS[system]})
+
+    return res_df.loc[system].rename_axis(None)
+
+def process_data(brt_data: BRTData, ntd_data: NTDData, system: str, ntd_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Process BRTData and NTDData and merge the results into a dataframe. Export the merged dataframe to a CSV file.
 
@@ -151,30 +215,168 @@ def process_data(brt_data: BRTData, ntd_data: NTDData, system: str) -> None:
         brt_data (BRTData): the BRTData object containing the data to process.
         ntd_data (NTDData): the NTDData object containing the data to process.
         system (str): the name of the transit system to process. Used to filter NTD data.
+        ntd_df (pandas.DataFrame): the already processed NTD data of the system, e.g. a slice of
+            process_ntd_batch. Processed from ntd_data if not given.
 
     Returns:
-        None. The function writes the merged dataframe to a CSV file.
+        pandas.DataFrame: the cleaning report of the BRT data. The function writes the merged dataframe to a CSV file.
     """
-    brt_df = process_brt_data(brt_data)
-    ntd_df = process_ntd_data(ntd_data, system)
+    brt_df, quality = process_brt_data(brt_data, quality=True)
+    if ntd_df is None:
+        ntd_df = process_ntd_data(ntd_data, system)
+
+    export_system(system, brt_df, ntd_df)
+
+    return quality
 
+def export_system(system: str, brt_df: pd.DataFrame, ntd_df: pd.DataFrame) -> None:
+    """
+    Merge the processed BRT and NTD data of a system and export it to its processed table.
+    """
     # Merge the dfs
-    merged_df = pd.concat([brt_df, ntd_df], axis=1)
-    merged_df = merged_df.round(2)
-    merged_df.insert(0, 'system', system)
+    with stage('preprocess.merge', system) as record:
+        merged_df = pd.concat([brt_df, ntd_df], axis=1)
+        merged_df = merged_df.round(2)
+        merged_df.insert(0, 'system', system)
+
+        record['rows_in'] = len(brt_df) + len(ntd_df)
+        record['rows_out'] = len(merged_df)
 
     # Export the df to a CSV
-    export_csv(merged_df, system)
+    with stage('preprocess.export', system) as record:
+        export_csv(merged_df, system)
+        record['rows_out'] = len(merged_df)
+
+def process_systems(systems: list[str], ntd_all: pd.DataFrame) -> tuple:
+    """
+    Load, process and export several systems, aggregating their BRT data in one pass. Runs in a
+    worker process in parallel mode. A failing system is reported without stopping the others.
+
+    Args:
+        systems (list[str]): the names of the transit systems to process.
+        ntd_all (pandas.DataFrame): the processed NTD data of the systems, indexed by (system, year).
+
+    Returns:
+        tuple: the cleaning reports of the processed systems' BRT data, and a mapping of failed
+        system names to their formatted tracebacks.
+    """
+    failures = {}
+    brt_datas = []
+    for system in systems:
+        try:
+            brt = BRTData(system)
+            brt.load_existing_data()
+            brt_datas.append(brt)
+        except Exception:
+            failures[system] = traceback.format_exc()
+
+    try:
+        results = process_brt_batch(brt_datas)
+    except Exception:
+        # A single bad system fails the whole pass: process them one by one to find it
+        results = {}
+        for brt in brt_datas:
+            try:
+                results[brt.name] = process_brt_data(brt, quality=True)
+            except Exception:
+                failures[brt.name] = traceback.format_exc()
+
+    reports = []
+    for system in systems:
+        if system not in results:
+            continue
+
+        brt_df, quality = results[system]
+        try:
+            export_system(system, brt_df, ntd_all.loc[system].rename_axis(None))
+            reports.append(quality)
+        except Exception:
+            failures[system] = traceback.format_exc()
+
+    return reports, failures
+
+def export_quality(reports: list[pd.DataFrame], storage: Storage = None) -> None:
+    """
+    Write the cleaning reports of the processed systems to data/quality_report, keeping the rows
+    of systems that were not processed this time.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.abspath(os.path.join(script_dir, "../../data/quality_report"))
+    storage = storage or Storage()
+
+    report = pd.concat(reports)
+    if storage.exists(path):
+        previous = storage.read(path).set_index('metric', append=True)
+        previous.index.names = ['system', 'metric']
+        previous = previous[~previous.index.get_level_values('system').isin(report.index.get_level_values('system'))]
+        report = pd.concat([previous, report])
+
+    storage.write(report.sort_index().reset_index('metric'), path)
+
+def main(workers: int = 1, incremental: bool = False) -> dict:
+    """
+    Process every system, in parallel if workers > 1. A failing system is reported without
+    stopping the others.
+
+    Args:
+        workers (int): the number of worker processes. 1 processes the systems serially in this process.
+        incremental (bool): only process the systems that are stale according to the build manifest.
+
+    Returns:
+        dict: a mapping of failed system names to their formatted tracebacks.
+    """
+    locations = list(LOCATIONS)
+    manifest = BuildManifest()
+    if incremental:
+        locations = manifest.stale_systems(locations)
+        print('Stale systems:', ', '.join(locations) or 'none')
+        if not locations:
+            return {}
 
-def main():
-    locations = ['cleveland', 'houston', 'kansas', 'richmond', 'indianapolis', 'eugene', 'albuquerque', 'aspen_westcliffe_glenwood_springs', 'fort_collins', 'hartford', 'grand_rapids', 'orlando', 'boston', 'los_angeles']
     ntd = NTDData()
     ntd.load_existing_data()
-    
-    for system in locations:
-        brt = BRTData(system)
-        brt.load_existing_data()
-        process_data(brt, ntd, system)
+
+    # NTD data of every system is processed in one pass
+    with stage('preprocess.ntd', systems=len(locations)) as record:
+        ntd_all, ntd_quality = process_ntd_batch(ntd, {system: NTD_IDS[system] for system in locations}, quality=True)
+        record['rows_out'] = len(ntd_all)
+
+    if workers > 1:
+        failures = {}
+        reports = []
+        shares = [share for share in (locations[i::workers] for i in range(workers)) if share]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_systems, share, ntd_all.loc[share]) for share in shares]
+
+            for share, future in zip(shares, futures):
+                error = future.exception()
+                if error is not None:
+                    failures.update({system: ''.join(traceback.format_exception(error)) for system in share})
+                else:
+                    reports += future.result()[0]
+                    failures.update(future.result()[1])
+    else:
+        reports, failures = process_systems(locations, ntd_all)
+
+    for system, error in failures.items():
+        print(f'Processing failed for {system}:\n{error}', file=sys.stderr)
+
+    processed = [system for system in locations if system not in failures]
+    if processed:
+        export_quality(reports + [ntd_quality.loc[processed]])
+
+    for system in processed:
+        manifest.record_processed(system)
+    manifest.save()
+
+    return failures
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Process the raw data of every BRT system.')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1, serial)')
+    parser.add_argument('--incremental', action='store_true', help='only process systems whose inputs changed')
+    args = parser.parse_args()
+
+    if main(args.workers, args.incremental):
+        sys.exit(1)
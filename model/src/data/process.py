@@ -1,31 +1,191 @@
 # create the actual dataset to make predictions off of
+# the processed tables are streamed into the dataset CHUNK_ROWS rows at a time, so memory stays
+# the same whatever the number of systems, and each block is checked against the dataset's columns
+# with --incremental, only the rows of systems whose processed table changed are replaced
+# every stage is traced to TRANSIT_TRACE if it is set (see tracing.py)
 
-from transit_data import BRTData
+import argparse
+from registry import LOCATIONS
+from storage import Storage
+from manifest import BuildManifest
+from tracing import stage
+import numpy as np
 import pandas as pd
 import os
 
-def export_csv(df, name) -> None:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.abspath(os.path.join(script_dir, "../../data"))
-    
-    df.to_csv(os.path.join(data_dir, f'{name}.csv'), index=True)
+TARGET = 'unlinked_passenger_trips'
 
-def main():
-    locations = ['cleveland', 'houston', 'kansas', 'richmond', 'indianapolis', 'eugene', 'albuquerque', 'aspen_westcliffe_glenwood_springs', 'fort_collins', 'hartford', 'grand_rapids', 'orlando', 'boston', 'los_angeles']
-    dfs = []
+# Maximum number of rows read at once from a table
+CHUNK_ROWS = 100000
 
-    for system in locations:
-        brt = BRTData(system)
-        brt.load_processed_data()
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.abspath(os.path.join(script_dir, "../../data"))
 
-        df = brt.get_data('processed')
-        df = df[df['unlinked_passenger_trips'].notna()]
+class DatasetOrderError(ValueError):
+    """Raised when the rows of the existing dataset are not in the order of LOCATIONS."""
 
-        dfs.append(df)
+def processed_path(system: str) -> str:
+    return os.path.join(DATA_DIR, "processed", system)
 
-    print(dfs)
-    df_large = pd.concat(dfs)
-    export_csv(df_large, 'dataset')
+def union_columns(tables: list[list[str]]) -> list[str]:
+    """
+    Returns the columns of several tables in the order they are first seen, like pd.concat.
+    """
+    columns = []
+    for table in tables:
+        columns += [column for column in table if column not in columns]
+
+    return columns
+
+def check_chunk(df: pd.DataFrame, columns: list[str], system: str) -> pd.DataFrame:
+    """
+    Check a block of rows of a system against the dataset's columns.
+
+    Returns:
+        pandas.DataFrame: The block with exactly the dataset's columns (NaN where the system's
+        table has none) and every column but 'system' as float64.
+    """
+    missing = [column for column in ['system', TARGET] if column not in df]
+    if missing:
+        raise ValueError(f"The rows of {system} have no {missing} columns")
+
+    extra = [column for column in df.columns if column not in columns]
+    if extra:
+        raise ValueError(f"The rows of {system} have columns that are not in the dataset: {extra}")
+
+    if len(df) and not pd.api.types.is_integer_dtype(df.index):
+        raise ValueError(f"The rows of {system} are not indexed by year")
+
+    if (df['system'] != system).any():
+        raise ValueError(f"The rows of {system} hold rows of other systems: {df.loc[df['system'] != system, 'system'].unique()}")
+
+    df = df.reindex(columns=columns)
+    numbers = [column for column in columns if column != 'system']
+    try:
+        # Columns read as text are the only ones that may hold something other than numbers
+        text = [column for column in numbers if not pd.api.types.is_numeric_dtype(df[column])]
+        if text:
+            df[text] = df[text].apply(pd.to_numeric)
+        df = df.astype({column: np.float64 for column in numbers})
+    except (ValueError, TypeError) as error:
+        raise ValueError(f"The rows of {system} have values that are not numbers: {error}") from error
+
+    return df
+
+def read_processed(system: str, columns: list[str], storage: Storage, counts: dict):
+    """
+    Yields the rows of a system's processed table that have a ridership, a block at a time.
+    """
+    for chunk in storage.read_chunks(processed_path(system), CHUNK_ROWS):
+        chunk = check_chunk(chunk, columns, system)
+        counts['rows_in'] += len(chunk)
+
+        yield chunk[chunk[TARGET].notna()]
+
+def merge_processed(dataset_path: str, locations: list[str], changed: list[str], columns: list[str],
+                    storage: Storage, counts: dict):
+    """
+    Yields the rows of the existing dataset with the rows of the changed systems replaced by
+    their processed table, in the order of locations. Systems that are not in locations are
+    left out.
+
+    Raises DatasetOrderError if the existing rows are not in the order of locations.
+    """
+    position = {system: i for i, system in enumerate(locations)}
+    pending = [system for system in locations if system in changed]
+    last = -1
+
+    for chunk in storage.read_chunks(dataset_path, CHUNK_ROWS):
+        chunk = chunk[chunk['system'].isin(position) & ~chunk['system'].isin(changed)]
+        if chunk.empty:
+            continue
+
+        # Each run of rows of one system is written after the changed systems that come before it
+        systems = chunk['system'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, systems[1:] != systems[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(chunk)]):
+            system = systems[start]
+            if position[system] < last:
+                raise DatasetOrderError(f"The rows of {system} are out of order in the dataset")
+            last = position[system]
+
+            while pending and position[pending[0]] < last:
+                yield from read_processed(pending.pop(0), columns, storage, counts)
+
+            rows = check_chunk(chunk.iloc[start:end], columns, system)
+            counts['rows_in'] += len(rows)
+            yield rows
+
+    for system in pending:
+        yield from read_processed(system, columns, storage, counts)
+
+def write_dataset(chunks, columns: list[str], path_stem: str, storage: Storage, counts: dict) -> None:
+    """
+    Write blocks of rows to a table, replacing it only once every block was written.
+    """
+    # The existing table is still read while the new one is written
+    tmp_path = f'{path_stem}.{os.getpid()}.tmp'
+    writer = storage.writer(tmp_path)
+
+    try:
+        for chunk in chunks:
+            if len(chunk):
+                writer.write(chunk)
+                counts['rows_out'] += len(chunk)
+
+        if not counts['rows_out']:
+            writer.write(pd.DataFrame(columns=columns))
+
+        writer.close()
+        os.replace(storage.path(tmp_path), storage.path(path_stem))
+    except BaseException:
+        writer.close()
+        if os.path.exists(storage.path(tmp_path)):
+            os.remove(storage.path(tmp_path))
+        raise
+
+def main(incremental: bool = False):
+    locations = list(LOCATIONS)
+    manifest = BuildManifest()
+    storage = manifest.storage
+    dataset_path = os.path.join(manifest.data_dir, 'dataset')
+    counts = {'rows_in': 0, 'rows_out': 0}
+
+    rebuild = True
+    if incremental and storage.exists(dataset_path):
+        changed = manifest.changed_dataset_systems(locations)
+        print('Changed systems:', ', '.join(changed) or 'none')
+        if not changed:
+            return
+
+        columns = union_columns([storage.columns(dataset_path)] + [storage.columns(processed_path(system)) for system in changed])
+
+        with stage('dataset.export', systems=len(changed), incremental=True) as record:
+            try:
+                write_dataset(merge_processed(dataset_path, locations, changed, columns, storage, counts), columns, dataset_path, storage, counts)
+                rebuild = False
+            except DatasetOrderError as error:
+                # e.g. LOCATIONS was reordered: rebuilding the dataset is as cheap as sorting it
+                print(f'{error}, rebuilding the dataset')
+                counts = {'rows_in': 0, 'rows_out': 0}
+            record.update(counts)
+
+    if rebuild:
+        columns = union_columns([storage.columns(processed_path(system)) for system in locations])
+        chunks = (chunk for system in locations for chunk in read_processed(system, columns, storage, counts))
+
+        with stage('dataset.export', systems=len(locations)) as record:
+            write_dataset(chunks, columns, dataset_path, storage, counts)
+            record.update(counts)
+
+    print(f"Dataset written: {counts['rows_out']} rows")
+
+    manifest.record_dataset(locations)
+    manifest.save()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Assemble the processed systems into the dataset.')
+    parser.add_argument('--incremental', action='store_true', help='only replace the rows of systems that changed')
+    args = parser.parse_args()
+
+    main(args.incremental)
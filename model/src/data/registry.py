@@ -0,0 +1,207 @@
+"""Module listing the BRT systems of the dataset.
+
+SYSTEMS is the single place where a system is defined: the (legacy) NTD ID of its agency and
+the zipcodes along its corridor. make_dataset.py, preprocess.py and process.py all read it, so
+adding a system only means adding an entry here.
+
+To onboard systems in bulk:
+- agency_table builds a lookup table of every agency that reported bus rapid transit (mode RB)
+  to the NTD, from the filtered NTD tables, and saves it to `data/ntd_agencies`. find_agencies
+  searches it by name, city or state.
+- zcta.ZCTAIndex resolves a corridor polyline, or a radius around a point, to zipcodes.
+
+Running this module prints the agencies of the lookup table that are not in SYSTEMS yet.
+"""
+
+import argparse
+import os
+
+# pandas, Storage and NTDData are only imported by the agency lookup, so that reading SYSTEMS
+# (e.g. for `transit.py status`) does not load pandas
+
+SYSTEMS = {
+    'cleveland': {
+        'ntd_id': '5015',
+        'zipcodes': ['44112', '44104', '44103', '44106', '44114'],
+    },
+    'houston': {
+        'ntd_id': '6008',
+        'zipcodes': ['77056', '77027', '77024', '77055'],
+    },
+    'kansas': {
+        'ntd_id': '7005',
+        'zipcodes': ['64106', '64108', '64109', '64110', '64111', '64112', '64113', '64131'],
+    },
+    'richmond': {
+        'ntd_id': '3006',
+        'zipcodes': ['23220', '23221', '23223', '23224', '23226'],
+    },
+    'indianapolis': {
+        'ntd_id': '5050',
+        'zipcodes': ['46205', '46208', '46220', '46201', '46203', '46225', '46227'],
+    },
+    'eugene': {
+        'ntd_id': '7',
+        'zipcodes': ['97401', '97402', '97403', '97404', '97477'],
+    },
+    'albuquerque': {
+        'ntd_id': '6019',
+        'zipcodes': ['87102', '87106', '87108', '87109', '87110', '87111', '87112', '87113', '87114', '87120'],
+    },
+    'aspen_westcliffe_glenwood_springs': {
+        'ntd_id': '8R01-013',
+        'zipcodes': ['81601', '81602', '81611', '81612', '81615', '81621', '81623', '81642', '81652', '81654'],
+    },
+    'fort_collins': {
+        'ntd_id': '8011',
+        'zipcodes': ['80521', '80524', '80525', '80526', '80528'],
+    },
+    'hartford': {
+        'ntd_id': '1048',
+        'zipcodes': ['06002', '06032', '06037', '06051', '06052', '06053', '06067', '06074', '06101', '06103', '06105', '06106', '06108', '06109', '06110', '06112', '06114', '06118', '06119', '06120', '06422'],
+    },
+    'grand_rapids': {
+        'ntd_id': '5033',
+        'zipcodes': ['49301', '49306', '49315', '49316', '49321', '49341', '49345', '49348', '49401', '49404', '49418', '49426', '49428', '49464', '49468', '49503', '49504', '49505', '49506', '49507', '49508', '49509', '49512', '49519', '49525', '49534', '49544', '49546', '49548'],
+    },
+    'orlando': {
+        'ntd_id': '4035',
+        'zipcodes': ['32801', '32802', '32803', '32804', '32805', '32806', '32808', '32809', '32810', '32811', '32812', '32814', '32816', '32817', '32818', '32819', '32822', '32824', '32827', '32829', '32832', '32835', '32839', '32853', '32854', '32855', '32856', '32857', '32858', '32859', '32860', '32861', '32862', '32867', '32868', '32869', '32872', '32877', '32878', '32885', '32886', '32887', '32890', '32891', '32893', '32896', '32897', '32898', '32899'],
+    },
+    'boston': {
+        'ntd_id': '1003',
+        'zipcodes': ['02108', '02109', '02110', '02111', '02113', '02114', '02115', '02116', '02118', '02119', '02120', '02121', '02122', '02124', '02125', '02126', '02127', '02128', '02129', '02130', '02131', '02132', '02134', '02135', '02136', '02151', '02163', '02169', '02170', '02171', '02184', '02186', '02199', '02203', '02210', '02215', '02445', '02446'],
+    },
+    'los_angeles': {
+        'ntd_id': '9154',
+        'zipcodes': ['90004', '90005', '90006', '90007', '90012', '90013', '90014', '90015', '90017', '90018', '90019', '90020', '90021', '90026', '90027', '90028', '90029', '90031', '90032', '90033', '90034', '90035', '90036', '90037', '90038', '90039', '90041', '90042', '90043', '90044', '90045', '90046', '90047', '90048', '90057', '90062', '90063', '90064', '90065', '90066', '90068', '90069', '90071', '90089', '90230', '90291', '90292', '90293', '90401', '90402', '90403', '90404', '90405', '90640', '90650', '90723', '91030', '91040', '91042', '91101', '91103', '91104', '91105', '91106', '91107', '91108', '91201', '91202', '91203', '91204', '91205', '91206', '91207', '91208', '91214', '91331', '91335', '91340', '91342', '91343', '91344', '91345', '91352', '91356', '91364', '91367', '91401', '91402', '91403', '91405', '91406', '91411', '91423', '91436', '91501', '91502', '91504', '91505', '91506', '91601', '91602', '91604', '91605', '91606', '91607'],
+    },
+    # 'brooklyn': {'ntd_id': '2008', 'zipcodes': []},
+}
+
+# The systems in dataset order, and the NTD ID of each
+LOCATIONS = list(SYSTEMS)
+NTD_IDS = {system: spec['ntd_id'] for system, spec in SYSTEMS.items()}
+
+# ID, name and location columns of the filtered NTD tables, which changed names over the years
+AGENCY_COLUMNS = {
+    'ntd_id': ['Legacy NTD ID', 'Legacy NTDID', 'ID'],
+    'name': ['Agency', 'Name'],
+    'city': ['City'],
+    'state': ['State'],
+}
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+AGENCY_TABLE = os.path.abspath(os.path.join(script_dir, "../../data/ntd_agencies"))
+
+# --------------------------------------------
+# SYSTEM FUNCTIONS
+# --------------------------------------------
+
+def zipcodes(system: str) -> list[str]:
+    """
+    Returns the zipcodes of a system.
+    """
+    try:
+        return SYSTEMS[system]['zipcodes']
+    except KeyError:
+        raise ValueError(f"Unknown system '{system}', expected one of {LOCATIONS}")
+
+# --------------------------------------------
+# NTD AGENCY LOOKUP
+# --------------------------------------------
+
+def agency_table(ntd_data: 'NTDData' = None, storage: 'Storage' = None) -> 'pd.DataFrame':
+    """
+    Build the lookup table of every agency in the filtered NTD tables and save it to AGENCY_TABLE.
+
+    Parameters:
+        ntd_data (NTDData): NTD data to read the agencies of. Defaults to the existing tables.
+        storage (Storage): Storage to write the table with.
+
+    Returns:
+        pandas.DataFrame: One row per NTD ID, with the agency's latest name, city and state and the
+        first and last year it reported bus rapid transit.
+    """
+    import pandas as pd
+    from storage import Storage
+    from transit_data import NTDData
+
+    if ntd_data is None:
+        ntd_data = NTDData()
+        ntd_data.load_existing_data()
+
+    frames = []
+    for name in ntd_data.tables:
+        year = int(name.split('_')[2])
+        df = ntd_data.get_data(name).reset_index()
+
+        agencies = pd.DataFrame({'year': year}, index=df.index)
+        for column, candidates in AGENCY_COLUMNS.items():
+            found = [candidate for candidate in candidates if candidate in df.columns]
+            agencies[column] = df[found[0]] if found else None
+
+        # The 2013 table has numeric IDs read as floats
+        if pd.api.types.is_numeric_dtype(agencies['ntd_id']):
+            agencies['ntd_id'] = agencies['ntd_id'].astype('Int64')
+        agencies['ntd_id'] = agencies['ntd_id'].astype(str).str.strip()
+        frames.append(agencies[agencies['ntd_id'].notna() & (agencies['ntd_id'] != '<NA>')])
+
+    agencies = pd.concat(frames).sort_values('year')
+    years = agencies.groupby('ntd_id')['year'].agg(['min', 'max']).rename(columns={'min': 'first_year', 'max': 'last_year'})
+
+    # Names, cities and states of the latest year that has them
+    latest = agencies.groupby('ntd_id')[['name', 'city', 'state']].last()
+    table = latest.join(years).sort_values(['state', 'name'])
+
+    (storage or Storage()).write(table, AGENCY_TABLE)
+
+    return table
+
+def load_agency_table(storage: 'Storage' = None) -> 'pd.DataFrame':
+    """
+    Returns the agency lookup table, building it first if it was never saved.
+    """
+    from storage import Storage
+
+    storage = storage or Storage()
+    if not storage.exists(AGENCY_TABLE):
+        return agency_table(storage=storage)
+
+    return storage.read(AGENCY_TABLE).rename(index=str)
+
+def find_agencies(query: str = None, state: str = None, table: 'pd.DataFrame' = None) -> 'pd.DataFrame':
+    """
+    Returns the agencies of the lookup table whose name or city contains a query (case-insensitive),
+    optionally in a given state.
+    """
+    import pandas as pd
+
+    table = load_agency_table() if table is None else table
+    match = pd.Series(True, index=table.index)
+
+    if query:
+        text = table['name'].fillna('') + ' ' + table['city'].fillna('')
+        match &= text.str.contains(query, case=False, regex=False)
+    if state:
+        match &= table['state'] == state.upper()
+
+    return table[match]
+
+def new_agencies(table: 'pd.DataFrame' = None) -> 'pd.DataFrame':
+    """
+    Returns the agencies of the lookup table that no system of SYSTEMS uses yet.
+    """
+    table = load_agency_table() if table is None else table
+
+    return table[~table.index.isin(list(NTD_IDS.values()))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List the NTD agencies that could be added as BRT systems.')
+    parser.add_argument('query', nargs='?', help='only list agencies whose name or city contains this')
+    parser.add_argument('--state', help='only list agencies of this state, e.g. CA')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the lookup table from the NTD tables first')
+    args = parser.parse_args()
+
+    table = agency_table() if args.rebuild else load_agency_table()
+    print(find_agencies(args.query, args.state, new_agencies(table)).to_string())
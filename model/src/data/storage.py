@@ -0,0 +1,312 @@
+"""Module to read and write the pipeline's tables in a configurable file format.
+
+Every stage (BRTData, NTDData, preprocess and process) reads and writes its tables through
+a Storage object instead of calling to_csv/read_csv directly. Tables are addressed by a
+path without extension, e.g. `data/raw/boston/income`, and the Storage picks the file
+format:
+
+- csv: the original format, human-readable but re-parsed and re-typed on every load.
+- parquet: typed, compressed and column-projectable. Requires pyarrow.
+
+The format defaults to the TRANSIT_STORAGE environment variable ('csv' if unset). Reads
+fall back to the other format if the table has not been written in the preferred one
+yet, so switching formats does not require re-fetching any data.
+
+Large tables can be streamed: read_chunks yields a table a block of rows at a time, and
+writer returns a TableWriter that appends blocks of rows to a table, so neither ever holds
+the whole table in memory.
+"""
+
+import csv
+import os
+
+import pandas as pd
+
+
+def to_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the index and the object columns of a DataFrame to numbers where every value
+    converts, like read_csv would infer them.
+    """
+    df = df.copy()
+
+    try:
+        df.index = pd.to_numeric(df.index)
+    except (ValueError, TypeError):
+        pass
+
+    for col in df.columns[df.dtypes == object]:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+
+    return df
+
+
+class CSVFormat(object):
+    extension = '.csv'
+
+    def write(self, df: pd.DataFrame, path: str) -> None:
+        df.to_csv(path, index=True)
+
+    def read(self, path: str, columns: list[str] = None, rows: list = None) -> pd.DataFrame:
+        usecols = None
+        if columns is not None:
+            # The index column has to be read too, and its header is often blank
+            index_name = pd.read_csv(path, nrows=0).columns[0]
+            usecols = [index_name] + list(columns)
+
+        df = pd.read_csv(path, index_col=0, usecols=usecols)
+
+        # A CSV file has to be parsed whole, the rows are filtered after
+        if rows is not None:
+            df = df[df.index.isin(rows)]
+
+        return df
+
+    def read_chunks(self, path: str, chunksize: int, columns: list[str] = None):
+        usecols = None
+        if columns is not None:
+            usecols = [self.header(path)[0]] + list(columns)
+
+        yield from pd.read_csv(path, index_col=0, usecols=usecols, chunksize=chunksize)
+
+    def header(self, path: str) -> list[str]:
+        with open(path, newline='') as f:
+            return next(csv.reader(f), [])
+
+    def columns(self, path: str) -> list[str]:
+        return self.header(path)[1:]
+
+    def writer(self, path: str) -> 'CSVWriter':
+        return CSVWriter(path)
+
+
+class CSVWriter(object):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        # The first block creates the file with the header, the others are appended
+        df.to_csv(self.path, mode='w' if self.header else 'a', header=self.header, index=True)
+        self.header = False
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetFormat(object):
+    extension = '.parquet'
+
+    def prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = to_numeric(df)
+        df.columns = df.columns.astype(str)
+
+        # Parquet columns need a single type, so mixed columns are stored as strings
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+
+        return df
+
+    def write(self, df: pd.DataFrame, path: str) -> None:
+        self.prepare(df).to_parquet(path, index=True, compression='zstd')
+
+    def index_columns(self, path: str) -> list[str]:
+        """
+        Returns the columns of a file that hold the stored index. A RangeIndex is not stored.
+        """
+        import pyarrow.parquet as pq
+
+        return [name for name in pq.read_schema(path).pandas_metadata['index_columns'] if isinstance(name, str)]
+
+    def read(self, path: str, columns: list[str] = None, rows: list = None) -> pd.DataFrame:
+        index_columns = self.index_columns(path) if rows is not None else []
+
+        # Rows are filtered by the reader, which skips the row groups that hold none of them
+        filters = [(index_columns[0], 'in', list(rows))] if index_columns else None
+
+        # The stored index is always restored, even when only some columns are requested
+        df = pd.read_parquet(path, columns=None if columns is None else list(columns), filters=filters)
+
+        if rows is not None and not index_columns:
+            df = df[df.index.isin(rows)]
+
+        return df
+
+    def read_chunks(self, path: str, chunksize: int, columns: list[str] = None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        if columns is not None:
+            columns = list(columns) + self.index_columns(path)
+
+        # Each batch keeps the pandas metadata of the file, so to_pandas restores the index
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield pa.Table.from_batches([batch]).to_pandas()
+
+    def columns(self, path: str) -> list[str]:
+        import pyarrow.parquet as pq
+
+        index_columns = self.index_columns(path)
+
+        return [column['name'] for column in pq.read_schema(path).pandas_metadata['columns'] if column['field_name'] not in index_columns]
+
+    def writer(self, path: str) -> 'ParquetWriter':
+        return ParquetWriter(self, path)
+
+
+class ParquetWriter(object):
+    def __init__(self, fmt: ParquetFormat, path: str) -> None:
+        self.fmt = fmt
+        self.path = path
+        self.writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(self.fmt.prepare(df), preserve_index=True)
+
+        # The first block sets the schema of the file, the others are cast to it
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+        else:
+            table = table.cast(self.writer.schema)
+
+        self.writer.write_table(table)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+FORMATS = {
+    'csv': CSVFormat(),
+    'parquet': ParquetFormat(),
+}
+
+
+class Storage(object):
+    def __init__(self, fmt: str = None) -> None:
+        """
+        Reads and writes DataFrames in a given file format.
+
+        Parameters:
+            fmt (str): One of FORMATS. Defaults to the TRANSIT_STORAGE environment variable, or 'csv'.
+        """
+        fmt = fmt or os.environ.get('TRANSIT_STORAGE', 'csv')
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown storage format '{fmt}', expected one of {list(FORMATS)}")
+
+        self.fmt = fmt
+
+    def path(self, path_stem: str) -> str:
+        """
+        Returns the path of a table in this Storage's format.
+        """
+        return path_stem + FORMATS[self.fmt].extension
+
+    def find(self, path_stem: str) -> tuple:
+        """
+        Returns the (format, path) of an existing table, preferring this Storage's format, or
+        (None, None) if the table does not exist in any format.
+        """
+        for fmt in [self.fmt] + [fmt for fmt in FORMATS if fmt != self.fmt]:
+            path = path_stem + FORMATS[fmt].extension
+            if os.path.exists(path):
+                return fmt, path
+
+        return None, None
+
+    def exists(self, path_stem: str) -> bool:
+        return self.find(path_stem)[1] is not None
+
+    def write(self, df: pd.DataFrame, path_stem: str) -> str:
+        """
+        Write a DataFrame (with its index) to a table.
+
+        Parameters:
+            df (pandas.DataFrame): The DataFrame to write.
+            path_stem (str): The path of the table without extension.
+
+        Returns:
+            str: The path of the written file.
+        """
+        path = self.path(path_stem)
+        FORMATS[self.fmt].write(df, path)
+
+        return path
+
+    def read(self, path_stem: str, columns: list[str] = None, rows: list = None) -> pd.DataFrame:
+        """
+        Read a table, indexed by its first column.
+
+        Parameters:
+            path_stem (str): The path of the table without extension.
+            columns (list[str]): Columns to read. Defaults to all columns.
+            rows (list): Index values (e.g. years) to keep. Defaults to all rows. Parquet tables
+                pass them to the reader, so row groups holding none of them are skipped.
+
+        Returns:
+            pandas.DataFrame: The table.
+        """
+        fmt, path = self.find(path_stem)
+        if path is None:
+            raise FileNotFoundError(f"No table found at '{path_stem}'")
+
+        return FORMATS[fmt].read(path, columns, rows)
+
+    def read_chunks(self, path_stem: str, chunksize: int, columns: list[str] = None):
+        """
+        Read a table a block of rows at a time, each indexed by the table's first column.
+
+        Parameters:
+            path_stem (str): The path of the table without extension.
+            chunksize (int): Maximum number of rows per block.
+            columns (list[str]): Columns to read. Defaults to all columns.
+
+        Yields:
+            pandas.DataFrame: The blocks of rows, in order.
+        """
+        fmt, path = self.find(path_stem)
+        if path is None:
+            raise FileNotFoundError(f"No table found at '{path_stem}'")
+
+        yield from FORMATS[fmt].read_chunks(path, chunksize, columns)
+
+    def columns(self, path_stem: str) -> list[str]:
+        """
+        Returns the column names of a table, without reading its rows.
+        """
+        fmt, path = self.find(path_stem)
+        if path is None:
+            raise FileNotFoundError(f"No table found at '{path_stem}'")
+
+        return FORMATS[fmt].columns(path)
+
+    def writer(self, path_stem: str):
+        """
+        Returns a writer that appends blocks of rows to a new table in this Storage's format.
+        Blocks are written with their index and must have the same columns. The writer must
+        be closed once the last block is written.
+
+        Parameters:
+            path_stem (str): The path of the table without extension.
+        """
+        return FORMATS[self.fmt].writer(self.path(path_stem))
+
+    def list(self, directory: str) -> list[str]:
+        """
+        Returns the names (without extension) of the tables in a directory, in any format.
+        """
+        extensions = tuple(f.extension for f in FORMATS.values())
+
+        return sorted({
+            os.path.splitext(filename)[0]
+            for filename in os.listdir(directory)
+            if filename.endswith(extensions)
+        })
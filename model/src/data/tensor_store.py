@@ -0,0 +1,144 @@
+"""Module to hold the Census metrics of a system in one typed array.
+
+A MetricStore keeps the metric tables of a BRTData object as a single contiguous float array
+of shape (metric, year, zipcode), with an index of its metrics, years and zipcodes. The
+DataFrames returned by BRTData.get_data are views over the array, so writing a cell writes
+the array and no object-dtype frame is ever allocated.
+
+A store is saved as two files: `<path>.npy` holds the array and `<path>.json` its index.
+Loading memory-maps the array, so a store of any size loads in about constant time and only
+the pages that are read are pulled from disk.
+
+Values are float64 by default: Census sentinels such as -666666666 are not exact in float32,
+so float32 should only be used for data that was already cleaned.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class MetricStore(object):
+    def __init__(self, metrics: list[str], years: list, zipcodes: list[str], values: np.ndarray = None,
+                 dtype=np.float64) -> None:
+        """
+        Parameters:
+            metrics (list[str]): The metric of each index of the first axis.
+            years (list): The year of each index of the second axis.
+            zipcodes (list[str]): The zipcode of each index of the third axis.
+            values (numpy.ndarray): Array of shape (metric, year, zipcode). Defaults to an array
+                of NaN.
+            dtype: Type of the default array.
+        """
+        self.metrics = list(metrics)
+        self.years = pd.Index(years, name='year')
+        self.zipcodes = pd.Index(zipcodes)
+
+        shape = (len(self.metrics), len(self.years), len(self.zipcodes))
+        if values is None:
+            values = np.full(shape, np.nan, dtype=dtype)
+        elif values.shape != shape:
+            raise ValueError(f"Store values have shape {values.shape}, expected {shape}")
+
+        self.values = values
+        self.positions = {metric: i for i, metric in enumerate(self.metrics)}
+
+    @classmethod
+    def from_frames(cls, frames: dict, dtype=np.float64) -> 'MetricStore':
+        """
+        Build a store from metric tables, aligned on the union of their years and zipcodes.
+        Values that are not numbers become NaN.
+
+        Parameters:
+            frames (dict): A mapping of metric names to (year x zipcode) DataFrames.
+        """
+        tables = list(frames.values())
+
+        years = tables[0].index
+        zipcodes = tables[0].columns
+        for df in tables[1:]:
+            years = years.union(df.index, sort=False)
+            zipcodes = zipcodes.union(df.columns, sort=False)
+
+        store = cls(list(frames), years, zipcodes, dtype=dtype)
+        for i, df in enumerate(tables):
+            df = df.reindex(index=years, columns=zipcodes)
+            if (df.dtypes == object).any():
+                df = df.apply(pd.to_numeric, errors='coerce')
+            store.values[i] = df.to_numpy(dtype=dtype)
+
+        return store
+
+    # --------------------------------------------
+    # ACCESS FUNCTIONS
+    # --------------------------------------------
+
+    def frame(self, metric: str) -> pd.DataFrame:
+        """
+        Returns the (year x zipcode) table of a metric as a DataFrame sharing the store's memory.
+        """
+        return pd.DataFrame(self.values[self.positions[metric]], index=self.years, columns=self.zipcodes, copy=False)
+
+    def tensor(self, metrics: list[str] = None) -> np.ndarray:
+        """
+        Returns the (metric, year, zipcode) float64 array of some metrics. The store's own array
+        is returned without a copy when it holds exactly these metrics as float64.
+        """
+        if metrics is None or list(metrics) == self.metrics:
+            return np.asarray(self.values, dtype=np.float64)
+
+        return np.asarray(self.values[[self.positions[metric] for metric in metrics]], dtype=np.float64)
+
+    def set(self, metric: str, year, zipcodes: list[str], values) -> None:
+        """
+        Write the values of some zipcodes of a metric for a year. Values that are not numbers
+        become NaN.
+        """
+        columns = self.zipcodes.get_indexer(zipcodes)
+        if (columns < 0).any():
+            raise KeyError(f"Zipcodes not in the store: {list(np.asarray(zipcodes)[columns < 0])}")
+
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=self.values.dtype)
+        self.values[self.positions[metric], self.years.get_loc(year), columns] = values
+
+    # --------------------------------------------
+    # SERIALIZATION FUNCTIONS
+    # --------------------------------------------
+
+    def save(self, path: str) -> None:
+        """
+        Write the store to `<path>.npy` and `<path>.json`.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.save(path + '.npy', self.values)
+
+        index = {
+            'metrics': self.metrics,
+            'years': self.years.tolist(),
+            'zipcodes': self.zipcodes.tolist(),
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(index, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'MetricStore':
+        """
+        Read a store written by save.
+
+        Parameters:
+            path (str): The path of the store without extension.
+            mmap (bool): Memory-map the array instead of reading it. Writes to a mapped store
+                stay in memory and never reach the file.
+        """
+        with open(path + '.json') as f:
+            index = json.load(f)
+
+        values = np.load(path + '.npy', mmap_mode='c' if mmap else None)
+
+        return cls(index['metrics'], index['years'], index['zipcodes'], values)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(path + '.npy') and os.path.exists(path + '.json')
@@ -1,26 +1,45 @@
+import datetime
+import hashlib
 import requests
-import json
 import pandas as pd
 import os
+import re
 import time
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from zipfile import ZipFile
+from cache import ResponseCache
+from fetch import CensusFetcher
+from journal import DownloadJournal
+from census_schema import CENSUS_TABLES, METRICS, column_resolver, spec_hash
+from storage import Storage
+from tensor_store import MetricStore
+from walkability import WalkScoreClient, WalkScoreError
+from tracing import stage
+
+# NTD columns used downstream (see preprocess.process_ntd_data and registry.agency_table): the
+# first column (kept as the CSV index), the agency ID, city and state, the mode and the metrics.
+# Column names differ between years.
+NTD_COLUMNS = [
+    'Name', 'Agency', 'City', 'State', 'ID', 'Legacy NTDID', 'Legacy NTD ID', 'Mode',
+    'Unlinked Passenger Trips', 'Primary UZA\n Population', 'UZA Population', 'Mode VOMS', 'VOMS',
+    'Annual Vehicle Revenue Miles', 'Vehicle Revenue Miles',
+]
+
+# Where the APTA archives of NTD data are downloaded from
+APTA_URL = 'https://www.apta.com/wp-content/uploads'
+
+# Seconds to wait before checking again on cells claimed by other workers
+JOURNAL_POLL = 5
 
 class BRTData(object):
-    def __init__(self, location, zipcodes: list[str] = []) -> None:
+    def __init__(self, location, zipcodes: list[str] = [], fetcher: CensusFetcher = None, batch_size: int = 1,
+                 storage: Storage = None, journal: DownloadJournal = None) -> None:
         self.name = location
         self.years = list(map(str, [x for x in range(2013, 2021)]))
         self.zipcodes = zipcodes
 
-        self.income = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.pop = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.age = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.house_married = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.house_nonfam = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.house_m_single = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.house_f_single = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.car = pd.DataFrame(index=self.years, columns=zipcodes)
-        self.biz = pd.DataFrame(index=self.years, columns=zipcodes)
+        # Every metric in one float array, returned by get_data as DataFrame views
+        self.store = MetricStore(METRICS, self.years, zipcodes)
 
         # Creating directory to save raw data
         # Get the absolute path to the directory containing the current script
@@ -36,12 +55,36 @@ class BRTData(object):
             os.makedirs(loc_dir)
 
         self.resultsLocation = loc_dir
+        self.store_dir = os.path.join(project_dir, "data/cache/tensors")
         self.processed = None
+        self.storage = storage if storage is not None else Storage()
+
+        # Tables available on disk (name -> path without extension), read on first get_data
+        self.tables = {}
+        self.loaded = set()
+
+        # Shared between systems so that all requests draw from the same rate limit
+        self.fetcher = fetcher
+
+        # Number of zipcodes requested per Census API call (1 = one request per zipcode)
+        self.batch_size = batch_size
+
+        # Records completed cells, so interrupted downloads resume and workers share the work
+        self.journal = journal
 
     # --------------------------------------------
     # HELPER FUNCTIONS
     # --------------------------------------------
 
+    def get_fetcher(self) -> CensusFetcher:
+        """
+        Returns the CensusFetcher used by this BRTData object, creating one if none was given.
+        """
+        if self.fetcher is None:
+            self.fetcher = CensusFetcher()
+
+        return self.fetcher
+
     def fetch_api_data(self, url: str) -> dict:
         """
         Fetches data from an API endpoint and returns the response in JSON format.
@@ -54,45 +97,263 @@ class BRTData(object):
         """
         # print(url) # for debugging
 
-        # make the API request
-        response = requests.get(url)
+        return self.get_fetcher().fetch(url)
+
+    def split_batch_response(self, res: dict, zipcodes: list[str]) -> dict:
+        """
+        Splits a Census API response covering several zipcodes into one response per zipcode.
+
+        Parameters:
+            res (dict): JSON response of a batched request.
+            zipcodes (list[str]): The zipcodes requested in the batch.
+
+        Returns:
+            dict: A mapping of zipcodes to single-zipcode responses (None if the zipcode is missing).
+        """
+        split = dict.fromkeys(zipcodes)
+        if not res:
+            return split
+
+        header, *rows = res['response']['data']
+
+        # Rows are not returned in request order, so match them on their geography column
+        if 'GEO_ID' in header:
+            geo_index = header.index('GEO_ID')
+        elif 'NAME' in header:
+            geo_index = header.index('NAME')
+        else:
+            raise ValueError("API response has no geography column to match zipcodes on")
+
+        for row in rows:
+            zipcode = row[geo_index][-5:]
+            if zipcode in split:
+                split[zipcode] = {'response': {'data': [header, row]}}
+
+        return split
+
+    def fetch_all(self, url: str, years: list[str] = None) -> dict:
+        """
+        Fetches an API endpoint for every (year, zipcode) pair of this BRTData object concurrently.
+
+        Zipcodes are requested batch_size at a time as a colon-joined geography list, and each
+        row of the response is mapped back to its zipcode.
+
+        Parameters:
+            url (str): URL template with {geo}, {year} and optionally {year_short} fields.
+            years (list[str]): Years to fetch. Defaults to all years of the BRTData object.
+
+        Returns:
+            dict: A mapping of (year, zipcode) tuples to JSON responses (None if empty).
+        """
+        batches = [self.zipcodes[i:i + self.batch_size] for i in range(0, len(self.zipcodes), self.batch_size)]
+
+        urls = {
+            (year, tuple(batch)): self.batch_url(url, year, batch)
+            for year in (years or self.years)
+            for batch in batches
+        }
+
+        results = {}
+        for (year, batch), res in self.get_fetcher().fetch_many(urls).items():
+            for zipcode, zip_res in self.split_batch(res, batch).items():
+                results[(year, zipcode)] = zip_res
+
+        return results
+
+    def batch_url(self, url: str, year: str, zipcodes: list[str]) -> str:
+        """
+        Returns the URL requesting a batch of zipcodes for a year.
+
+        Parameters:
+            url (str): URL template with {geo}, {year} and optionally {year_short} fields.
+            year (str): The year to request.
+            zipcodes (list[str]): The zipcodes to request, as a colon-joined geography list.
+        """
+        return url.format(geo = ':'.join('860XX00US' + zipcode for zipcode in zipcodes), year = year, year_short = year[2:])
+
+    def split_batch(self, res: dict, zipcodes: tuple) -> dict:
+        """
+        Returns a mapping of zipcodes to single-zipcode responses for the response of a batch.
+        """
+        if len(zipcodes) == 1:
+            return {zipcodes[0]: res}
+
+        return self.split_batch_response(res, list(zipcodes))
+
+    def has_data(self, res: dict) -> bool:
+        """
+        Returns True if a single-zipcode response holds a row of data, not only a header.
+        """
+        return bool(res) and len(res['response']['data']) > 1
+
+    def batch_zipcodes(self, url: str) -> tuple:
+        """
+        Returns the zipcodes requested by a URL built by batch_url, in request order.
+        """
+        return tuple(re.findall(r'860XX00US(\d{5})', url))
+
+    def fetch_journaled(self, table: str, url: str, years: list[str]) -> int:
+        """
+        Fetches the cells of a Census table that are not complete in the journal yet.
+
+        Cells are claimed a few batches at a time, and each batch is recorded in the journal,
+        with the URL of its response, as soon as the response arrives. If the remaining cells
+        are claimed by other workers, waits for them to complete (or for their claims to expire).
+
+        Parameters:
+            table (str): The key of the table in CENSUS_TABLES.
+            url (str): URL template of the table.
+            years (list[str]): Years to fetch.
+
+        Returns:
+            int: The number of cells fetched by this worker.
+        """
+        journal = self.journal
+        fetcher = self.get_fetcher()
+        journal.add(self.name, table, spec_hash(table), years, self.zipcodes)
+        fetched = 0
 
-        # check if response is empty or not in JSON format
-        if not response.content:
-            return None
         try:
-            return response.json()
-        except json.JSONDecodeError as e:
-            raise ValueError("API response is not in valid JSON format") from e
+            while True:
+                batches = journal.claim(self.name, table, self.batch_size, fetcher.max_workers)
+
+                if not batches:
+                    if not journal.remaining(self.name, table):
+                        break
+                    time.sleep(JOURNAL_POLL)
+                    continue
+
+                urls = {(year, tuple(batch)): self.batch_url(url, year, batch) for year, batch in batches}
+
+                for (year, batch), res in fetcher.fetch_iter(urls):
+                    # Cells the response has no row for are marked missing, to be retried by the next run
+                    cells = self.split_batch(res, batch)
+                    journal.complete(self.name, table, year, {
+                        zipcode: urls[(year, batch)] if self.has_data(cell) else None
+                        for zipcode, cell in cells.items()
+                    })
+                    fetched += len(batch)
+        finally:
+            # Let other workers fetch whatever this one claimed but did not complete
+            journal.release(self.name, table)
+
+        return fetched
         
     def load_existing_data(self) -> None:
         """
-        Load existing data from CSV files in the results location directory and 
-        assign the data to object properties in the current BRTData object.
+        Index the existing tables in the results location directory. Each table is only read
+        and assigned to the matching property of the BRTData object on its first get_data access;
+        metric tables are read together into the MetricStore (see load_store).
         """
-        for filename in os.listdir(self.resultsLocation):
-            if filename.endswith(".csv"):
-                print(filename)
-                csv_path = os.path.join(self.resultsLocation, filename)
-                csv_data = pd.read_csv(csv_path, index_col=0)
-                csv_data = csv_data.rename_axis('year')
-                setattr(self, os.path.splitext(filename)[0], csv_data)
+        self.tables = {
+            name: os.path.join(self.resultsLocation, name)
+            for name in self.storage.list(self.resultsLocation)
+        }
+        self.loaded = set()
 
         # Note: No checking of zipcode consistency
 
+    def load_table(self, name: str) -> None:
+        """
+        Read an indexed table from disk and assign it to the matching property.
+        """
+        with stage('census.load', self.name, table=name) as record:
+            data = self.storage.read(self.tables[name])
+            data = data.rename_axis('year')
+            record['rows_out'] = len(data)
+
+        setattr(self, name, data)
+        self.loaded.add(name)
+
+    def store_path(self, names: list[str]) -> str:
+        """
+        Returns the path (without extension) of the MetricStore of some metric tables. The path
+        changes whenever one of the table files does, so a stale store is never read.
+        """
+        digest = hashlib.sha1()
+        for name in names:
+            stat = os.stat(self.storage.find(self.tables[name])[1])
+            digest.update(f'{name}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+
+        return os.path.join(self.store_dir, f'{self.name}-{digest.hexdigest()[:16]}')
+
+    def load_store(self) -> None:
+        """
+        Read every indexed metric table into the MetricStore at once. The store is memory-mapped
+        from the tensor cache (`data/cache/tensors/`) if the tables did not change since it was
+        written, otherwise it is built from the tables and written to the cache.
+        """
+        names = [metric for metric in METRICS if metric in self.tables]
+        path = self.store_path(names)
+
+        if MetricStore.exists(path):
+            with stage('census.load', self.name, table='store') as record:
+                self.store = MetricStore.load(path)
+                record['rows_out'] = len(self.store.years)
+        else:
+            frames = {}
+            for name in names:
+                with stage('census.load', self.name, table=name) as record:
+                    frames[name] = self.storage.read(self.tables[name])
+                    record['rows_out'] = len(frames[name])
+
+            self.store = MetricStore.from_frames(frames)
+
+            # Stores of older versions of the tables are of no use anymore
+            prefix = f'{self.name}-'
+            if os.path.isdir(self.store_dir):
+                for filename in os.listdir(self.store_dir):
+                    stem, extension = os.path.splitext(filename)
+                    if stem.startswith(prefix) and stem[len(prefix):].isalnum() and extension in ('.npy', '.json'):
+                        os.remove(os.path.join(self.store_dir, filename))
+
+            self.store.save(path)
+
+        self.loaded.update(names)
+
+    def get_store(self, metrics: list[str] = METRICS) -> MetricStore:
+        """
+        Returns the MetricStore holding the metrics, reading it from disk first if needed.
+        """
+        for metric in metrics:
+            if metric in self.tables and metric not in self.loaded:
+                self.load_store()
+                break
+
+        return self.store
+
+    def unload(self, data: str = None) -> None:
+        """
+        Free a table loaded from disk. It is read again on its next get_data access. Metrics share
+        one MetricStore, so unloading any metric unloads all of them.
+
+        Parameters:
+            data (str): The name of the table to unload. Defaults to all loaded tables.
+        """
+        for name in [data] if data else list(self.loaded):
+            if name not in self.loaded:
+                continue
+
+            if name in METRICS:
+                self.store = MetricStore(METRICS, self.years, self.zipcodes)
+                self.loaded.difference_update(METRICS)
+            else:
+                delattr(self, name)
+                self.loaded.remove(name)
+
     def load_processed_data(self) -> None:
         """
-        Load processed data from the relevant CSV file for this system.
+        Load processed data from the relevant table for this system.
         """
         script_dir = os.path.dirname(os.path.abspath(__file__))
         # Navigate two levels up to the project directory
         project_dir = os.path.abspath(os.path.join(script_dir, "../.."))
         # Define the paths to the data directories
-        csv_path = os.path.join(project_dir, f"data/processed/{self.name}.csv")
+        path = os.path.join(project_dir, f"data/processed/{self.name}")
 
-        csv_data = pd.read_csv(csv_path, index_col=0)
+        data = self.storage.read(path)
 
-        setattr(self, 'processed', csv_data)
+        setattr(self, 'processed', data)
     
     def get_data(self, data):
         """
@@ -104,6 +365,14 @@ class BRTData(object):
         Returns:
             The value of the specified property of the BRData object.
         """
+        if data in METRICS:
+            store = self.get_store([data])
+            if data in store.positions:
+                return store.frame(data)
+
+        if data in self.tables and data not in self.loaded:
+            self.load_table(data)
+
         try:
             return getattr(self, data)
         except AttributeError:
@@ -113,6 +382,101 @@ class BRTData(object):
     # DATA RETRIEVAL FUNCTIONS
     # --------------------------------------------
 
+    def save_table(self, table: str) -> None:
+        """
+        Fetches every metric of a Census table (see census_schema.CENSUS_TABLES) for the zip codes
+        and years stored in the BRTData object.
+
+        Each metric's DataFrame is saved as a CSV file named after the metric in the
+        'data/raw/{resultsLocation}' directory of the BRTData object.
+
+        Parameters:
+            table (str): The key of the table in CENSUS_TABLES.
+        """
+        spec = CENSUS_TABLES[table]
+        years = [year for year in self.years if year <= spec.get('last_year', year)]
+
+        if self.journal is not None:
+            self.save_journaled_table(table, years)
+            return
+
+        with stage('census.fetch', self.name, table=table) as record:
+            cache = self.get_fetcher().cache
+            fetched = cache.bytes_fetched
+
+            responses = self.fetch_all(spec['url'], years)
+
+            record['rows_out'] = len(responses)
+            record['bytes'] = cache.bytes_fetched - fetched
+
+        with stage('census.parse', self.name, table=table) as record:
+            record['rows_in'] = len(responses)
+            rows = 0
+
+            for year in years:
+                zipcodes, values = column_resolver.extract(
+                    table, year, {zipcode: responses[(year, zipcode)] for zipcode in self.zipcodes}
+                )
+                if not zipcodes:
+                    continue
+
+                for metric, metric_values in values.items():
+                    self.store.set(metric, year, zipcodes, metric_values)
+                rows += len(zipcodes)
+
+            record['rows_out'] = rows
+
+        # Save to storage
+        with stage('census.export', self.name, table=table):
+            for metric in spec['fields']:
+                self.storage.write(self.get_data(metric), os.path.join(self.resultsLocation, metric))
+
+    def save_journaled_table(self, table: str, years: list[str]) -> None:
+        """
+        Fetches the missing cells of a Census table through the journal, then saves every metric
+        of the table, extracted from the cached responses of the cells recorded in the journal.
+
+        Parameters:
+            table (str): The key of the table in CENSUS_TABLES.
+            years (list[str]): Years to fetch.
+        """
+        spec = CENSUS_TABLES[table]
+
+        with stage('census.fetch', self.name, table=table) as record:
+            cache = self.get_fetcher().cache
+            fetched = cache.bytes_fetched
+
+            record['rows_out'] = self.fetch_journaled(table, spec['url'], years)
+            record['bytes'] = cache.bytes_fetched - fetched
+
+        with stage('census.parse', self.name, table=table) as record:
+            # The journal may hold cells of zipcodes or years no longer requested
+            zipcodes, cells = set(self.zipcodes), {}
+            for (year, zipcode), url in self.journal.urls(self.name, table).items():
+                if year in years and zipcode in zipcodes:
+                    cells.setdefault((year, url), []).append(zipcode)
+
+            # Served from the response cache, unless a response was evicted since
+            responses = self.get_fetcher().fetch_many({(year, url): url for year, url in cells})
+            by_year = {}
+            for (year, url), cell_zipcodes in cells.items():
+                split = self.split_batch(responses[(year, url)], self.batch_zipcodes(url))
+                by_year.setdefault(year, {}).update({zipcode: split[zipcode] for zipcode in cell_zipcodes if self.has_data(split[zipcode])})
+
+            rows = 0
+            for year, responses_by_zipcode in by_year.items():
+                year_zipcodes, values = column_resolver.extract(table, year, responses_by_zipcode)
+                for metric, metric_values in values.items():
+                    self.store.set(metric, year, year_zipcodes, metric_values)
+                rows += len(year_zipcodes)
+
+            record['rows_in'] = len(responses)
+            record['rows_out'] = rows
+
+        with stage('census.export', self.name, table=table):
+            for metric in spec['fields']:
+                self.storage.write(self.get_data(metric), os.path.join(self.resultsLocation, metric))
+
     def save_income(self) -> None:
         """
         Fetches median household annual income for the zip codes and years stored in the BRTData object.
@@ -120,21 +484,7 @@ class BRTData(object):
         The resulting 'income' DataFrame is saved as a CSV file in the 'data/raw/{resultsLocation}' 
         directory of the BRTData object.
         """
-        for year in self.years:
-            for zipcode in self.zipcodes:
-                url = 'https://data.census.gov/api/access/data/table?g=860XX00US{zipcode}&id=ACSST5Y{year}.S1901'.format(zipcode = zipcode, year = year)
-                res = self.fetch_api_data(url)
-                if not res:
-                    continue
-
-                df = pd.DataFrame.from_dict(res)
-                self.income.loc[year][zipcode] = df['response']['data'][1][161]
-            
-            time.sleep(5)
-
-        # Save to CSV
-        path = os.path.join(self.resultsLocation, "income.csv")
-        self.income.to_csv(path, index=True)
+        self.save_table('S1901')
     
     def save_pop_age(self) -> None:
         """
@@ -143,33 +493,7 @@ class BRTData(object):
         The resulting 'age' and 'pop' DataFrames are saved as CSV files in the 'data/raw/{resultsLocation}' 
         directory of the BRTData object.
         """
-        for year in self.years:
-            if year in ['2013', '2014', '2015', '2016']:
-                age_index = 140
-                pop_index = 270
-            else: 
-                age_index = 111
-                pop_index = 277
-
-            for zipcode in self.zipcodes:
-                url = 'https://data.census.gov/api/access/data/table?g=860XX00US{zipcode}&id=ACSST5Y{year}.S0101'.format(zipcode = zipcode, year = year)
-                res = self.fetch_api_data(url)
-                if not res:
-                    continue
-
-                df = pd.DataFrame.from_dict(res)
-
-                self.age.loc[year][zipcode] = df['response']['data'][1][age_index]
-                self.pop.loc[year][zipcode] = df['response']['data'][1][pop_index]
-            
-            time.sleep(5)
-
-        # Save to CSV
-        age_path = os.path.join(self.resultsLocation, "age.csv")
-        pop_path = os.path.join(self.resultsLocation, "pop.csv")
-        
-        self.age.to_csv(age_path, index=True)
-        self.pop.to_csv(pop_path, index=True)
+        self.save_table('S0101')
     
     def save_household(self) -> None:
         """
@@ -179,45 +503,7 @@ class BRTData(object):
         The resulting 'house' DataFrame is saved as a CSV file in the 'data/raw/{resultsLocation}' 
         directory of the BRTData object.
         """
-        house_index = {'Married': 0, 'Nonfamily': 0, 'SingleMale': 0, 'SingleFemale': 0}
-
-        for year in self.years:
-            if year in ['2013', '2014', '2015', '2016']:
-                    house_index['Married'] = 31
-                    house_index['Nonfamily'] = 11
-                    house_index['SingleMale'] = 174
-                    house_index['SingleFemale'] = 118
-            else: 
-                house_index['Married'] = 863
-                house_index['Nonfamily'] = 346
-                house_index['SingleMale'] = 877
-                house_index['SingleFemale'] = 13
-
-            for zipcode in self.zipcodes:
-                url = 'https://data.census.gov/api/access/data/table?id=ACSST5Y{year}.S2501&g=860XX00US{zipcode}'.format(zipcode = zipcode, year = year)
-                res = self.fetch_api_data(url)
-                if not res:
-                    continue
-
-                df = pd.DataFrame.from_dict(res)
-
-                self.house_married.loc[year][zipcode] = df['response']['data'][1][house_index['Married']]
-                self.house_nonfam.loc[year][zipcode] = df['response']['data'][1][house_index['Nonfamily']]
-                self.house_m_single.loc[year][zipcode] = df['response']['data'][1][house_index['SingleMale']]
-                self.house_f_single.loc[year][zipcode] = df['response']['data'][1][house_index['SingleFemale']]
-            
-            time.sleep(5)
-
-        # Save to CSV
-        married_path = os.path.join(self.resultsLocation, "house_married.csv")
-        nonfam_path = os.path.join(self.resultsLocation, "house_nonfam.csv")
-        m_single_path = os.path.join(self.resultsLocation, "house_m_single.csv")
-        f_single_path = os.path.join(self.resultsLocation, "house_f_single.csv")
-        
-        self.house_married.to_csv(married_path, index=True)
-        self.house_nonfam.to_csv(nonfam_path, index=True)
-        self.house_m_single.to_csv(m_single_path, index=True)
-        self.house_f_single.to_csv(f_single_path, index=True)
+        self.save_table('S2501')
     
     def save_car_ownership(self) -> None:
         """
@@ -227,22 +513,7 @@ class BRTData(object):
         The resulting 'car' DataFrame is saved as a CSV file in the 'data/raw/{resultsLocation}' 
         directory of the BRTData object.
         """
-        for year in self.years:
-            for zipcode in self.zipcodes:
-                url = 'https://data.census.gov/api/access/data/table?g=860XX00US{zipcode}&id=ACSST5Y{year}.S0802'.format(zipcode = zipcode, year = year)
-                res = self.fetch_api_data(url)
-                if not res:
-                    continue
-
-                df = pd.DataFrame.from_dict(res)
-
-                self.car.loc[year][zipcode] = df['response']['data'][1][114]
-            
-            time.sleep(5)
-
-        # Save to CSV
-        path = os.path.join(self.resultsLocation, "car.csv")
-        self.car.to_csv(path, index=True)
+        self.save_table('S0802')
     
     def save_num_businesses(self) -> None:
         """
@@ -252,26 +523,45 @@ class BRTData(object):
         The resulting 'biz' DataFrame is saved as a CSV file in the 'data/raw/{resultsLocation}' 
         directory of the BRTData object.
         """
-        for year in self.years[:6]:
-            for zipcode in self.zipcodes:
-                url = 'https://data.census.gov/api/access/data/table?id=ZBP{year}.CB{year_short}00ZBP&g=860XX00US{zipcode}'.format(zipcode = zipcode, year = year, year_short = year[2:])
-                res = self.fetch_api_data(url)
-                if not res:
-                    continue
+        self.save_table('ZBP')
 
-                df = pd.DataFrame.from_dict(res)
+    def save_walkscore(self, client: WalkScoreClient, centroids: dict) -> None:
+        """
+        Fetches the Walk Score of the centroid of each zip code stored in the BRTData object.
+
+        Scores describe the present, so the resulting 'walkscore' DataFrame has a single row
+        labelled with the current year. It is saved as a CSV file in the 'data/raw/{resultsLocation}'
+        directory of the BRTData object.
+
+        Parameters:
+            client (WalkScoreClient): Client to fetch the scores with.
+            centroids (dict): A mapping of zip codes to the (lat, lon) of their centroid, e.g. from
+                zcta.ZCTAIndex.centroids. Zip codes without a centroid get no score.
+
+        Raises:
+            WalkScoreError: If the API rejects a request, e.g. QuotaExceeded, once the scores
+                fetched before it are saved.
+        """
+        error = None
+        with stage('walkscore.fetch', self.name) as record:
+            try:
+                scores = client.fetch_many({zipcode: centroids[zipcode] for zipcode in self.zipcodes if zipcode in centroids})
+            except WalkScoreError as e:
+                scores, error = e.scores, e
+            record['rows_out'] = sum(score is not None for score in scores.values())
+
+        year = datetime.date.today().year
+        self.walkscore = pd.DataFrame([scores], index=pd.Index([year], name='year'), columns=self.zipcodes, dtype=float)
+
+        with stage('walkscore.export', self.name):
+            self.storage.write(self.walkscore, os.path.join(self.resultsLocation, 'walkscore'))
+
+        if error is not None:
+            raise error
 
-                self.biz.loc[year][zipcode] = df['response']['data'][1][15]
-            
-            time.sleep(5)
-            
-        # Save to CSV
-        path = os.path.join(self.resultsLocation, "biz.csv")
-        self.biz.to_csv(path, index=True)
-    
 
 class NTDData(object):
-    def __init__(self) -> None:
+    def __init__(self, cache: ResponseCache = None, storage: Storage = None) -> None:
         # A single NTDData object can handle *all* the ntd-data
 
         # Locating ntd-ridership directory with raw data
@@ -279,46 +569,104 @@ class NTDData(object):
 
         self.data_dir = os.path.abspath(os.path.join(script_dir, "../../data/raw/ntd-ridership"))
 
+        # APTA archives are large and never change, so they are only downloaded once
+        self.cache = cache if cache is not None else ResponseCache()
+        self.storage = storage if storage is not None else Storage()
+
+        # Tables available on disk (name -> path without extension), read on first get_data
+        self.tables = {}
+        self.loaded = set()
+
     # --------------------------------------------
     # HELPER FUNCTIONS
     # --------------------------------------------
 
-    def fetch_zip_data(self, year, file_path):
+    def fetch_zip_data(self, year, file_path) -> dict:
+        """
+        Downloads (or reads from the cache) the APTA archive for a year, filters its metrics sheet
+        to bus rows and saves them as 'transit_data_{year}_filtered.csv'.
+
+        The archive member is streamed from the cached zip file on disk, and only NTD_COLUMNS are
+        parsed. The 2013 and 2014 sheets have merged header cells that are cleaned by hand after
+        download, so all of their columns are kept.
+
+        Parameters:
+            year (int): The year to fetch.
+            file_path (str): The path of the metrics spreadsheet inside the archive.
+
+        Returns:
+            dict: The year, number of rows saved and seconds taken.
+        """
+        start = time.perf_counter()
+
         # Edge cases
         if year == 2017:
-            url = requests.get('https://www.apta.com/wp-content/uploads/Resources/resources/statistics/Documents/NTD_Data/2017-National-Transit-Database.zip')
+            url = f'{APTA_URL}/Resources/resources/statistics/Documents/NTD_Data/2017-National-Transit-Database.zip'
         elif year == 2015:
-            url = requests.get('https://www.apta.com/wp-content/uploads/2015-NTD-Tables-APTA.zip')
+            url = f'{APTA_URL}/2015-NTD-Tables-APTA.zip'
         else:
-            url = requests.get(f'https://www.apta.com/wp-content/uploads/{year}-National-Transit-Database.zip')
+            url = f'{APTA_URL}/{year}-National-Transit-Database.zip'
 
-        zipfile = ZipFile(BytesIO(url.content))
+        usecols = None if year in (2013, 2014) else (lambda col: col in NTD_COLUMNS)
 
-        with zipfile.open(file_path) as f:
-            if year == 2013:
-                df = pd.read_excel(f, sheet_name="Op_Stats_Service", skiprows=[0])
-            else:
-                df = pd.read_excel(f, sheet_name="Metrics")
+        with stage('ntd.fetch', year=year) as record:
+            fetched = self.cache.bytes_fetched
+            archive = self.cache.open(url, lambda url, headers: requests.get(url, headers=headers))
+            record['bytes'] = self.cache.bytes_fetched - fetched
+
+        with archive, stage('ntd.parse', year=year) as record:
+            with ZipFile(archive).open(file_path) as f:
+                if year == 2013:
+                    df = pd.read_excel(f, sheet_name="Op_Stats_Service", skiprows=[0])
+                else:
+                    df = pd.read_excel(f, sheet_name="Metrics", usecols=usecols)
+
+            # Filter the DataFrame to rows where column J == 'RB'
+            df_filtered = df[df["Mode"] == "RB"]
 
-        # Filter the DataFrame to rows where column J == 'RB'
-        df_filtered = df[df["Mode"] == "RB"]
+            record['rows_in'] = len(df)
+            record['rows_out'] = len(df_filtered)
 
-        # Save the filtered data to a new CSV file
-        output_file = os.path.join(self.data_dir, f'transit_data_{year}_filtered.csv')
-        # output_file = os.path.join("../../data/raw/ntd-ridership", f'transit_data_{year}_filtered.csv')
-        df_filtered.to_csv(output_file, index=False)
+        # Save the filtered data to a new table, indexed by its first column like it is loaded
+        with stage('ntd.export', year=year):
+            output_file = os.path.join(self.data_dir, f'transit_data_{year}_filtered')
+            self.storage.write(df_filtered.set_index(df_filtered.columns[0]), output_file)
+
+        return {'year': year, 'rows': len(df_filtered), 'seconds': time.perf_counter() - start}
 
     def load_existing_data(self) -> None:
         """
-        Load existing data from CSV files in the results location directory and 
-        assign the data to object properties in the current NTDData object.
+        Index the existing tables in the results location directory. Each table is only read
+        and assigned to a property of the NTDData object on its first get_data access.
+        """
+        self.tables = {
+            name: os.path.join(self.data_dir, name)
+            for name in self.storage.list(self.data_dir)
+        }
+        self.loaded = set()
+
+    def load_table(self, name: str) -> None:
+        """
+        Read an indexed table from disk and assign it to the matching property.
+        """
+        with stage('ntd.load', table=name) as record:
+            data = self.storage.read(self.tables[name])
+            record['rows_out'] = len(data)
+
+        setattr(self, name, data)
+        self.loaded.add(name)
+
+    def unload(self, data: str = None) -> None:
+        """
+        Free a table loaded from disk. It is read again on its next get_data access.
+
+        Parameters:
+            data (str): The name of the table to unload. Defaults to all loaded tables.
         """
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".csv"):
-                print(filename)
-                csv_path = os.path.join(self.data_dir, filename)
-                csv_data = pd.read_csv(csv_path, index_col=0)
-                setattr(self, os.path.splitext(filename)[0], csv_data)
+        for name in [data] if data else list(self.loaded):
+            if name in self.loaded:
+                delattr(self, name)
+                self.loaded.remove(name)
 
     def get_data(self, data):
         """
@@ -330,6 +678,9 @@ class NTDData(object):
         Returns:
             The value of the specified property of the BRData object.
         """
+        if data in self.tables and data not in self.loaded:
+            self.load_table(data)
+
         try:
             return getattr(self, data)
         except AttributeError:
@@ -339,10 +690,19 @@ class NTDData(object):
     # DATA RETRIEVAL FUNCTIONS
     # --------------------------------------------
 
-    def save_data(self):
+    def save_data(self, max_workers: int = None, years: list[int] = None) -> None:
+        """
+        Fetches and saves the NTD data for every year in parallel, one process per year, since
+        parsing the Excel sheets is CPU-bound.
+
+        Parameters:
+            max_workers (int): Maximum number of worker processes. Defaults to one per year
+                (capped at the number of CPUs).
+            years (list[int]): The years to fetch. Defaults to 2013 and 2015-2020.
+        """
         # do the download like in data_retrieval_ntd.ipynb
-        years = [2013] + list(range(2015, 2021))
-        
+        years = years or [2013] + list(range(2015, 2021))
+
         file_paths = {
             2013: '2013-Table-19-Transit-Operating-Stats.xls',
             2014: '2014-Table-19-Transit-Operating-Stats.xls',
@@ -354,9 +714,16 @@ class NTDData(object):
             2020: '2020_Annual_Database_Files/Metrics_Static.xlsx'
         }
 
-        for year in years:
-            print(year)
-            self.fetch_zip_data(year, file_paths[year])
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(years), os.cpu_count())) as executor:
+            futures = [executor.submit(self.fetch_zip_data, year, file_paths[year]) for year in years]
+
+            for done, future in enumerate(as_completed(futures), 1):
+                report = future.result()
+                print(f"[{done}/{len(years)}] {report['year']}: {report['rows']} rows in {report['seconds']:.1f}s")
+
+        print(f'NTD data saved in {time.perf_counter() - start:.1f}s')
 
 
 if __name__ == "__main__":
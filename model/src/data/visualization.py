@@ -1,9 +1,379 @@
-# where you'll have a "summary" class that can create visual easily
-# e.g. medium article
-# class Summary:
-#     def __init__(self, data):
-#         pd.set_option('display.max_columns', None)
-#         pd.set_option('display.max_rows', None)
-#         self.df = pd.read_csv(data)
-#     def print_head(self):
-#         print(self.df.head())
+"""Module to render charts of the dataset and collect them in an HTML report.
+
+The Summary class reads `data/dataset` (one row per system and year, see process.py) and
+renders, as PNG files in `data/report/`:
+- for each system: its ridership trend, its features over time and, given a model, its
+  predicted against its actual ridership.
+- across systems: the ridership trends of every system, the distribution of each feature and,
+  given a model, predicted against actual ridership for every row.
+
+`index.html` shows them all. Figures are rendered with the headless Agg backend in a process
+pool. Each figure is keyed by a hash of its input data (and of this module's code) recorded
+in `data/report/figures.json`, so a figure whose data did not change is not rendered again:
+after a change to a few systems, only their figures and the cross-system ones are redrawn.
+Series longer than MAX_POINTS are downsampled before plotting.
+
+Example:
+    python visualization.py --model ../../models/linear.npz --workers 4
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from census_schema import METRICS
+from manifest import hash_file
+from storage import Storage
+
+TARGET = 'unlinked_passenger_trips'
+FEATURES = METRICS + ['walkscore', 'uza_population', 'voms', 'vehicle_revenue_miles']
+
+# Maximum number of points drawn per line or scatter
+MAX_POINTS = 2000
+
+DPI = 100
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.abspath(os.path.join(script_dir, "../../data"))
+REPORT_DIR = os.path.join(DATA_DIR, "report")
+MODELS_SRC_DIR = os.path.abspath(os.path.join(script_dir, "../models"))
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def data_hash(*parts) -> str:
+    """
+    Returns a hash of some DataFrames, Series or other picklable values. The index of a
+    DataFrame is left out: it only holds row positions, which shift when other systems change.
+    """
+    digest = hashlib.sha1()
+
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+            digest.update(str(list(part.columns) if isinstance(part, pd.DataFrame) else part.name).encode())
+        else:
+            digest.update(pickle.dumps(part))
+
+    return digest.hexdigest()
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int = MAX_POINTS) -> tuple:
+    """
+    Reduce a line to at most max_points points, keeping the lowest and highest point of each
+    of max_points / 2 buckets so that peaks and dips survive.
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    if len(x) <= max_points:
+        return x, y
+
+    edges = np.linspace(0, len(x), max_points // 2 + 1).astype(int)
+    filled = np.isnan(y)
+    keep = []
+
+    for start, end in zip(edges[:-1], edges[1:]):
+        if filled[start:end].all():
+            keep.append(start)
+            continue
+        bucket = y[start:end]
+        keep.extend(sorted({start + int(np.nanargmin(bucket)), start + int(np.nanargmax(bucket))}))
+
+    return x[keep], y[keep]
+
+def sample(df: pd.DataFrame, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    """
+    Returns at most max_points rows of a DataFrame, always the same ones for the same data.
+    """
+    if len(df) <= max_points:
+        return df
+
+    return df.sample(max_points, random_state=0)
+
+def predict(df: pd.DataFrame, model_path: str) -> pd.Series:
+    """
+    Returns the predictions of a model artifact (see models/train_model.py) for the rows of the
+    dataset, NaN for rows missing a feature.
+    """
+    # The model modules live next to this directory and are imported the same flat way
+    if MODELS_SRC_DIR not in sys.path:
+        sys.path.insert(0, MODELS_SRC_DIR)
+    from predict import predict_frame
+
+    return predict_frame(df, model_path)
+
+# --------------------------------------------
+# FIGURES
+# --------------------------------------------
+
+def plot_ridership(fig, data: pd.DataFrame, title: str) -> None:
+    ax = fig.add_subplot()
+    ax.plot(*downsample(data['year'], data[TARGET]), marker='o')
+    ax.set(title=title, xlabel='Year', ylabel='Unlinked passenger trips')
+
+def plot_features(fig, data: pd.DataFrame, title: str) -> None:
+    features = [feature for feature in FEATURES if feature in data]
+    cols = 4
+    rows = -(-len(features) // cols)
+
+    for i, feature in enumerate(features):
+        ax = fig.add_subplot(rows, cols, i + 1)
+        ax.plot(*downsample(data['year'], data[feature]), marker='.')
+        ax.set_title(feature, fontsize=9)
+        ax.tick_params(labelsize=7)
+
+    fig.suptitle(title)
+
+def plot_predicted(fig, data: pd.DataFrame, title: str) -> None:
+    ax = fig.add_subplot()
+    ax.plot(*downsample(data['year'], data[TARGET]), marker='o', label='actual')
+    ax.plot(*downsample(data['year'], data['predicted']), marker='x', linestyle='--', label='predicted')
+    ax.set(title=title, xlabel='Year', ylabel='Unlinked passenger trips')
+    ax.legend()
+
+def plot_trends(fig, data: pd.DataFrame, title: str) -> None:
+    ax = fig.add_subplot()
+    systems = data['system'].unique()
+
+    # Hundreds of lines are only readable as a faint mass with the few labelled ones on top
+    alpha = 1.0 if len(systems) <= 20 else 0.3
+    for system, rows in data.groupby('system', sort=False):
+        ax.plot(*downsample(rows['year'], rows[TARGET]), alpha=alpha, label=system if len(systems) <= 20 else None)
+
+    ax.set(title=title, xlabel='Year', ylabel='Unlinked passenger trips', yscale='log')
+    if len(systems) <= 20:
+        ax.legend(fontsize=7, ncol=2)
+
+def plot_distributions(fig, data: pd.DataFrame, title: str) -> None:
+    features = [feature for feature in FEATURES + [TARGET] if feature in data]
+    cols = 4
+    rows = -(-len(features) // cols)
+
+    for i, feature in enumerate(features):
+        ax = fig.add_subplot(rows, cols, i + 1)
+        ax.hist(data[feature].dropna(), bins=30)
+        ax.set_title(feature, fontsize=9)
+        ax.tick_params(labelsize=7)
+
+    fig.suptitle(title)
+
+def plot_scatter(fig, data: pd.DataFrame, title: str) -> None:
+    ax = fig.add_subplot()
+    data = sample(data.dropna(subset=[TARGET, 'predicted']))
+
+    ax.scatter(data[TARGET], data['predicted'], s=10, alpha=0.6)
+    if len(data):
+        low, high = data[[TARGET, 'predicted']].min().min(), data[[TARGET, 'predicted']].max().max()
+        ax.plot([low, high], [low, high], color='grey', linestyle='--')
+    ax.set(title=title, xlabel='Actual trips', ylabel='Predicted trips')
+
+# Fixed margins, as fractions of the figure: tight_layout draws every figure an extra time
+SINGLE = dict(left=0.14, right=0.96, bottom=0.12, top=0.9)
+GRID = dict(left=0.05, right=0.98, bottom=0.05, top=0.9, wspace=0.3, hspace=0.45)
+
+# (function, figure size in inches, margins) of each kind of figure
+FIGURES = {
+    'ridership': (plot_ridership, (6, 4), SINGLE),
+    'features': (plot_features, (12, 7), GRID),
+    'predicted': (plot_predicted, (6, 4), SINGLE),
+    'trends': (plot_trends, (9, 6), SINGLE),
+    'distributions': (plot_distributions, (12, 9), GRID),
+    'scatter': (plot_scatter, (6, 6), SINGLE),
+}
+
+def render_figure(task: tuple) -> str:
+    """
+    Render one figure to a PNG file. Runs in a worker process.
+
+    Parameters:
+        task (tuple): The kind of figure (one of FIGURES), its data, its title and the output path.
+
+    Returns:
+        str: The output path.
+    """
+    kind, data, title, path = task
+    plot, size, margins = FIGURES[kind]
+
+    fig = plt.figure(figsize=size, dpi=DPI)
+    try:
+        plot(fig, data, title)
+        fig.subplots_adjust(**margins)
+
+        # Written under a temporary name so the report never shows a partial image
+        tmp_path = f'{path}.{os.getpid()}.tmp.png'
+        fig.savefig(tmp_path, dpi=DPI)
+        os.replace(tmp_path, path)
+    finally:
+        plt.close(fig)
+
+    return path
+
+# --------------------------------------------
+# REPORT
+# --------------------------------------------
+
+class Summary(object):
+    def __init__(self, data: pd.DataFrame = None, predictions: pd.Series = None, output_dir: str = REPORT_DIR) -> None:
+        """
+        Charts of the dataset.
+
+        Parameters:
+            data (pandas.DataFrame): The dataset, indexed by year with a 'system' column. Defaults
+                to `data/dataset`.
+            predictions (pandas.Series): Predicted ridership of each row of data, e.g. from predict.
+                Predicted against actual figures are only drawn if given.
+            output_dir (str): Directory to write the figures and `index.html` to.
+        """
+        if data is None:
+            data = Storage().read(os.path.join(DATA_DIR, "dataset"))
+
+        self.data = data.rename_axis('year').reset_index()
+        if predictions is not None:
+            self.data['predicted'] = predictions.to_numpy()
+
+        self.output_dir = output_dir
+        self.figures_path = os.path.join(output_dir, "figures.json")
+
+        # Changes to the plotting code invalidate every figure
+        self.code_hash = hash_file(os.path.abspath(__file__))
+
+    def tasks(self) -> dict:
+        """
+        Returns the figures of the report as a mapping of file names to (kind, data, title) tuples.
+        """
+        tasks = {}
+        predicted = 'predicted' in self.data
+
+        for system, rows in self.data.groupby('system', sort=False):
+            title = system.replace('_', ' ').title()
+            tasks[f'{system}-ridership.png'] = ('ridership', rows, f'{title}: ridership')
+            tasks[f'{system}-features.png'] = ('features', rows, f'{title}: features')
+            if predicted:
+                tasks[f'{system}-predicted.png'] = ('predicted', rows, f'{title}: predicted vs actual')
+
+        tasks['all-trends.png'] = ('trends', self.data, 'Ridership of every system')
+        tasks['all-distributions.png'] = ('distributions', self.data, 'Feature distributions')
+        if predicted:
+            tasks['all-scatter.png'] = ('scatter', self.data, 'Predicted vs actual ridership')
+
+        return tasks
+
+    def render(self, workers: int = 1, force: bool = False) -> dict:
+        """
+        Render the figures whose data changed since they were last rendered.
+
+        Parameters:
+            workers (int): Number of worker processes. 1 renders in this process.
+            force (bool): Render every figure, changed or not.
+
+        Returns:
+            dict: A mapping of file names to the hash of the data of every figure of the report.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        previous = {}
+        if os.path.exists(self.figures_path) and not force:
+            with open(self.figures_path) as f:
+                previous = json.load(f)
+
+        hashes, stale = {}, []
+        for filename, (kind, data, title) in self.tasks().items():
+            path = os.path.join(self.output_dir, filename)
+            hashes[filename] = data_hash(self.code_hash, kind, title, data)
+
+            if previous.get(filename) != hashes[filename] or not os.path.exists(path):
+                stale.append((kind, data, title, path))
+
+        start = time.perf_counter()
+        if workers > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(render_figure, stale, chunksize=max(1, len(stale) // (workers * 4))))
+        else:
+            for task in stale:
+                render_figure(task)
+
+        print(f'Rendered {len(stale)} of {len(hashes)} figures in {time.perf_counter() - start:.2f} s')
+
+        # Figures of systems that are no longer in the dataset
+        for filename in set(previous) - set(hashes):
+            path = os.path.join(self.output_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+        with open(self.figures_path, 'w') as f:
+            json.dump(hashes, f, indent=2)
+
+        return hashes
+
+    def write_html(self, hashes: dict) -> str:
+        """
+        Write `index.html`, showing the cross-system figures then a section per system.
+
+        Returns:
+            str: The path of the report.
+        """
+        def image(filename):
+            # The hash in the query string makes browsers reload changed figures only
+            return f'<img src="{html.escape(filename)}?v={hashes[filename][:12]}" loading="lazy" alt="{html.escape(filename)}">'
+
+        latest = self.data.sort_values('year').groupby('system', sort=False).tail(1).set_index('system')
+        columns = [column for column in [TARGET] + FEATURES if column in latest]
+
+        sections = [
+            '<h2>All systems</h2>',
+            ''.join(image(filename) for filename in hashes if filename.startswith('all-')),
+            f'<h2>Latest year</h2>{latest[["year"] + columns].to_html(float_format=lambda value: f"{value:,.2f}")}',
+        ]
+        for system in self.data['system'].unique():
+            sections.append(f'<h2 id="{html.escape(system)}">{html.escape(system)}</h2>')
+            sections.append(''.join(image(filename) for filename in hashes if filename.startswith(f'{system}-')))
+
+        page = (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Transit dataset report</title>'
+            '<style>body{font-family:sans-serif;margin:2em}img{max-width:48%;margin:4px}'
+            'table{border-collapse:collapse;font-size:12px}td,th{padding:2px 6px;border:1px solid #ccc}</style>'
+            f'</head><body><h1>Transit dataset report</h1>{"".join(sections)}</body></html>'
+        )
+
+        path = os.path.join(self.output_dir, "index.html")
+        with open(path, 'w') as f:
+            f.write(page)
+
+        return path
+
+    def report(self, workers: int = 1, force: bool = False) -> str:
+        """
+        Render the changed figures and write the HTML report.
+
+        Returns:
+            str: The path of the report.
+        """
+        return self.write_html(self.render(workers, force))
+
+def main():
+    parser = argparse.ArgumentParser(description='Render charts of the dataset and an HTML report.')
+    parser.add_argument('--model', help='model artifact to draw predicted vs actual ridership with')
+    parser.add_argument('--output', default=REPORT_DIR, help='report directory (default: data/report)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='render every figure, even unchanged ones')
+    args = parser.parse_args()
+
+    data = Storage().read(os.path.join(DATA_DIR, "dataset"))
+    predictions = predict(data, args.model) if args.model else None
+
+    path = Summary(data, predictions, args.output).report(args.workers, args.force)
+    print(f'Report written to {path}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Module to fetch Walk Scores of zipcode centroids from the Walk Score API.
+
+The WalkScoreClient requests the score of many points concurrently. Requests share a token
+bucket (see fetch.py) for the per-second rate and a DailyQuota, persisted to
+`data/cache/walkscore_quota.json`, that counts the calls made each day against the API key's
+daily quota (5,000 calls by default) and stops before it is exceeded. If the API reports the quota exceeded anyway, QuotaExceeded
+is raised as well. A batch of points stops at the first such error, which hands back the
+scores fetched before it.
+
+Responses go through a ResponseCache (see cache.py) in `data/cache/walkscore/` whose entries
+expire after MAX_AGE, so scores are refreshed from time to time without spending quota on
+every run. The API key is read from the WALKSCORE_API_KEY environment variable and is not
+part of the cached URLs.
+
+Walk Scores describe the present, not a given year: BRTData.save_walkscore stores them as one
+row labelled with the year they were fetched.
+"""
+
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+import requests
+
+from cache import ResponseCache
+from fetch import TokenBucket
+
+WALKSCORE_URL = 'https://api.walkscore.com/score'
+
+# Seconds after which a cached score is fetched again
+MAX_AGE = 30 * 24 * 3600
+
+# Calls per day allowed by a default Walk Score API key
+DAILY_QUOTA = 5000
+
+# Values of the 'status' field of an API response
+STATUS_OK = 1
+STATUS_CALCULATING = 2
+STATUS_INVALID_KEY = 40
+STATUS_QUOTA_EXCEEDED = 41
+STATUS_BLOCKED = 42
+
+
+class WalkScoreError(RuntimeError):
+    """Raised when the Walk Score API rejects a request."""
+
+    # Scores fetched by WalkScoreClient.fetch_many before the error, None for the other points
+    scores = None
+
+
+class QuotaExceeded(WalkScoreError):
+    """Raised when the daily quota of the API key is used up."""
+
+
+class DailyQuota(object):
+    def __init__(self, limit: int = DAILY_QUOTA, path: str = None) -> None:
+        """
+        Thread-safe counter of the calls made today, persisted so that every run of the day
+        draws from the same quota.
+
+        Parameters:
+            limit (int): Calls allowed per day (UTC).
+            path (str): JSON file to persist the count in. None keeps it in memory.
+        """
+        self.limit = limit
+        self.path = path
+        self.lock = threading.Lock()
+        self.day, self.used = None, 0
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.day, self.used = state['day'], state['used']
+
+    def acquire(self) -> None:
+        """
+        Count a call, or raise QuotaExceeded if none is left today.
+        """
+        with self.lock:
+            today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+            if self.day != today:
+                self.day, self.used = today, 0
+
+            if self.used >= self.limit:
+                raise QuotaExceeded(f'Daily quota of {self.limit} Walk Score API calls used up')
+
+            self.used += 1
+            self.save()
+
+    def exhaust(self) -> None:
+        """
+        Mark today's quota as used up, e.g. when the API says so.
+        """
+        with self.lock:
+            self.day = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+            self.used = self.limit
+            self.save()
+
+    def save(self) -> None:
+        # Called with the lock held
+        if self.path:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump({'day': self.day, 'used': self.used}, f)
+
+
+class WalkScoreClient(object):
+    def __init__(self, api_key: str = None, max_workers: int = 4, rate: float = 2.0, daily_quota: int = DAILY_QUOTA,
+                 cache: ResponseCache = None, quota_path: str = None, timeout: float = 30.0) -> None:
+        """
+        Concurrent, quota-aware client of the Walk Score API.
+
+        Parameters:
+            api_key (str): The API key. Defaults to the WALKSCORE_API_KEY environment variable.
+            max_workers (int): Maximum number of requests in flight at once.
+            rate (float): Maximum sustained requests per second.
+            daily_quota (int): Calls allowed per day.
+            cache (ResponseCache): Cache for responses. Defaults to a ResponseCache in
+                `data/cache/walkscore/` whose entries expire after MAX_AGE.
+            quota_path (str): JSON file counting today's calls. Defaults to
+                `data/cache/walkscore_quota.json`.
+            timeout (float): Timeout in seconds for a single request.
+        """
+        self.api_key = api_key or os.environ.get('WALKSCORE_API_KEY')
+        if not self.api_key:
+            raise ValueError("No Walk Score API key, set the WALKSCORE_API_KEY environment variable")
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        cache_dir = os.path.abspath(os.path.join(script_dir, "../../data/cache"))
+        if cache is None:
+            cache = ResponseCache(os.path.join(cache_dir, "walkscore"), max_age=MAX_AGE)
+
+        self.url = WALKSCORE_URL
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+        self.limiter = TokenBucket(rate, max(1, int(rate)))
+        self.quota = DailyQuota(daily_quota, quota_path or os.path.join(cache_dir, "walkscore_quota.json"))
+        self.session = requests.Session()
+
+    # --------------------------------------------
+    # HELPER FUNCTIONS
+    # --------------------------------------------
+
+    def score_url(self, lat: float, lon: float, address: str = '') -> str:
+        """
+        Returns the URL of the score of a point, without the API key.
+        """
+        return f"{self.url}?{urlencode({'format': 'json', 'lat': f'{lat:.6f}', 'lon': f'{lon:.6f}', 'address': address})}"
+
+    def _get(self, url: str, headers: dict = None) -> requests.Response:
+        """
+        Perform a rate-limited, quota-counted request. Only called by the cache on a miss.
+        """
+        self.quota.acquire()
+        self.limiter.acquire()
+
+        response = self.session.get(f'{url}&wsapikey={self.api_key}', headers=headers, timeout=self.timeout)
+        if response.status_code != 200:
+            return response
+
+        # The API answers 200 with an error status in the body, which must not be cached
+        status = response.json().get('status')
+        if status == STATUS_QUOTA_EXCEEDED:
+            self.quota.exhaust()
+            raise QuotaExceeded('The Walk Score API reports the daily quota exceeded')
+        if status in (STATUS_INVALID_KEY, STATUS_BLOCKED):
+            raise WalkScoreError(f'The Walk Score API rejected the request (status {status})')
+        if status != STATUS_OK:
+            # e.g. a score still being calculated: handed back, but not cached
+            response.status_code = 202
+
+        return response
+
+    # --------------------------------------------
+    # FETCH FUNCTIONS
+    # --------------------------------------------
+
+    def fetch(self, lat: float, lon: float, address: str = '') -> float:
+        """
+        Returns the Walk Score of a point, or None if the API has no score for it.
+        """
+        content = self.cache.get(self.score_url(lat, lon, address), self._get)
+        if not content:
+            return None
+
+        res = json.loads(content)
+        if res.get('status') != STATUS_OK:
+            return None
+
+        return res.get('walkscore')
+
+    def fetch_many(self, points: dict) -> dict:
+        """
+        Returns the Walk Scores of many points, fetched concurrently.
+
+        Parameters:
+            points (dict): A mapping of keys (e.g. zipcodes) to (lat, lon) tuples.
+
+        Returns:
+            dict: A mapping of the same keys to scores (None where the API has no score).
+
+        Raises:
+            WalkScoreError: If a request is rejected, e.g. QuotaExceeded. The points not requested
+                yet are skipped, and the scores fetched so far are set as the error's `scores`.
+        """
+        scores = dict.fromkeys(points)
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch, *point, address=str(key)): key for key, point in points.items()}
+
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    scores[futures[future]] = future.result()
+                except WalkScoreError as e:
+                    # The other requests would be rejected too
+                    error = error or e
+                    for pending in futures:
+                        pending.cancel()
+
+        if error is not None:
+            error.scores = scores
+            raise error
+
+        return scores
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,232 @@
+"""Module to find the zipcodes (ZCTAs) around a point or along a transit corridor.
+
+The ZCTAIndex is a KD-tree over the centroid (internal point) of every ZIP Code Tabulation Area,
+read from the Census Gazetteer ZCTA file. The file is not part of the repository: download the
+national ZCTA Gazetteer file (e.g. `2020_Gaz_zcta_national.zip`) from
+https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html and
+unzip it to `data/raw/gazetteer/`, or point the TRANSIT_GAZETTEER environment variable to it.
+
+The first build parses the file and pickles the tree to `data/cache/zcta_index.pkl`, keyed by
+the file's size and modification time, so later builds only load the cache. Centroids are
+indexed as points on the unit sphere, so radius queries are exact great-circle queries.
+
+Example:
+    index = ZCTAIndex.load()
+    index.within(41.4993, -81.6944, radius_km=2)
+    index.along([(41.5005, -81.6879), (41.5034, -81.6045)], radius_km=1)
+"""
+
+import argparse
+import glob
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+GAZETTEER_DIR = os.path.abspath(os.path.join(script_dir, "../../data/raw/gazetteer"))
+CACHE_PATH = os.path.abspath(os.path.join(script_dir, "../../data/cache/zcta_index.pkl"))
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def gazetteer_path() -> str:
+    """
+    Returns the path of the Gazetteer ZCTA file: TRANSIT_GAZETTEER if set, otherwise the latest
+    `*_Gaz_zcta_national.txt` in GAZETTEER_DIR.
+    """
+    path = os.environ.get('TRANSIT_GAZETTEER')
+    if path:
+        return path
+
+    paths = sorted(glob.glob(os.path.join(GAZETTEER_DIR, '*_Gaz_zcta_national.txt')))
+    if not paths:
+        raise FileNotFoundError(
+            f"No Gazetteer ZCTA file in '{GAZETTEER_DIR}'. Download it from "
+            "https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html "
+            "or set TRANSIT_GAZETTEER to its path."
+        )
+
+    return paths[-1]
+
+def read_gazetteer(path: str) -> pd.DataFrame:
+    """
+    Returns the zipcode, latitude and longitude of every ZCTA of a Gazetteer file.
+    """
+    df = pd.read_csv(path, sep='\t', dtype={'GEOID': str})
+
+    # The last header of the file is padded with spaces
+    df.columns = df.columns.str.strip()
+
+    return pd.DataFrame({'zipcode': df['GEOID'].str.zfill(5), 'lat': df['INTPTLAT'], 'lon': df['INTPTLONG']})
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """
+    Returns the (n, 3) points of the unit sphere at some latitudes and longitudes (in degrees).
+    """
+    lat, lon = np.radians(np.atleast_1d(lat)), np.radians(np.atleast_1d(lon))
+
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def chord(distance_km: float) -> float:
+    """
+    Returns the straight-line distance on the unit sphere between two points a great-circle
+    distance apart.
+    """
+    return 2 * np.sin(min(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+def densify(polyline: list[tuple], spacing_km: float) -> np.ndarray:
+    """
+    Returns the (n, 2) latitudes and longitudes of points along a polyline, at most spacing_km apart.
+    """
+    polyline = np.asarray(polyline, dtype=float)
+    points = [polyline[:1]]
+
+    for start, end in zip(polyline[:-1], polyline[1:]):
+        length = np.linalg.norm(np.diff(to_unit_vectors([start[0], end[0]], [start[1], end[1]]), axis=0)) * EARTH_RADIUS_KM
+        steps = max(int(np.ceil(length / spacing_km)), 1)
+        points.append(start + np.outer(np.arange(1, steps + 1) / steps, end - start))
+
+    return np.concatenate(points)
+
+def segment_distances(points: np.ndarray, polyline: np.ndarray) -> np.ndarray:
+    """
+    Returns the distance in km of each (lat, lon) point to the nearest segment of a polyline,
+    computed in a local equirectangular projection (accurate for corridors of a city's size).
+    """
+    scale = np.array([1.0, np.cos(np.radians(polyline[:, 0].mean()))]) * np.radians(1) * EARTH_RADIUS_KM
+    points, polyline = points * scale, polyline * scale
+
+    distances = np.full(len(points), np.inf)
+    for start, end in zip(polyline[:-1], polyline[1:]):
+        segment = end - start
+        length = segment @ segment
+        t = np.clip(((points - start) @ segment) / length, 0, 1) if length else np.zeros(len(points))
+        distances = np.minimum(distances, np.linalg.norm(points - (start + np.outer(t, segment)), axis=1))
+
+    return distances
+
+# --------------------------------------------
+# ZCTA INDEX
+# --------------------------------------------
+
+class ZCTAIndex(object):
+    def __init__(self, zipcodes: list[str], lat: np.ndarray, lon: np.ndarray) -> None:
+        """
+        Parameters:
+            zipcodes (list[str]): The zipcode of each centroid.
+            lat (numpy.ndarray): Latitude of each centroid, in degrees.
+            lon (numpy.ndarray): Longitude of each centroid, in degrees.
+        """
+        self.zipcodes = np.asarray(zipcodes)
+        self.coords = np.column_stack([lat, lon]).astype(float)
+        self.tree = cKDTree(to_unit_vectors(lat, lon))
+
+    @classmethod
+    def load(cls, path: str = None, cache_path: str = CACHE_PATH) -> 'ZCTAIndex':
+        """
+        Returns the index of a Gazetteer file, from the cache if it was built from the same file.
+
+        Parameters:
+            path (str): The Gazetteer ZCTA file. Defaults to gazetteer_path().
+            cache_path (str): Where the built index is pickled. None disables the cache.
+        """
+        path = path or gazetteer_path()
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                cached_key, index = pickle.load(f)
+            if cached_key == key:
+                return index
+
+        df = read_gazetteer(path)
+        index = cls(df['zipcode'].tolist(), df['lat'].to_numpy(), df['lon'].to_numpy())
+
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'wb') as f:
+                pickle.dump((key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return index
+
+    def centroids(self, zipcodes: list[str]) -> dict:
+        """
+        Returns a mapping of zipcodes to the (lat, lon) of their centroid. Zipcodes without a
+        ZCTA (e.g. PO box zipcodes) are left out.
+        """
+        rows = dict(zip(self.zipcodes.tolist(), range(len(self.zipcodes))))
+
+        return {
+            zipcode: tuple(self.coords[rows[zipcode]].tolist())
+            for zipcode in zipcodes
+            if zipcode in rows
+        }
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> list[str]:
+        """
+        Returns the k zipcodes whose centroids are nearest to a point, nearest first.
+        """
+        _, rows = self.tree.query(to_unit_vectors(lat, lon)[0], k=k)
+
+        return self.zipcodes[np.atleast_1d(rows)].tolist()
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list[str]:
+        """
+        Returns the zipcodes whose centroids are within a radius of a point, nearest first.
+        """
+        point = to_unit_vectors(lat, lon)[0]
+        rows = np.array(self.tree.query_ball_point(point, chord(radius_km)), dtype=int)
+
+        order = np.argsort(np.linalg.norm(self.tree.data[rows] - point, axis=1), kind='stable')
+        return self.zipcodes[rows[order]].tolist()
+
+    def along(self, polyline: list[tuple], radius_km: float) -> list[str]:
+        """
+        Returns the zipcodes whose centroids are within a buffer around a corridor, in order
+        along the corridor.
+
+        Parameters:
+            polyline (list[tuple]): The (lat, lon) vertices of the corridor, in degrees.
+            radius_km (float): Width of the buffer on each side of the corridor.
+        """
+        polyline = np.asarray(polyline, dtype=float)
+        samples = densify(polyline, radius_km)
+
+        # Any point within the buffer is within radius_km * 1.5 of a sample, so no candidate is missed
+        candidates = self.tree.query_ball_point(to_unit_vectors(samples[:, 0], samples[:, 1]), chord(radius_km * 1.5))
+        first_sample = {}
+        for sample, rows in enumerate(candidates):
+            for row in rows:
+                first_sample.setdefault(row, sample)
+
+        rows = np.array(sorted(first_sample, key=first_sample.get), dtype=int)
+        if not len(rows):
+            return []
+
+        inside = segment_distances(self.coords[rows], polyline) <= radius_km
+        return self.zipcodes[rows[inside]].tolist()
+
+    def __len__(self) -> int:
+        return len(self.zipcodes)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List the zipcodes around a point or along a corridor.')
+    parser.add_argument('points', nargs='+', help='lat,lon of a point, or of each vertex of a corridor')
+    parser.add_argument('--radius', type=float, default=1.0, help='buffer radius in km (default: 1)')
+    parser.add_argument('--gazetteer', help='Gazetteer ZCTA file (default: TRANSIT_GAZETTEER or data/raw/gazetteer/)')
+    args = parser.parse_args()
+
+    index = ZCTAIndex.load(args.gazetteer)
+    points = [tuple(map(float, point.split(','))) for point in args.points]
+
+    if len(points) == 1:
+        print(index.within(*points[0], radius_km=args.radius))
+    else:
+        print(index.along(points, radius_km=args.radius))
@@ -0,0 +1,300 @@
+"""Module to cross-validate the ridership models and search their hyperparameters.
+
+A single random train/test split of the dataset puts rows of the same system (and of
+neighbouring years) on both sides, which inflates the score. This module instead evaluates
+models with grouped cross-validation:
+
+- system: leave-one-system-out. Each fold tests on every row of one system, trained on the
+  other systems.
+- time: expanding window. Each fold tests on one year, trained on all earlier years.
+
+Out-of-fold predictions are pooled to compute one R-squared and RMSE per candidate.
+
+Hyperparameter candidates come from PARAM_GRIDS, either the full grid or a random sample of
+it, and are evaluated in parallel on a process pool, each worker limited to one thread. Folds
+are cached in `data/cache/folds` keyed by the dataset's content hash, the features and the
+spec of the derived ones, and the fold layout. The results are written as a JSON report.
+
+Example:
+    python evaluation.py --cv system time --search random --n-iter 10
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from feature_engineering import DERIVED_FEATURES
+from train_model import DATASET_PATH, FEATURES, MODEL_TYPES, MODELS_DIR, dataset_file, load_dataset, make_model, r2_score
+
+CV_SCHEMES = ['system', 'time']
+
+# Years only trained on before the first time fold
+MIN_TRAIN_YEARS = 2
+
+# Environment variables that cap the threads of the OpenMP and BLAS libraries loaded after them
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+# Candidate values of each model's hyperparameters
+PARAM_GRIDS = {
+    'linear': {},
+    'ridge': {'alpha': [0.01, 0.1, 0.3, 1.0, 3.0, 10.0, 30.0, 100.0]},
+    'gbm': {
+        'learning_rate': [0.03, 0.1, 0.3],
+        'max_iter': [100, 300],
+        'max_depth': [2, 3, None],
+        'min_samples_leaf': [3, 5, 10],
+    },
+    'rf': {
+        'n_estimators': [200, 500],
+        'max_depth': [3, 6, None],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': [0.5, 1.0],
+    },
+}
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+FOLDS_DIR = os.path.abspath(os.path.join(script_dir, "../../data/cache/folds"))
+REPORT_PATH = os.path.join(MODELS_DIR, "evaluation.json")
+
+# --------------------------------------------
+# FOLDS
+# --------------------------------------------
+
+def system_folds(systems: np.ndarray, years: np.ndarray) -> tuple:
+    """
+    Returns leave-one-system-out folds as (names, train masks, test masks), one mask row per fold.
+    """
+    names = np.unique(systems)
+    test = systems[None, :] == names[:, None]
+
+    return names.astype(str), ~test, test
+
+def time_folds(systems: np.ndarray, years: np.ndarray, min_train_years: int = MIN_TRAIN_YEARS) -> tuple:
+    """
+    Returns expanding-window folds as (names, train masks, test masks): each fold tests on one
+    year and trains on every earlier year. The first min_train_years years are only trained on.
+    """
+    names = np.unique(years)[min_train_years:]
+    test = years[None, :] == names[:, None]
+    train = years[None, :] < names[:, None]
+
+    return names.astype(str), train, test
+
+FOLD_SCHEMES = {
+    'system': system_folds,
+    'time': time_folds,
+}
+
+def dataset_hash(path: str, features: list[str]) -> str:
+    """
+    Returns a hash of the dataset file, the features and the spec of the derived features,
+    which decide together which rows are complete.
+    """
+    digest = hashlib.sha256(','.join(features).encode())
+    digest.update(json.dumps(DERIVED_FEATURES, sort_keys=True).encode())
+
+    with open(dataset_file(path), 'rb') as f:
+        digest.update(f.read())
+
+    return digest.hexdigest()[:16]
+
+def load_folds(scheme: str, systems: np.ndarray, years: np.ndarray, key: str, folds_dir: str = FOLDS_DIR,
+               min_train_years: int = MIN_TRAIN_YEARS) -> tuple:
+    """
+    Returns the folds of a CV scheme, from the cache if the dataset and the fold layout haven't changed.
+
+    Parameters:
+        scheme (str): One of CV_SCHEMES.
+        systems (numpy.ndarray): The system of each dataset row.
+        years (numpy.ndarray): The year of each dataset row.
+        key (str): Content hash of the dataset and features, see dataset_hash.
+        folds_dir (str): Directory of the fold cache.
+        min_train_years (int): Years only trained on by the time folds, see time_folds.
+
+    Returns:
+        tuple: The fold names, and boolean train and test masks of shape (folds, rows).
+    """
+    options = {'min_train_years': min_train_years} if scheme == 'time' else {}
+    path = os.path.join(folds_dir, '-'.join([key, scheme] + [str(value) for value in options.values()]) + '.npz')
+
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached['names'].tolist(), cached['train'], cached['test']
+
+    names, train, test = FOLD_SCHEMES[scheme](systems, years, **options)
+
+    os.makedirs(folds_dir, exist_ok=True)
+    np.savez_compressed(path, names=names, train=train, test=test)
+
+    return names.tolist(), train, test
+
+# --------------------------------------------
+# SEARCH
+# --------------------------------------------
+
+def grid_candidates(kind: str) -> list[dict]:
+    """
+    Returns every combination of a model's hyperparameter values.
+    """
+    grid = PARAM_GRIDS[kind]
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+def random_candidates(kind: str, n_iter: int, seed: int = 42) -> list[dict]:
+    """
+    Returns up to n_iter distinct combinations of a model's hyperparameter values, drawn at random.
+    """
+    candidates = grid_candidates(kind)
+    if len(candidates) <= n_iter:
+        return candidates
+
+    return random.Random(seed).sample(candidates, n_iter)
+
+# Dataset and folds of each worker process, set once by init_worker
+_worker = {}
+
+def init_worker(X: np.ndarray, y: np.ndarray, folds: dict) -> None:
+    """
+    Set the dataset and folds of a worker process and limit it to one thread: candidates run in
+    parallel processes, so BLAS or OpenMP threads within each (e.g. of gbm) would oversubscribe
+    the CPU.
+    """
+    # Libraries loaded from now on, e.g. the OpenMP runtime that scikit-learn loads on import
+    os.environ.update({name: '1' for name in THREAD_VARIABLES})
+
+    # Libraries already loaded, e.g. the BLAS of NumPy in a forked worker
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:  # installed with scikit-learn, which only gbm and rf need
+        pass
+    else:
+        threadpool_limits(limits=1)
+
+    _worker.update(X=X, y=y, folds=folds)
+
+def evaluate_candidate(task: tuple) -> dict:
+    """
+    Cross-validate one model type with one set of hyperparameters under one CV scheme.
+
+    Parameters:
+        task (tuple): (model type, hyperparameters, CV scheme).
+
+    Returns:
+        dict: Pooled out-of-fold R-squared and RMSE, the RMSE of each fold and the wall time.
+    """
+    kind, params, scheme = task
+    X, y = _worker['X'], _worker['y']
+    names, train, test = _worker['folds'][scheme]
+
+    start = time.perf_counter()
+    predictions = np.full(len(y), np.nan)
+    fold_rmse = {}
+
+    for name, train_mask, test_mask in zip(names, train, test):
+        # Forests are parallelized across candidates, not within one
+        model_params = {**params, 'n_jobs': 1} if kind == 'rf' else params
+        model = make_model(kind, **model_params).fit(X[train_mask], y[train_mask])
+
+        predictions[test_mask] = model.predict(X[test_mask])
+        fold_rmse[name] = float(np.sqrt(np.mean((y[test_mask] - predictions[test_mask]) ** 2)))
+
+    tested = ~np.isnan(predictions)
+
+    return {
+        'model': kind,
+        'params': params,
+        'cv': scheme,
+        'r2': float(r2_score(y[tested], predictions[tested])),
+        'rmse': float(np.sqrt(np.mean((y[tested] - predictions[tested]) ** 2))),
+        'fold_rmse': fold_rmse,
+        'seconds': time.perf_counter() - start,
+    }
+
+def search(kinds: list[str] = MODEL_TYPES, schemes: list[str] = CV_SCHEMES, method: str = 'grid', n_iter: int = 10,
+           features: list[str] = FEATURES, path: str = DATASET_PATH, workers: int = None, seed: int = 42,
+           min_train_years: int = MIN_TRAIN_YEARS) -> dict:
+    """
+    Cross-validate every hyperparameter candidate of several model types in parallel.
+
+    Parameters:
+        kinds (list[str]): Model types to evaluate, from MODEL_TYPES.
+        schemes (list[str]): CV schemes to evaluate with, from CV_SCHEMES.
+        method (str): 'grid' for every candidate, or 'random' for n_iter random candidates per model type.
+        n_iter (int): Number of candidates per model type for random search.
+        features (list[str]): Feature columns to train on.
+        path (str): Path of the dataset, see train_model.dataset_file.
+        workers (int): Number of worker processes. Defaults to the number of CPUs.
+        seed (int): Seed of the random search.
+        min_train_years (int): Years only trained on by the time folds, see time_folds.
+
+    Returns:
+        dict: The report, with every result and the best candidate per model type and CV scheme.
+    """
+    start = time.perf_counter()
+
+    X, y, systems, years = load_dataset(path, features)
+    key = dataset_hash(path, features)
+    folds = {scheme: load_folds(scheme, systems, years, key, min_train_years=min_train_years) for scheme in schemes}
+
+    tasks = []
+    for kind in kinds:
+        candidates = grid_candidates(kind) if method == 'grid' else random_candidates(kind, n_iter, seed)
+        tasks += [(kind, params, scheme) for params in candidates for scheme in schemes]
+
+    print(f'Evaluating {len(tasks)} candidates on {len(y)} rows')
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(X, y, folds)) as executor:
+        results = list(executor.map(evaluate_candidate, tasks))
+
+    best = {}
+    for result in results:
+        name = f"{result['model']}/{result['cv']}"
+        if name not in best or result['r2'] > best[name]['r2']:
+            best[name] = result
+
+    for name, result in sorted(best.items()):
+        print(f"  {name}: R-squared {result['r2']:.4f}, RMSE {result['rmse']:.0f}, params {result['params']}")
+
+    seconds = time.perf_counter() - start
+    print(f'Done in {seconds:.1f} s')
+
+    return {
+        'dataset': {'path': path, 'hash': key, 'rows': len(y), 'features': features},
+        'folds': {scheme: names for scheme, (names, _, _) in folds.items()},
+        'search': {'method': method, 'n_iter': n_iter if method == 'random' else None, 'seed': seed},
+        'seconds': seconds,
+        'best': best,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate ridership models and search their hyperparameters.')
+    parser.add_argument('--models', nargs='+', choices=MODEL_TYPES, default=MODEL_TYPES, help='model types (default: all)')
+    parser.add_argument('--cv', nargs='+', choices=CV_SCHEMES, default=CV_SCHEMES, help='CV schemes (default: all)')
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid', help='search method (default: grid)')
+    parser.add_argument('--n-iter', type=int, default=10, help='candidates per model type for random search (default: 10)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-train-years', type=int, default=MIN_TRAIN_YEARS, help=f'years only trained on by the time folds (default: {MIN_TRAIN_YEARS})')
+    parser.add_argument('--features', nargs='+', default=FEATURES, help='feature columns (default: all)')
+    parser.add_argument('--dataset', default=DATASET_PATH, help='.csv or .parquet file of the dataset (default: data/dataset in the TRANSIT_STORAGE format)')
+    parser.add_argument('--output', default=REPORT_PATH, help='report path (default: models/evaluation.json)')
+    args = parser.parse_args()
+
+    report = search(args.models, args.cv, args.search, args.n_iter, args.features, args.dataset, args.workers, args.seed,
+                    args.min_train_years)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'Report written to {args.output}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Module to derive temporal features from the (system, year) panel of the dataset.
+
+The dataset holds raw levels only, one row per system and year. DERIVED_FEATURES
+declares the features built from them, each as an operation over columns of the dataset or
+over derived features declared before it:
+
+- lag: the value `years` years earlier.
+- growth: the relative change over `years` years, e.g. year-over-year growth.
+- rolling_mean: the mean over the last `years` years, NaN unless all of them are known.
+- ratio: one value divided by another, e.g. per-capita values.
+
+Lags are calendar-based: a system's missing year makes the following lag NaN rather than
+pulling in an older year. All features are computed for every system at once: the panel is
+laid out as a (year x system) grid per column, so each operation is a single array
+expression with no per-system loop.
+
+Derived features are memoized to `data/cache/features`, keyed by a hash of the input columns
+and of the spec, so the same features are never recomputed. train_model.load_dataset and
+predict.predict_frame add the derived features a model uses on the fly, so they can be passed
+to `--features` like any column of the dataset.
+
+A feature that reads the same year's ridership (e.g. `trips_per_capita`) describes the target
+and is refused as a model feature, see target_lag.
+
+Example:
+    python feature_engineering.py trips_lag1 vrm_per_vom
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TARGET = 'unlinked_passenger_trips'
+
+# Derived features in dependency order: an operation may use a feature declared above it
+DERIVED_FEATURES = {
+    'trips_lag1': {'op': 'lag', 'of': TARGET, 'years': 1},
+    'trips_lag2': {'op': 'lag', 'of': TARGET, 'years': 2},
+    'trips_growth_lag1': {'op': 'growth', 'of': 'trips_lag1', 'years': 1},
+    'trips_mean3_lag1': {'op': 'rolling_mean', 'of': 'trips_lag1', 'years': 3},
+    'trips_per_capita': {'op': 'ratio', 'of': [TARGET, 'uza_population']},
+    'trips_per_capita_lag1': {'op': 'ratio', 'of': ['trips_lag1', 'uza_population']},
+    'income_growth': {'op': 'growth', 'of': 'income', 'years': 1},
+    'pop_growth': {'op': 'growth', 'of': 'pop', 'years': 1},
+    'car_growth': {'op': 'growth', 'of': 'car', 'years': 1},
+    'voms_growth': {'op': 'growth', 'of': 'voms', 'years': 1},
+    'vrm_growth': {'op': 'growth', 'of': 'vehicle_revenue_miles', 'years': 1},
+    'vrm_mean3': {'op': 'rolling_mean', 'of': 'vehicle_revenue_miles', 'years': 3},
+    'vrm_per_vom': {'op': 'ratio', 'of': ['vehicle_revenue_miles', 'voms']},
+    'vrm_per_capita': {'op': 'ratio', 'of': ['vehicle_revenue_miles', 'uza_population']},
+}
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.abspath(os.path.join(script_dir, "../../data/cache/features"))
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def inputs(spec: dict) -> list[str]:
+    """
+    Returns the name of each value an operation reads.
+    """
+    return spec['of'] if isinstance(spec['of'], list) else [spec['of']]
+
+def dataset_columns(spec: dict = DERIVED_FEATURES) -> list[str]:
+    """
+    Returns the columns of the dataset that a spec reads, in the order they are first used.
+    """
+    columns = []
+    for feature in spec.values():
+        columns += [name for name in inputs(feature) if name not in spec and name not in columns]
+
+    return columns
+
+def target_lag(name: str, spec: dict = DERIVED_FEATURES) -> float:
+    """
+    Returns the most recent year, counted back from a row's own year, of the target that a
+    column or derived feature reads: 0 if it reads the row's own ridership, inf if none.
+    """
+    if name == TARGET:
+        return 0
+    if name not in spec:
+        return np.inf
+
+    feature = spec[name]
+    lag = min(target_lag(value, spec) for value in inputs(feature))
+
+    return lag + feature['years'] if feature['op'] == 'lag' else lag
+
+def shift(grid: np.ndarray, years: int) -> np.ndarray:
+    """
+    Returns a (year x system) grid moved down by some years, so each cell holds the value of
+    `years` years earlier.
+    """
+    shifted = np.full_like(grid, np.nan)
+    if years < len(grid):
+        shifted[years:] = grid[:len(grid) - years]
+
+    return shifted
+
+def divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    Element-wise division where a zero denominator gives NaN instead of inf.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = numerator / denominator
+
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+# Operations on (year x system) grids, given the grids of their inputs
+OPERATIONS = {
+    'lag': lambda values, years: shift(values[0], years),
+    'growth': lambda values, years: divide(values[0], shift(values[0], years)) - 1,
+    'rolling_mean': lambda values, years: np.mean([shift(values[0], k) for k in range(years)], axis=0),
+    'ratio': lambda values, years: divide(values[0], values[1]),
+}
+
+def spec_hash(df: pd.DataFrame, spec: dict) -> str:
+    """
+    Returns a hash of the panel columns a spec reads and of the spec itself.
+    """
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode())
+
+    panel = df[['system'] + dataset_columns(spec)]
+    digest.update(pd.util.hash_pandas_object(panel, index=True).to_numpy().tobytes())
+
+    return digest.hexdigest()[:16]
+
+# --------------------------------------------
+# FEATURE FUNCTIONS
+# --------------------------------------------
+
+def compute_features(df: pd.DataFrame, spec: dict = DERIVED_FEATURES) -> pd.DataFrame:
+    """
+    Compute every feature of a spec for every row of the panel in one vectorized pass.
+
+    Parameters:
+        df (pandas.DataFrame): The panel, indexed by year with a 'system' column and the
+            columns the spec reads, at most one row per system and year.
+        spec (dict): The derived features, see DERIVED_FEATURES.
+
+    Returns:
+        pandas.DataFrame: One column per derived feature, with the index of df.
+    """
+    missing = [column for column in dataset_columns(spec) if column not in df]
+    if missing:
+        raise KeyError(f"Columns needed by the derived features are missing: {missing}")
+
+    years = df.index.to_numpy(dtype=np.int64)
+    systems, system_rows = np.unique(df['system'].to_numpy(), return_inverse=True)
+    year_rows = years - years.min()
+
+    if len(np.unique(year_rows * len(systems) + system_rows)) != len(df):
+        raise ValueError("The panel has more than one row for a system and year")
+
+    # Each column becomes a (year x system) grid holding NaN where a system has no row
+    grids = {}
+    for column in dataset_columns(spec):
+        grid = np.full((year_rows.max() + 1, len(systems)), np.nan)
+        grid[year_rows, system_rows] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+        grids[column] = grid
+
+    for name, feature in spec.items():
+        grids[name] = OPERATIONS[feature['op']]([grids[value] for value in inputs(feature)], feature.get('years'))
+
+    return pd.DataFrame({name: grids[name][year_rows, system_rows] for name in spec}, index=df.index)
+
+def load_features(df: pd.DataFrame, spec: dict = DERIVED_FEATURES, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """
+    Returns the derived features of a panel, from the cache if they were computed from the
+    same data and spec before.
+
+    Parameters:
+        df (pandas.DataFrame): The panel, see compute_features.
+        spec (dict): The derived features, see DERIVED_FEATURES.
+        cache_dir (str): Directory of the feature cache. None disables the cache.
+    """
+    if cache_dir is None:
+        return compute_features(df, spec)
+
+    path = os.path.join(cache_dir, f"{spec_hash(df, spec)}.npz")
+
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return pd.DataFrame(cached['values'], index=df.index, columns=cached['names'].tolist())
+
+    features = compute_features(df, spec)
+
+    # Written under a temporary name so that concurrent runs never read a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, names=np.array(list(spec)), values=features.to_numpy())
+    os.replace(tmp_path, path)
+
+    return features
+
+def add_features(df: pd.DataFrame, names: list[str], spec: dict = DERIVED_FEATURES, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """
+    Returns a panel with the derived features among some names added as columns. Names that
+    are already columns of the panel are left as they are.
+    """
+    derived = [name for name in names if name not in df]
+
+    unknown = [name for name in derived if name not in spec]
+    if unknown:
+        raise KeyError(f"Unknown features {unknown}, expected columns of the dataset or one of {list(spec)}")
+
+    if not derived:
+        return df
+
+    # Assigned by position: the year index of a panel repeats for every system
+    features = load_features(df, spec, cache_dir)
+    return df.assign(**{name: features[name].to_numpy() for name in derived})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Print derived features of the dataset.')
+    parser.add_argument('features', nargs='*', help='derived features to print (default: all)')
+    parser.add_argument('--dataset', help='.csv or .parquet file of the dataset (default: data/dataset in the TRANSIT_STORAGE format)')
+    args = parser.parse_args()
+
+    # Imported here: train_model imports this module
+    from train_model import DATASET_PATH, read_dataset
+
+    data = read_dataset(args.dataset or DATASET_PATH)
+    names = args.features or list(DERIVED_FEATURES)
+    print(add_features(data, names)[['system'] + names].to_string())
@@ -0,0 +1,283 @@
+"""Module to score ridership with a model trained by train_model.py.
+
+The Predictor class loads a model artifact once, warms it up, and scores single rows or
+batches of feature vectors given as NumPy arrays (no pandas in the hot path). Linear models
+are scored with a single matrix-vector product.
+
+Running this module serves the predictor over a local HTTP/JSON endpoint:
+
+    python predict.py --model ../../models/linear.npz --port 8000
+
+- POST /predict with {"instances": [[...], ...]} (feature vectors in the model's feature
+  order) or {"instances": [{"income": ..., ...}, ...]} returns {"predictions": [...]}.
+  Derived features of the model (e.g. trips_lag1) are part of the instances: they need a
+  system's earlier years, which a single row does not have.
+- GET /metrics returns request count and p50/p99 latencies in milliseconds.
+- GET /health returns the model type and features.
+
+Concurrent requests are micro-batched: rows arriving within a short window are scored
+together in one call to the model.
+
+predict_frame scores a whole DataFrame at once, e.g. for `transit.py predict`.
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import add_features
+from train_model import MODELS_DIR, LinearModel, load_model
+
+
+class Predictor(object):
+    def __init__(self, path: str, warmup: int = 100) -> None:
+        """
+        Load a model artifact and warm it up.
+
+        Parameters:
+            path (str): Path of a model artifact saved by train_model.save_model.
+            warmup (int): Number of warm-up predictions to run at startup.
+        """
+        self.model, self.kind, self.features = load_model(path)
+        self.n_features = len(self.features)
+
+        # Linear models skip the model object entirely
+        if isinstance(self.model, LinearModel):
+            self.coef = np.ascontiguousarray(self.model.coef)
+            self.intercept = self.model.intercept
+        else:
+            self.coef = None
+
+        dummy = np.zeros((1, self.n_features))
+        for _ in range(warmup):
+            self.predict(dummy)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Score one feature vector or a batch of them.
+
+        Parameters:
+            X (numpy.ndarray): A feature vector of shape (features,) or a batch of shape (rows, features).
+
+        Returns:
+            numpy.ndarray: One prediction per row, of shape (rows,).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        # sklearn models reject an empty batch, which has no predictions for any model
+        if not len(X):
+            return np.empty(0)
+
+        if self.coef is not None:
+            return X @ self.coef + self.intercept
+        return self.model.predict(X)
+
+    def to_matrix(self, instances: list) -> np.ndarray:
+        """
+        Convert JSON instances (lists in feature order, or dicts keyed by feature name) to a matrix.
+
+        Raises ValueError unless every instance has exactly the model's features.
+        """
+        if not isinstance(instances, list):
+            raise ValueError("'instances' must be a list of feature vectors")
+        if not instances:
+            return np.empty((0, self.n_features))
+
+        if isinstance(instances[0], dict):
+            instances = [[row[feature] for feature in self.features] for row in instances]
+
+        X = np.asarray(instances, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected instances of {self.n_features} features ({', '.join(self.features)}), got an array of shape {X.shape}")
+
+        return X
+
+
+def predict_frame(df: pd.DataFrame, model_path: str) -> pd.Series:
+    """
+    Score the rows of a DataFrame holding the model's features, e.g. the dataset. Derived
+    features (see feature_engineering.py) are added if the model uses them. Rows missing a
+    feature are scored NaN.
+    """
+    predictor = Predictor(model_path, warmup=0)
+    df = add_features(df, predictor.features)
+    complete = df[predictor.features].notna().all(axis=1).to_numpy()
+
+    predictions = np.full(len(df), np.nan)
+    if complete.any():
+        predictions[complete] = predictor.predict(df.loc[complete, predictor.features].to_numpy(dtype=np.float64))
+
+    return pd.Series(predictions, index=df.index, name='predicted')
+
+
+class MicroBatcher(object):
+    def __init__(self, predictor: Predictor, max_batch: int = 256, max_wait: float = 0.001) -> None:
+        """
+        Collect rows from concurrent callers and score them together.
+
+        Parameters:
+            predictor (Predictor): The predictor to score batches with.
+            max_batch (int): Maximum number of rows scored at once.
+            max_wait (float): Seconds to wait for more rows after the first one arrives.
+        """
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, X: np.ndarray) -> Future:
+        """
+        Queue a (rows, features) matrix for scoring and return a Future of its predictions.
+        """
+        future = Future()
+        self.pending.put((X, future))
+        return future
+
+    def run(self) -> None:
+        while True:
+            batch = [self.pending.get()]
+            rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+
+            while rows < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            try:
+                predictions = self.predictor.predict(np.concatenate([X for X, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Hand each caller back its own slice of the batch
+            offset = 0
+            for X, future in batch:
+                future.set_result(predictions[offset:offset + len(X)])
+                offset += len(X)
+
+
+class LatencyTracker(object):
+    def __init__(self, window: int = 10000) -> None:
+        """
+        Keep the latencies of the most recent requests and report percentiles over them.
+        """
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            latencies = np.array(self.latencies)
+            count = self.count
+
+        if not len(latencies):
+            return {'requests': count, 'p50_ms': None, 'p99_ms': None}
+
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        return {'requests': count, 'p50_ms': round(p50, 4), 'p99_ms': round(p99, 4)}
+
+
+def make_handler(predictor: Predictor, batcher: MicroBatcher, tracker: LatencyTracker):
+    class PredictHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            if self.path == '/metrics':
+                self.send_json(200, tracker.summary())
+            elif self.path == '/health':
+                self.send_json(200, {'model': predictor.kind, 'features': predictor.features})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self) -> None:
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'not found'})
+                return
+
+            start = time.perf_counter()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                X = predictor.to_matrix(body['instances'])
+                predictions = batcher.submit(X).result()
+            except (KeyError, ValueError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+
+            tracker.record(time.perf_counter() - start)
+            self.send_json(200, {'predictions': predictions.tolist()})
+
+        def log_message(self, format, *args) -> None:
+            # Per-request logging would dominate the latency
+            pass
+
+    return PredictHandler
+
+
+def serve(model_path: str, host: str = '127.0.0.1', port: int = 8000, max_batch: int = 256, max_wait: float = 0.001) -> None:
+    """
+    Serve a model over HTTP until interrupted.
+    """
+    predictor = Predictor(model_path)
+    batcher = MicroBatcher(predictor, max_batch, max_wait)
+    tracker = LatencyTracker()
+
+    server = ThreadingHTTPServer((host, port), make_handler(predictor, batcher, tracker))
+    print(f'Serving {predictor.kind} model on http://{host}:{port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve ridership predictions over HTTP.')
+    parser.add_argument('--model', default=os.path.join(MODELS_DIR, 'linear.npz'), help='model artifact path (default: models/linear.npz)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=256, help='maximum rows scored together (default: 256)')
+    parser.add_argument('--max-wait-ms', type=float, default=1.0, help='micro-batching window in ms (default: 1)')
+    args = parser.parse_args()
+
+    serve(args.model, args.host, args.port, args.max_batch, args.max_wait_ms / 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Module to train a ridership model on the combined dataset and export it for later use.
+
+This module fits a model predicting `unlinked_passenger_trips` from the features of
+the dataset (created by data/process.py) and saves it as a compact `.npz` artifact
+in the `models/` directory, which models/predict.py loads.
+
+The following model types are supported:
+- linear / ridge: closed-form (ridge) least squares on NumPy arrays, solved through a single
+  SVD so that any number of regularization strengths can be fitted at once.
+- gbm / rf: scikit-learn's histogram gradient boosting and random forest regressors, using
+  all cores. scikit-learn is only imported when one of these is requested.
+
+Features are columns of the dataset or derived features declared in feature_engineering.py,
+e.g. lagged ridership or per-capita service, which are computed (or read from their cache)
+when the dataset is loaded.
+
+The dataset is read through data/storage.py, in the TRANSIT_STORAGE format like it was
+written, unless `--dataset` names a `.csv` or `.parquet` file.
+
+Example:
+    python train_model.py --model ridge --alpha 1.0
+    python train_model.py --model ridge --features income pop voms trips_lag1 vrm_per_capita
+"""
+
+import argparse
+import io
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import add_features, target_lag
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The data modules live next to this directory and are imported the same flat way
+DATA_SRC_DIR = os.path.abspath(os.path.join(script_dir, "../data"))
+if DATA_SRC_DIR not in sys.path:
+    sys.path.insert(0, DATA_SRC_DIR)
+from storage import FORMATS, Storage
+
+TARGET = 'unlinked_passenger_trips'
+FEATURES = ['income', 'pop', 'age', 'house_married', 'house_nonfam', 'house_m_single', 'house_f_single', 'car', 'biz', 'uza_population', 'voms', 'vehicle_revenue_miles']
+MODEL_TYPES = ['linear', 'ridge', 'gbm', 'rf']
+
+# Path of the dataset table, without extension (see storage.py)
+DATASET_PATH = os.path.abspath(os.path.join(script_dir, "../../data/dataset"))
+MODELS_DIR = os.path.abspath(os.path.join(script_dir, "../../models"))
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def dataset_file(path: str = DATASET_PATH) -> str:
+    """
+    Returns the file of a dataset: the path itself if it is a `.csv` or `.parquet` file,
+    otherwise the table at that path stem, preferably in the TRANSIT_STORAGE format.
+    """
+    if any(path.endswith(fmt.extension) for fmt in FORMATS.values()):
+        return path
+
+    _, file_path = Storage().find(path)
+    if file_path is None:
+        raise FileNotFoundError(f"No dataset found at '{path}', run data/process.py first")
+
+    return file_path
+
+def read_dataset(path: str = DATASET_PATH) -> pd.DataFrame:
+    """
+    Read the dataset, see dataset_file.
+    """
+    path_stem, extension = os.path.splitext(dataset_file(path))
+    fmt = next(name for name, fmt in FORMATS.items() if fmt.extension == extension)
+
+    return Storage(fmt).read(path_stem)
+
+def load_dataset(path: str = DATASET_PATH, features: list[str] = FEATURES) -> tuple:
+    """
+    Load the dataset and return its complete rows as NumPy arrays.
+
+    Parameters:
+        path (str): Path of the dataset, see dataset_file.
+        features (list[str]): Feature columns to return: columns of the dataset or derived
+            features (see feature_engineering.py).
+
+    Returns:
+        tuple: The feature matrix X (float64), the target vector y, and the system and year of each row.
+    """
+    leaking = [feature for feature in features if target_lag(feature) == 0]
+    if leaking:
+        raise ValueError(f"Features {leaking} read the ridership of the year they predict")
+
+    data = add_features(read_dataset(path), features)
+    data = data[data[features + [TARGET]].notna().all(axis=1)]
+
+    X = data[features].to_numpy(dtype=np.float64)
+    y = data[TARGET].to_numpy(dtype=np.float64)
+
+    return X, y, data['system'].to_numpy(), data.index.to_numpy()
+
+def ridge_path(X: np.ndarray, y: np.ndarray, alphas) -> tuple:
+    """
+    Fit ridge regressions for many regularization strengths at once.
+
+    Features are standardized and the target centered, then the problem is solved through one
+    SVD of X: each alpha only costs a rescaling of the singular values.
+
+    Parameters:
+        X (numpy.ndarray): Feature matrix of shape (rows, features).
+        y (numpy.ndarray): Target vector of shape (rows,).
+        alphas: Regularization strengths. 0 gives ordinary least squares.
+
+    Returns:
+        tuple: Coefficients of shape (len(alphas), features) and intercepts of shape
+        (len(alphas),), both in the original feature units.
+    """
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1
+    y_mean = y.mean()
+
+    U, s, Vt = np.linalg.svd((X - mean) / scale, full_matrices=False)
+    Uty = U.T @ (y - y_mean)
+
+    # Singular values below the numerical rank are dropped like lstsq does for alpha = 0
+    keep = s > s[0] * max(X.shape) * np.finfo(np.float64).eps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = np.where(keep, s / (s ** 2 + alphas[:, None]), 0)
+
+    coef = (d * Uty) @ Vt / scale
+    intercept = y_mean - coef @ mean
+
+    return coef, intercept
+
+def r2_score(y: np.ndarray, y_pred: np.ndarray) -> float:
+    return 1 - np.sum((y - y_pred) ** 2) / np.sum((y - y.mean()) ** 2)
+
+# --------------------------------------------
+# MODELS
+# --------------------------------------------
+
+class LinearModel(object):
+    def __init__(self, alpha: float = 0.0) -> None:
+        """
+        Ridge regression solved in closed form. alpha = 0 is ordinary least squares.
+        """
+        self.alpha = alpha
+        self.coef = None
+        self.intercept = None
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> 'LinearModel':
+        coef, intercept = ridge_path(X, y, [self.alpha])
+        self.coef, self.intercept = coef[0], intercept[0]
+
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.coef + self.intercept
+
+def make_model(kind: str, **params):
+    """
+    Returns an unfitted model of a given type.
+
+    Parameters:
+        kind (str): One of MODEL_TYPES.
+        **params: Keyword arguments for the model, e.g. alpha for ridge or max_iter for gbm.
+    """
+    if kind == 'linear':
+        return LinearModel(0.0)
+    if kind == 'ridge':
+        return LinearModel(**params)
+
+    # Tree ensembles come from scikit-learn, which is slow to import and only needed here
+    if kind == 'gbm':
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(**params)
+    if kind == 'rf':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(**{'n_jobs': -1, **params})
+
+    raise ValueError(f"Unknown model type '{kind}', expected one of {MODEL_TYPES}")
+
+# --------------------------------------------
+# SERIALIZATION
+# --------------------------------------------
+
+def save_model(model, kind: str, features: list[str], path: str) -> None:
+    """
+    Save a fitted model as a compressed .npz artifact.
+
+    Linear models are stored as plain arrays so they can be loaded without any dependency
+    other than NumPy. Other models are stored pickled inside the archive.
+    """
+    arrays = {'kind': np.array(kind), 'features': np.array(features)}
+
+    if isinstance(model, LinearModel):
+        arrays['coef'] = model.coef
+        arrays['intercept'] = np.array(model.intercept)
+    else:
+        arrays['pickle'] = np.frombuffer(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+def load_model(path: str) -> tuple:
+    """
+    Load a model saved by save_model.
+
+    Returns:
+        tuple: The fitted model, its type and its feature names.
+    """
+    with np.load(path) as artifact:
+        kind = str(artifact['kind'])
+        features = artifact['features'].tolist()
+
+        if 'coef' in artifact:
+            model = LinearModel()
+            model.coef = artifact['coef']
+            model.intercept = float(artifact['intercept'])
+        else:
+            model = pickle.load(io.BytesIO(artifact['pickle'].tobytes()))
+
+    return model, kind, features
+
+# --------------------------------------------
+# TRAINING
+# --------------------------------------------
+
+def train(kind: str = 'linear', features: list[str] = FEATURES, path: str = DATASET_PATH, output: str = None, **params) -> tuple:
+    """
+    Train a model on the dataset, report the wall time of each stage and optionally save it.
+
+    Parameters:
+        kind (str): One of MODEL_TYPES.
+        features (list[str]): Feature columns to train on.
+        path (str): Path of the dataset, see dataset_file.
+        output (str): Path to save the model artifact to. Not saved if None.
+        **params: Keyword arguments for the model.
+
+    Returns:
+        tuple: The fitted model and a dict of stage timings in seconds.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    X, y, _, _ = load_dataset(path, features)
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = make_model(kind, **params).fit(X, y)
+    timings['fit'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    r2 = r2_score(y, model.predict(X))
+    timings['score'] = time.perf_counter() - start
+
+    if output:
+        start = time.perf_counter()
+        save_model(model, kind, features, output)
+        timings['save'] = time.perf_counter() - start
+
+    print(f'{kind}: trained on {len(y)} rows, {len(features)} features, in-sample R-squared {r2:.4f}')
+    for stage, seconds in timings.items():
+        print(f'  {stage}: {seconds * 1000:.1f} ms')
+
+    return model, timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a ridership model on the dataset.')
+    parser.add_argument('--model', choices=MODEL_TYPES, default='linear', help='model type (default: linear)')
+    parser.add_argument('--alpha', type=float, default=1.0, help='ridge regularization strength (default: 1.0)')
+    parser.add_argument('--features', nargs='+', default=FEATURES, help='dataset columns or derived features (see feature_engineering.py) (default: all columns)')
+    parser.add_argument('--dataset', default=DATASET_PATH, help='.csv or .parquet file of the dataset (default: data/dataset in the TRANSIT_STORAGE format)')
+    parser.add_argument('--output', help='artifact path (default: models/<model>.npz)')
+    args = parser.parse_args()
+
+    params = {'alpha': args.alpha} if args.model == 'ridge' else {}
+    output = args.output or os.path.join(MODELS_DIR, f'{args.model}.npz')
+
+    train(args.model, args.features, args.dataset, output, **params)
+
+if __name__ == "__main__":
+    main()
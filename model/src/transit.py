@@ -0,0 +1,285 @@
+"""Command-line entry point of the whole pipeline.
+
+Every stage is a subcommand:
+
+    python transit.py fetch         # make_dataset.py: download the raw Census, NTD and Walk Score data
+    python transit.py preprocess    # preprocess.py: process the raw data of every system
+    python transit.py build         # process.py: assemble the dataset
+    python transit.py train         # models/train_model.py: train a model on the dataset
+    python transit.py predict       # models/predict.py: score the dataset, or serve a model over HTTP
+    python transit.py report        # visualization.py: render the charts and the HTML report
+    python transit.py status        # what was fetched, processed and built for each system
+    python transit.py cache         # size of each cache in data/cache
+
+This module only imports the standard library. The stage modules, and with them pandas,
+numpy, requests or matplotlib, are imported by the subcommand that runs them, so `--help`,
+`status` and `cache` start without loading any of them. The scripts can still be run on their
+own as before.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.abspath(os.path.join(script_dir, "../data"))
+MODELS_DIR = os.path.abspath(os.path.join(script_dir, "../models"))
+
+# The stage modules import each other by name, as when they are run as scripts
+for directory in ['models', 'data']:
+    path = os.path.join(script_dir, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Extensions of the table formats of storage.py
+TABLE_EXTENSIONS = ('.csv', '.parquet')
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def count_tables(directory: str) -> int:
+    """
+    Returns the number of tables in a directory, 0 if it does not exist.
+    """
+    if not os.path.isdir(directory):
+        return 0
+
+    return len({os.path.splitext(filename)[0] for filename in os.listdir(directory) if filename.endswith(TABLE_EXTENSIONS)})
+
+def table_exists(path_stem: str) -> bool:
+    return any(os.path.exists(path_stem + extension) for extension in TABLE_EXTENSIONS)
+
+def disk_usage(path: str) -> tuple:
+    """
+    Returns the number of files and total size in bytes of a file or directory tree.
+    """
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+
+    files, size = 0, 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(root, filename))
+
+    return files, size
+
+def format_size(size: int) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+# --------------------------------------------
+# PIPELINE COMMANDS
+# --------------------------------------------
+
+def fetch(args) -> int:
+    import make_dataset
+
+    make_dataset.main(args.offline)
+    return 0
+
+def preprocess(args) -> int:
+    import preprocess
+
+    return 1 if preprocess.main(args.workers, args.incremental) else 0
+
+def build(args) -> int:
+    import process
+
+    process.main(args.incremental)
+    return 0
+
+def train(args) -> int:
+    import train_model
+
+    features = args.features or train_model.FEATURES
+    dataset = args.dataset or train_model.DATASET_PATH
+    params = {'alpha': args.alpha} if args.model == 'ridge' else {}
+    output = args.output or os.path.join(MODELS_DIR, f'{args.model}.npz')
+
+    train_model.train(args.model, features, dataset, output, **params)
+    return 0
+
+def predict(args) -> int:
+    model = args.model or os.path.join(MODELS_DIR, 'linear.npz')
+
+    if args.serve:
+        from predict import serve
+
+        serve(model, args.host, args.port, args.max_batch, args.max_wait_ms / 1000)
+        return 0
+
+    from predict import predict_frame
+    from train_model import DATASET_PATH, TARGET, read_dataset
+
+    data = read_dataset(args.dataset or DATASET_PATH)
+    predictions = data[['system', TARGET]].assign(predicted=predict_frame(data, model))
+
+    predictions.to_csv(args.output or sys.stdout)
+    return 0
+
+def report(args) -> int:
+    from storage import Storage
+    from visualization import REPORT_DIR, Summary, predict
+
+    data = Storage().read(os.path.join(DATA_DIR, "dataset"))
+    predictions = predict(data, args.model) if args.model else None
+
+    path = Summary(data, predictions, args.output or REPORT_DIR).report(args.workers, args.force)
+    print(f'Report written to {path}')
+    return 0
+
+# --------------------------------------------
+# INSPECTION COMMANDS
+# --------------------------------------------
+
+def status(args) -> int:
+    """
+    Print, for each system, the raw tables fetched, the journal's progress, and whether its
+    processed table and its rows of the dataset were built. Only reads files: with --stale,
+    the build manifest also hashes the inputs to tell which systems preprocess would redo.
+    """
+    from registry import SYSTEMS
+
+    manifest = {'processed': {}, 'dataset': {}}
+    manifest_path = os.path.join(DATA_DIR, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    # Read-only: a DownloadJournal would create a missing journal, wait for the write lock of a
+    # running fetch, and replace a journal of an older schema
+    journal_counts = {}
+    journal_path = os.path.join(DATA_DIR, "cache", "journal.sqlite")
+    if os.path.exists(journal_path):
+        from journal import COUNTS_QUERY, DONE, SCHEMA_VERSION
+
+        connection = sqlite3.connect(f'file:{journal_path}?mode=ro', uri=True)
+        try:
+            # The cells of an older schema are dropped by the next fetch, so they are reported as none
+            if connection.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+                for system, status, count in connection.execute(COUNTS_QUERY):
+                    journal_counts.setdefault(system, {})[status] = count
+        finally:
+            connection.close()
+
+    stale = set()
+    if args.stale:
+        from manifest import BuildManifest
+
+        stale = set(BuildManifest().stale_systems(list(SYSTEMS)))
+
+    columns = ['system', 'ntd_id', 'zipcodes', 'raw', 'journal', 'processed', 'dataset'] + (['stale'] if args.stale else [])
+    rows = []
+    for system, spec in SYSTEMS.items():
+        counts = journal_counts.get(system)
+        row = [
+            system,
+            spec['ntd_id'],
+            str(len(spec['zipcodes'])),
+            str(count_tables(os.path.join(DATA_DIR, "raw", system))),
+            f"{counts.get(DONE, 0)}/{sum(counts.values())}" if counts else '-',
+            'yes' if table_exists(os.path.join(DATA_DIR, "processed", system)) and system in manifest['processed'] else 'no',
+            'yes' if system in manifest['dataset'] else 'no',
+        ]
+        if args.stale:
+            row.append('yes' if system in stale else 'no')
+        rows.append(row)
+
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    for row in [columns] + rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+    dataset = 'built' if table_exists(os.path.join(DATA_DIR, "dataset")) else 'missing'
+    print(f"\nNTD tables: {count_tables(os.path.join(DATA_DIR, 'raw', 'ntd-ridership'))}, dataset: {dataset}")
+    return 0
+
+def cache(args) -> int:
+    """
+    Print the number of files and the size of each cache in data/cache.
+    """
+    cache_dir = os.path.join(DATA_DIR, "cache")
+    if not os.path.isdir(cache_dir):
+        print(f'No cache in {cache_dir}')
+        return 0
+
+    total_files, total_size = 0, 0
+    for name in sorted(os.listdir(cache_dir)):
+        files, size = disk_usage(os.path.join(cache_dir, name))
+        total_files, total_size = total_files + files, total_size + size
+        print(f'{name:<32} {files:>8} files {format_size(size):>10}')
+
+    print(f"{'total':<32} {total_files:>8} files {format_size(total_size):>10}")
+    return 0
+
+# --------------------------------------------
+# COMMAND LINE
+# --------------------------------------------
+
+def make_parser() -> argparse.ArgumentParser:
+    """
+    Returns the parser of every subcommand. Defaults that live in a stage module are left as
+    None here and filled in by the subcommand, so that parsing never imports the stage.
+    """
+    parser = argparse.ArgumentParser(prog='transit', description='Run the stages of the BRT ridership pipeline.')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    command = commands.add_parser('fetch', help='download the raw data of every system')
+    command.add_argument('--offline', action='store_true', help='only use cached responses')
+    command.set_defaults(run=fetch)
+
+    command = commands.add_parser('preprocess', help='process the raw data of every system')
+    command.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1, serial)')
+    command.add_argument('--incremental', action='store_true', help='only process systems whose inputs changed')
+    command.set_defaults(run=preprocess)
+
+    command = commands.add_parser('build', help='assemble the processed systems into the dataset')
+    command.add_argument('--incremental', action='store_true', help='only replace the rows of systems that changed')
+    command.set_defaults(run=build)
+
+    command = commands.add_parser('train', help='train a ridership model on the dataset')
+    command.add_argument('--model', choices=['linear', 'ridge', 'gbm', 'rf'], default='linear', help='model type (default: linear)')
+    command.add_argument('--alpha', type=float, default=1.0, help='ridge regularization strength (default: 1.0)')
+    command.add_argument('--features', nargs='+', help='dataset columns or derived features (see feature_engineering.py) (default: all columns)')
+    command.add_argument('--dataset', help='.csv or .parquet file of the dataset (default: data/dataset in the TRANSIT_STORAGE format)')
+    command.add_argument('--output', help='artifact path (default: models/<model>.npz)')
+    command.set_defaults(run=train)
+
+    command = commands.add_parser('predict', help='score the dataset with a model, or serve it over HTTP')
+    command.add_argument('--model', help='model artifact path (default: models/linear.npz)')
+    command.add_argument('--dataset', help='.csv or .parquet file of the dataset to score (default: data/dataset in the TRANSIT_STORAGE format)')
+    command.add_argument('--output', help='CSV to write the predictions to (default: standard output)')
+    command.add_argument('--serve', action='store_true', help='serve the model over HTTP instead (see models/predict.py)')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8000)
+    command.add_argument('--max-batch', type=int, default=256, help='maximum rows scored together (default: 256)')
+    command.add_argument('--max-wait-ms', type=float, default=1.0, help='micro-batching window in ms (default: 1)')
+    command.set_defaults(run=predict)
+
+    command = commands.add_parser('report', help='render the charts of the dataset and an HTML report')
+    command.add_argument('--model', help='model artifact to draw predicted vs actual ridership with')
+    command.add_argument('--output', help='report directory (default: data/report)')
+    command.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: all cores)')
+    command.add_argument('--force', action='store_true', help='render every figure, even unchanged ones')
+    command.set_defaults(run=report)
+
+    command = commands.add_parser('status', help='show what was fetched, processed and built for each system')
+    command.add_argument('--stale', action='store_true', help='also hash the inputs to list the systems preprocess would redo')
+    command.set_defaults(run=status)
+
+    command = commands.add_parser('cache', help='show the size of each cache')
+    command.set_defaults(run=cache)
+
+    return parser
+
+def main(argv: list[str] = None) -> int:
+    args = make_parser().parse_args(argv)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
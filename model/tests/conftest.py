@@ -0,0 +1,76 @@
+"""Shared fixtures of the test suite.
+
+The tests run in a throw-away workspace (see benchmarks/synthetic.make_workspace): its `src`
+modules are links to the real ones, so every data path they compute points into the
+workspace and the tests never read or write the real `data/` directory. The modules import
+each other by name, as when they are run as scripts, so the workspace's source directories
+are put on sys.path before any test module is imported.
+
+Network access goes to the local StubServer of benchmarks/stub_server.py.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(tests_dir, "../benchmarks")))
+
+import synthetic
+from stub_server import StubServer, patched_urls
+
+WORKSPACE = tempfile.mkdtemp(prefix='transit-tests-')
+DATA_DIR = os.path.join(WORKSPACE, "data")
+FIXTURES_DIR = os.path.join(tests_dir, "fixtures")
+
+sys.path[:0] = [synthetic.make_workspace(WORKSPACE), os.path.join(WORKSPACE, "src", "models"), os.path.join(WORKSPACE, "src")]
+
+
+def pytest_sessionfinish(session, exitstatus) -> None:
+    shutil.rmtree(WORKSPACE, ignore_errors=True)
+
+
+@pytest.fixture
+def stub():
+    """
+    A running StubServer that the Census, APTA and Walk Score URLs point at.
+    """
+    with StubServer() as server, patched_urls(server.url):
+        yield server
+
+
+@pytest.fixture
+def workspace():
+    """
+    The workspace with freshly generated raw Census data of the systems of registry.SYSTEMS,
+    5 zipcodes each over 8 years, and NTD data.
+
+    Returns the generated system names and their NTD IDs.
+    """
+    return synthetic.populate(WORKSPACE, n_zipcodes=5)
+
+
+@pytest.fixture
+def panel():
+    """
+    A small dataset like process.py builds: 6 systems over 2013-2022, one row per system and
+    year indexed by year, with one missing value.
+    """
+    import numpy as np
+    import pandas as pd
+    from train_model import FEATURES, TARGET
+
+    rng = np.random.default_rng(0)
+    years = list(range(2013, 2023))
+    systems = [f'system_{i}' for i in range(6)]
+
+    df = pd.DataFrame({'system': np.repeat(systems, len(years))}, index=pd.Index(years * len(systems), name='year'))
+    for feature in FEATURES:
+        df[feature] = rng.lognormal(10, 1, size=len(df)).round(2)
+    df[TARGET] = (df['vehicle_revenue_miles'] * 2 + df['pop'] + rng.normal(0, 100, size=len(df))).round()
+    df.iloc[3, df.columns.get_loc('biz')] = np.nan
+
+    return df
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from aggregate import ZipAggregator
+from conftest import DATA_DIR
+from preprocess import process_brt_batch, process_brt_data
+from transit_data import BRTData
+
+
+@pytest.fixture
+def brts(workspace):
+    # The last system has more zipcodes than the others, so the batch pads them
+    synthetic.write_raw_tables(DATA_DIR, {list(workspace)[-1]: None}, 9, synthetic.year_names(8), seed=1)
+
+    brts = []
+    for system in workspace:
+        brt = BRTData(system)
+        brt.load_existing_data()
+        brts.append(brt)
+
+    return brts
+
+
+def test_one_pass_matches_aggregating_each_system(brts):
+    aggregator = ZipAggregator()
+    batch, batch_quality = aggregator.aggregate_systems(brts, quality=True)
+
+    for brt in brts:
+        df, quality = aggregator.aggregate(brt, quality=True)
+
+        pd.testing.assert_frame_equal(batch.loc[brt.name], df, check_names=False)
+        pd.testing.assert_frame_equal(batch_quality.loc[[brt.name]], quality)
+
+
+def test_process_brt_batch_matches_process_brt_data(brts):
+    results = process_brt_batch(brts)
+
+    assert list(results) == [brt.name for brt in brts]
+    for brt in brts:
+        df, quality = process_brt_data(brt, quality=True)
+
+        pd.testing.assert_frame_equal(results[brt.name][0], df)
+        pd.testing.assert_frame_equal(results[brt.name][1], quality)
+
+
+def test_weights_ignore_missing_and_negative_populations():
+    aggregator = ZipAggregator(metrics=['income', 'pop'])
+    tensor = np.array([[[1.0, 2.0, 3.0]], [[10.0, -5.0, np.nan]]])
+
+    assert aggregator.weights(tensor).tolist() == [[[10.0, 0.0, 0.0]]]
+    assert aggregator.reduce(tensor)[0].tolist() == [1.0]
+
+
+def test_unknown_reducer_is_refused():
+    with pytest.raises(ValueError):
+        ZipAggregator({'income': 'mode'})
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+import requests
+
+from cache import CacheMiss, ResponseCache
+from census_schema import CENSUS_TABLES
+
+
+def table_url(zipcode: str, year: str = '2019') -> str:
+    return CENSUS_TABLES['S1901']['url'].format(geo=f'860XX00US{zipcode}', year=year)
+
+
+def get(url: str, headers: dict = None) -> requests.Response:
+    return requests.get(url, headers=headers, timeout=5)
+
+
+def test_second_request_is_served_from_disk(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+
+    first = cache.get(table_url('44113'), get)
+    second = ResponseCache(str(tmp_path)).get(table_url('44113'), get)
+
+    assert first == second
+    assert stub.requests == 1
+
+
+def test_stale_entry_is_revalidated_with_its_etag(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=0)
+
+    first = cache.get(table_url('44113'), get)
+    second = cache.get(table_url('44113'), get)
+
+    assert first == second
+    assert stub.requests == 2
+    assert stub.not_modified == 1
+
+
+def test_offline_cache_serves_cached_entries_only(stub, tmp_path):
+    ResponseCache(str(tmp_path)).get(table_url('44113'), get)
+    offline = ResponseCache(str(tmp_path), max_age=0, offline=True)
+
+    assert offline.get(table_url('44113'), get)
+    with pytest.raises(CacheMiss):
+        offline.get(table_url('44114'), get)
+    assert stub.requests == 1
+
+
+def test_errors_are_returned_but_not_cached(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    stub.faults = [404]
+
+    assert cache.get(table_url('44113'), get) == b''
+    assert cache.get(table_url('44113'), get)
+    assert stub.requests == 2
+
+
+def test_least_recently_used_entries_are_evicted(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.get(table_url('00001'), get)
+    size = cache.load_index()[cache.key(table_url('00001'))][0]
+
+    # Room for two entries: reading the first one again makes the second the oldest
+    cache.max_bytes = 2 * size + size // 2
+    cache.get(table_url('00002'), get)
+    cache.get(table_url('00001'), get)
+    cache.get(table_url('00003'), get)
+
+    assert not os.path.exists(cache.payload_path(cache.key(table_url('00002'))))
+    assert os.path.exists(cache.payload_path(cache.key(table_url('00001'))))
+
+
+def test_open_reads_the_payload(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+
+    with cache.open(table_url('44113'), get) as f:
+        assert f.read() == cache.get(table_url('44113'), get)
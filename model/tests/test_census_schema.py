@@ -0,0 +1,88 @@
+import warnings
+
+import pytest
+
+from census_schema import CENSUS_TABLES, ColumnResolver, field_for_year
+
+
+def header(variables: dict, width: int = 300) -> list:
+    """
+    Returns a header row of the given width holding variables at their {variable: column} positions.
+    """
+    row = [f'X_{i:03d}' for i in range(width)]
+    for variable, column in variables.items():
+        row[column] = variable
+
+    return row
+
+
+def response(row: list, values: dict) -> dict:
+    data = ['0'] * len(row)
+    for column, value in values.items():
+        data[column] = value
+
+    return {'response': {'data': [row, data]}}
+
+
+def test_field_for_year_on_a_version_boundary():
+    versions = CENSUS_TABLES['S0101']['fields']['age']
+
+    assert field_for_year(versions, '2016') == ('S0101_C01_030E', 140)
+    assert field_for_year(versions, '2017') == ('S0101_C01_032E', 111)
+    assert field_for_year(versions, '2021') == ('S0101_C01_032E', 111)
+    with pytest.raises(ValueError):
+        field_for_year(versions, '2012')
+
+
+def test_variables_at_their_legacy_columns_resolve_silently():
+    resolver = ColumnResolver()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        indexes = resolver.resolve('S0101', '2017', header({'S0101_C01_032E': 111, 'S0101_C01_001E': 277}))
+
+    assert indexes == {'age': 111, 'pop': 277}
+
+
+def test_moved_variable_is_found_by_name_with_a_warning():
+    with pytest.warns(UserWarning, match="at column 5, previously hard-coded as 161"):
+        indexes = ColumnResolver().resolve('S1901', '2019', header({'S1901_C01_012E': 5}))
+
+    assert indexes == {'income': 5}
+
+
+def test_missing_variable_falls_back_to_the_legacy_column():
+    with pytest.warns(UserWarning, match="not in response header, falling back to column 161"):
+        indexes = ColumnResolver().resolve('S1901', '2019', header({}))
+
+    assert indexes == {'income': 161}
+
+
+def test_a_different_header_is_resolved_again():
+    resolver = ColumnResolver()
+    first = header({'S0101_C01_032E': 111, 'S0101_C01_001E': 277})
+    moved = header({'S0101_C01_032E': 10, 'S0101_C01_001E': 277})
+
+    assert resolver.resolve('S0101', '2018', first)['age'] == 111
+    with pytest.warns(UserWarning):
+        assert resolver.resolve('S0101', '2018', moved)['age'] == 10
+
+    # The first header stays cached
+    assert resolver.mappings[next(iter(resolver.mappings))][0] == first
+    assert resolver.resolve('S0101', '2018', first)['age'] == 111
+
+
+def test_extract_reads_every_zipcode_in_one_pass():
+    row = header({'S0101_C01_030E': 140, 'S0101_C01_001E': 270})
+    responses = {
+        '44113': response(row, {140: '35.1', 270: '1200'}),
+        '44114': None,
+        '44115': response(row, {140: '41.0', 270: '900'}),
+    }
+
+    zipcodes, values = ColumnResolver().extract('S0101', '2015', responses)
+
+    assert zipcodes == ['44113', '44115']
+    assert list(values['age']) == ['35.1', '41.0']
+    assert list(values['pop']) == ['1200', '900']
+    assert ColumnResolver().extract('S0101', '2015', {'44113': None}) == ([], {})
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+from clean import CLEANING_RULES, QUALITY_COLUMNS, apply_scale_rules, clean_tensor, impute_years, quality_report
+
+nan = np.nan
+
+
+def test_sentinels_negatives_zeros_and_empty_zipcodes_are_masked():
+    # Imputation left out to see the masks alone
+    rules = {metric: {**rule, 'impute': 'none'} for metric, rule in CLEANING_RULES.items()}
+    tensor = np.array([
+        # income: zeros are missing
+        [[-666666666, 0, 50], [-5, 40, 60]],
+        # pop: a zero empties the zipcode for the year
+        [[100, 200, 0], [100, nan, 300]],
+        # car: zeros are kept
+        [[0, 3, 7], [0, 4, 8]],
+    ])
+
+    cleaned, counts = clean_tensor(tensor, ['income', 'pop', 'car'], rules)
+
+    np.testing.assert_array_equal(cleaned, [
+        [[nan, nan, nan], [nan, 40, 60]],
+        [[100, 200, nan], [100, nan, 300]],
+        [[0, 3, nan], [0, 4, 8]],
+    ])
+    assert counts['cells'].tolist() == [6, 6, 6]
+    assert counts['missing'].tolist() == [0, 1, 0]
+    assert counts['sentinel'].tolist() == [1, 0, 0]
+    assert counts['negative'].tolist() == [1, 0, 0]
+    assert counts['zero'].tolist() == [1, 0, 0]
+    assert counts['empty'].tolist() == [1, 1, 1]
+    assert counts['imputed'].tolist() == [0, 0, 0]
+    assert counts['remaining'].tolist() == [4, 2, 1]
+
+
+def test_impute_years_fills_gaps_and_optionally_edges():
+    # One column per zipcode: gaps inside and at both edges, no known year, steps of 2
+    values = np.array([
+        [nan, nan, 0],
+        [1, nan, nan],
+        [nan, nan, nan],
+        [3, nan, 6],
+        [nan, nan, 8],
+    ])
+
+    np.testing.assert_array_equal(impute_years(values), [
+        [nan, nan, 0],
+        [1, nan, 2],
+        [2, nan, 4],
+        [3, nan, 6],
+        [nan, nan, 8],
+    ])
+    np.testing.assert_array_equal(impute_years(values, edges=True), [
+        [1, nan, 0],
+        [1, nan, 2],
+        [2, nan, 4],
+        [3, nan, 6],
+        [3, nan, 8],
+    ])
+
+    # A copy is returned, and leading axes are imputed independently
+    assert np.isnan(values[2]).all()
+    stacked = impute_years(np.stack([values, values * 2]))
+    np.testing.assert_array_equal(stacked[1], impute_years(values * 2))
+
+
+def test_metrics_are_imputed_by_their_rule():
+    tensor = np.array([
+        [[10], [nan], [30]],
+        [[10], [nan], [30]],
+    ])
+
+    cleaned, counts = clean_tensor(tensor, ['income', 'biz'])
+
+    # Business patterns are never imputed
+    assert cleaned[0, 1, 0] == 20
+    assert np.isnan(cleaned[1, 1, 0])
+    assert counts['imputed'].tolist() == [1, 0]
+    assert counts['remaining'].tolist() == [0, 1]
+
+
+def ntd_frame(values: dict) -> pd.DataFrame:
+    index = pd.MultiIndex.from_product([list(values), range(2013, 2017)], names=['system', 'year'])
+    trips = np.concatenate([values[system] for system in values]).astype(float)
+
+    return pd.DataFrame({'unlinked_passenger_trips': trips, 'vehicle_revenue_miles': trips * 10}, index=index)
+
+
+def test_scale_rules_skip_exempt_systems_and_later_years():
+    df = ntd_frame({
+        'boston': [1000, 1000, 1, 1000],
+        'hartford': [1000, 1000, 1, 1000],
+        'cleveland': [1000, 1, 1000, 1000],
+        'orlando': [1000, 1000, 1, 1000],
+    })
+
+    rescaled, counts = apply_scale_rules(df)
+
+    assert rescaled.loc[('boston', 2015), 'unlinked_passenger_trips'] == 1000
+    assert rescaled.loc[('boston', 2015), 'vehicle_revenue_miles'] == 10000
+    # Exempt
+    assert rescaled.loc[('hartford', 2015), 'unlinked_passenger_trips'] == 1
+    # Only rescaled up to 2014
+    assert rescaled.loc[('cleveland', 2014), 'unlinked_passenger_trips'] == 1000
+    assert rescaled.loc[('orlando', 2015), 'unlinked_passenger_trips'] == 1
+
+    assert counts.loc[:, 'unlinked_passenger_trips'].to_dict() == {'boston': 1, 'cleveland': 1, 'hartford': 0, 'orlando': 0}
+    assert counts.loc[:, 'vehicle_revenue_miles'].to_dict() == counts.loc[:, 'unlinked_passenger_trips'].to_dict()
+
+    # The input is left as it was
+    assert df.loc[('boston', 2015), 'unlinked_passenger_trips'] == 1
+
+
+def test_quality_report_counts_each_system_and_metric():
+    metrics = ['income', 'pop', 'biz']
+    first = np.array([
+        [[-666666666, 10], [20, 0], [30, 30]],
+        [[100, 100], [100, 100], [100, 100]],
+        [[1, nan], [2, 2], [3, 3]],
+    ])
+    second = np.array([
+        [[10, 10], [20, nan], [30, 30]],
+        [[100, 100], [0, 100], [100, 100]],
+        [[1, 1], [2, 2], [3, -1]],
+    ])
+
+    _, counts = clean_tensor(np.stack([first, second]), metrics)
+    report = quality_report(counts, ['first', 'second'], metrics)
+
+    assert report.columns.tolist() == QUALITY_COLUMNS
+    assert report.index.names == ['system', 'metric']
+    assert report['rescaled'].eq(0).all()
+    assert report.loc['first', ['sentinel', 'zero', 'imputed', 'remaining']].to_dict('index') == {
+        'income': {'sentinel': 1, 'zero': 1, 'imputed': 1, 'remaining': 1},
+        'pop': {'sentinel': 0, 'zero': 0, 'imputed': 0, 'remaining': 0},
+        'biz': {'sentinel': 0, 'zero': 0, 'imputed': 0, 'remaining': 1},
+    }
+    assert report.loc['second', ['missing', 'negative', 'empty', 'imputed', 'remaining']].to_dict('index') == {
+        'income': {'missing': 1, 'negative': 0, 'empty': 1, 'imputed': 2, 'remaining': 0},
+        'pop': {'missing': 0, 'negative': 0, 'empty': 1, 'imputed': 1, 'remaining': 0},
+        'biz': {'missing': 0, 'negative': 1, 'empty': 1, 'imputed': 0, 'remaining': 2},
+    }
+
+    # Counts of one system alone are those of its row of the stacked report
+    _, single = clean_tensor(second, metrics)
+    assert quality_report(single, ['second'], metrics).equals(report.loc[['second']])
@@ -0,0 +1,101 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from threadpoolctl import threadpool_info
+
+import feature_engineering
+from evaluation import (FOLDS_DIR, THREAD_VARIABLES, dataset_hash, grid_candidates, init_worker, load_folds,
+                        random_candidates, search, system_folds, time_folds)
+from storage import Storage
+from train_model import FEATURES
+
+
+def test_system_folds_hold_out_one_whole_system():
+    systems = np.array(['a', 'a', 'b', 'b', 'c'])
+    names, train, test = system_folds(systems, np.array([2013, 2014, 2013, 2014, 2013]))
+
+    assert names.tolist() == ['a', 'b', 'c']
+    assert (train ^ test).all()
+    assert test.sum(axis=0).tolist() == [1] * 5
+    for name, train_mask in zip(names, train):
+        assert name not in systems[train_mask]
+
+
+def test_time_folds_never_train_on_later_years():
+    years = np.repeat(np.arange(2013, 2019), 3)
+    names, train, test = time_folds(np.tile(['a', 'b', 'c'], 6), years)
+
+    assert names.tolist() == [str(year) for year in range(2015, 2019)]
+    for train_mask, test_mask in zip(train, test):
+        assert years[train_mask].max() < years[test_mask].min()
+
+
+def test_random_candidates_are_distinct_and_seeded():
+    candidates = random_candidates('gbm', 5, seed=1)
+
+    assert len({tuple(sorted(c.items(), key=str)) for c in candidates}) == 5
+    assert all(candidate in grid_candidates('gbm') for candidate in candidates)
+    assert candidates == random_candidates('gbm', 5, seed=1)
+    assert random_candidates('linear', 5) == [{}]
+
+
+def test_search_reports_the_best_candidate_per_model_and_scheme(panel, tmp_path):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+
+    report = search(['linear', 'ridge'], ['system', 'time'], 'random', 3, FEATURES, str(tmp_path / "dataset"), workers=1)
+
+    assert sorted(report['best']) == ['linear/system', 'linear/time', 'ridge/system', 'ridge/time']
+    assert len(report['results']) == 2 * (1 + 3)
+    assert report['folds']['system'] == sorted(panel['system'].unique())
+
+    # The folds are cached under the dataset's hash and reused by the next search
+    key = report['dataset']['hash']
+    assert os.path.exists(os.path.join(FOLDS_DIR, f'{key}-system.npz'))
+    assert search(['linear'], ['system'], features=FEATURES, path=str(tmp_path / "dataset"), workers=1)['dataset']['hash'] == key
+
+
+def test_search_on_a_process_pool_matches_a_single_worker(panel, tmp_path):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+
+    def scores(workers):
+        report = search(['ridge', 'gbm'], ['system', 'time'], 'random', 2, FEATURES, str(tmp_path / "dataset"),
+                        workers=workers)
+        return sorted((result['model'], result['cv'], json.dumps(result['params'], sort_keys=True), result['r2'],
+                       result['rmse'], result['fold_rmse']) for result in report['results'])
+
+    assert scores(2) == scores(1)
+
+
+def test_fold_cache_is_keyed_on_the_derived_features_and_fold_layout(panel, tmp_path, monkeypatch):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+    path = str(tmp_path / "dataset")
+    key = dataset_hash(path, FEATURES)
+
+    # The derived features decide which rows are complete, so the same features under another spec are another dataset
+    monkeypatch.setitem(feature_engineering.DERIVED_FEATURES, 'trips_mean3_lag1',
+                        {'op': 'rolling_mean', 'of': 'trips_lag1', 'years': 2})
+    assert dataset_hash(path, FEATURES) != key
+
+    systems = np.repeat(['a', 'b'], 6)
+    years = np.tile(np.arange(2015, 2021), 2)
+    names, train, test = load_folds('time', systems, years, key, str(tmp_path), min_train_years=2)
+    later = load_folds('time', systems, years, key, str(tmp_path), min_train_years=4)
+
+    assert names == ['2017', '2018', '2019', '2020']
+    assert later[0] == ['2019', '2020']
+    assert later[1].shape == later[2].shape == (2, 12)
+    assert load_folds('time', systems, years, key, str(tmp_path), min_train_years=2)[0] == names
+
+
+def thread_limits() -> tuple:
+    return {name: os.environ.get(name) for name in THREAD_VARIABLES}, [pool['num_threads'] for pool in threadpool_info()]
+
+
+def test_workers_are_limited_to_one_thread():
+    with ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(None, None, {})) as executor:
+        variables, threads = executor.submit(thread_limits).result()
+
+    assert variables == dict.fromkeys(THREAD_VARIABLES, '1')
+    assert set(threads) <= {1}
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engineering import (DERIVED_FEATURES, TARGET, add_features, compute_features, dataset_columns,
+                                 load_features, target_lag)
+
+
+@pytest.fixture
+def small():
+    """
+    Two systems over 2015-2019: 'a' is missing 2017 and 'b' runs no vehicles in 2016.
+    """
+    rows = [
+        ('a', 2015, 100, 10), ('a', 2016, 110, 10), ('a', 2018, 150, 20), ('a', 2019, 120, 20),
+        ('b', 2019, 60, 4), ('b', 2015, 40, 2), ('b', 2016, 50, 0), ('b', 2017, 55, 2), ('b', 2018, 45, 3),
+    ]
+    df = pd.DataFrame(rows, columns=['system', 'year', TARGET, 'voms']).set_index('year')
+
+    return df.assign(vehicle_revenue_miles=df['voms'] * 1000.0)
+
+
+SPEC = {
+    'trips_lag1': {'op': 'lag', 'of': TARGET, 'years': 1},
+    'trips_growth': {'op': 'growth', 'of': TARGET, 'years': 1},
+    'trips_mean2': {'op': 'rolling_mean', 'of': TARGET, 'years': 2},
+    'vrm_per_vom': {'op': 'ratio', 'of': ['vehicle_revenue_miles', 'voms']},
+    'vrm_per_vom_lag1': {'op': 'lag', 'of': 'vrm_per_vom', 'years': 1},
+}
+
+
+def column(features: pd.DataFrame, df: pd.DataFrame, system: str, name: str) -> list:
+    """
+    Returns a feature of one system in year order, with None for NaN.
+    """
+    values = features[name][(df['system'] == system).to_numpy()].sort_index()
+    return [None if np.isnan(value) else round(value, 6) for value in values]
+
+
+def test_lags_are_calendar_based(small):
+    features = compute_features(small, SPEC)
+
+    # 2018 of system a has no 2017 to lag, rather than 2016
+    assert column(features, small, 'a', 'trips_lag1') == [None, 100, None, 150]
+    assert column(features, small, 'b', 'trips_lag1') == [None, 40, 50, 55, 45]
+
+
+def test_growth_and_rolling_mean(small):
+    features = compute_features(small, SPEC)
+
+    assert column(features, small, 'a', 'trips_growth') == [None, 0.1, None, -0.2]
+    assert column(features, small, 'b', 'trips_mean2') == [None, 45, 52.5, 50, 52.5]
+    assert column(features, small, 'a', 'trips_mean2') == [None, 105, None, 135]
+
+
+def test_division_by_zero_is_nan(small):
+    features = compute_features(small, SPEC)
+
+    assert column(features, small, 'b', 'vrm_per_vom') == [1000, None, 1000, 1000, 1000]
+    assert column(features, small, 'b', 'vrm_per_vom_lag1') == [None, 1000, None, 1000, 1000]
+
+
+def test_features_keep_the_row_order(small):
+    features = compute_features(small, SPEC)
+
+    assert features.index.tolist() == small.index.tolist()
+    assert features['trips_lag1'].iloc[4] == 45
+
+
+def test_duplicate_rows_and_missing_columns_are_refused(small):
+    with pytest.raises(ValueError):
+        compute_features(pd.concat([small, small.iloc[:1]]), SPEC)
+    with pytest.raises(KeyError, match='voms'):
+        compute_features(small.drop(columns='voms'), SPEC)
+
+
+def test_target_lag():
+    assert target_lag(TARGET) == 0
+    assert target_lag('trips_per_capita') == 0
+    assert target_lag('trips_lag1') == 1
+    assert target_lag('trips_mean3_lag1') == 1
+    assert target_lag('trips_lag2') == 2
+    assert target_lag('vrm_per_vom') == np.inf
+
+
+def test_dataset_columns_of_the_declared_features():
+    assert dataset_columns()[0] == TARGET
+    assert not set(dataset_columns()) & set(DERIVED_FEATURES)
+
+
+def test_features_are_memoized_by_data_and_spec(panel, tmp_path):
+    cache_dir = str(tmp_path)
+
+    first = load_features(panel, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    pd.testing.assert_frame_equal(load_features(panel, cache_dir=cache_dir), first)
+
+    # Other data or another spec are computed and cached separately
+    load_features(panel.assign(pop=panel['pop'] * 2), cache_dir=cache_dir)
+    load_features(panel, SPEC, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 3
+
+    pd.testing.assert_frame_equal(first, compute_features(panel))
+
+
+def test_add_features_by_position(panel, tmp_path):
+    df = add_features(panel, ['pop', 'trips_lag1', 'vrm_per_vom'], cache_dir=str(tmp_path))
+
+    system = df[df['system'] == 'system_2']
+    assert np.isnan(system['trips_lag1'].iloc[0])
+    assert system['trips_lag1'].iloc[1:].tolist() == system[TARGET].iloc[:-1].tolist()
+    assert df['pop'].equals(panel['pop'])
+    assert add_features(panel, ['pop'], cache_dir=str(tmp_path)) is panel
+
+
+def test_unknown_features_are_refused(panel):
+    with pytest.raises(KeyError, match='trips_lag9'):
+        add_features(panel, ['trips_lag9'])
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from cache import ResponseCache
+from census_schema import CENSUS_TABLES
+from fetch import CensusFetcher, TokenBucket
+
+
+def table_url(zipcode: str, year: str = '2019') -> str:
+    return CENSUS_TABLES['S1901']['url'].format(geo=f'860XX00US{zipcode}', year=year)
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = CensusFetcher(max_workers=4, rate=1000, burst=1000, retries=3, backoff=0.01,
+                            timeout=5, cache=ResponseCache(str(tmp_path / "http")))
+    yield fetcher
+    fetcher.close()
+
+
+def test_token_bucket_spaces_requests_after_a_burst():
+    bucket = TokenBucket(rate=20, capacity=2)
+
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+
+    # 2 tokens are available at once, the 4 others come at 20 per second
+    assert time.monotonic() - start >= 4 / 20 - 0.01
+
+
+def test_fetch_many_shares_the_rate_limit(stub, tmp_path):
+    fetcher = CensusFetcher(max_workers=8, rate=20, burst=1, cache=ResponseCache(str(tmp_path / "http")))
+
+    start = time.monotonic()
+    responses = fetcher.fetch_many({i: table_url(f'{i:05d}') for i in range(9)})
+    elapsed = time.monotonic() - start
+    fetcher.close()
+
+    assert all(responses[i]['response']['data'][1][0].endswith(f'{i:05d}') for i in range(9))
+    assert elapsed >= 8 / 20 - 0.01
+
+
+def test_retryable_status_codes_are_retried(stub, fetcher):
+    stub.faults = [503, 502, 429]
+
+    response = fetcher.fetch(table_url('44113'))
+
+    assert response['response']['data'][1][0] == '860Z200US44113'
+    assert stub.requests == 4
+
+
+def test_retry_after_header_extends_the_backoff(stub, fetcher):
+    stub.faults = [(429, {'Retry-After': '1'})]
+
+    start = time.monotonic()
+    fetcher.fetch(table_url('44113'))
+
+    assert time.monotonic() - start >= 1
+    assert stub.requests == 2
+
+
+def test_failure_after_the_last_retry_is_not_cached(stub, fetcher):
+    stub.faults = [500] * 4
+
+    assert fetcher.fetch(table_url('44113')) is None
+    assert stub.requests == 4
+
+    # The error was handed back but not stored, so the next call asks the server again
+    assert fetcher.fetch(table_url('44113')) is not None
+    assert stub.requests == 5
+
+
+def test_other_errors_are_not_retried(stub, fetcher):
+    stub.faults = [404]
+
+    assert fetcher.fetch(table_url('44113')) is None
+    assert stub.requests == 1
+
+
+def test_connection_errors_are_retried_then_raised(tmp_path):
+    import requests
+
+    # Nothing listens on port 9 of the loopback interface
+    fetcher = CensusFetcher(retries=2, backoff=0.01, timeout=1, cache=ResponseCache(str(tmp_path / "http")))
+
+    with pytest.raises(requests.ConnectionError):
+        fetcher.fetch('http://127.0.0.1:9/api/access/data/table')
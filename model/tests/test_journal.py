@@ -0,0 +1,137 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from cache import ResponseCache
+from census_schema import CENSUS_TABLES
+from fetch import CensusFetcher
+from journal import CLAIMED, DONE, MISSING, PENDING, DownloadJournal
+from transit_data import BRTData
+
+ZIPCODES = ['00001', '00002', '00003']
+YEARS = ['2019', '2020']
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = DownloadJournal(str(tmp_path / "journal.sqlite"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = CensusFetcher(max_workers=2, rate=1000, burst=1000, backoff=0.01, cache=ResponseCache(str(tmp_path / "http")))
+    yield fetcher
+    fetcher.close()
+
+
+def statuses(journal: DownloadJournal) -> dict:
+    return {status: count for _, status, count in journal.read('SELECT system, status, COUNT(*) FROM cells GROUP BY system, status', ())}
+
+
+def save_income(fetcher, journal=None, system='journaled') -> pd.DataFrame:
+    brt = BRTData(system, ZIPCODES, fetcher, batch_size=2, journal=journal)
+    brt.save_income()
+    brt.load_existing_data()
+
+    return brt.get_data('income')
+
+
+def test_workers_never_claim_the_same_cells(journal, tmp_path):
+    other = DownloadJournal(str(tmp_path / "journal.sqlite"))
+    journal.add('boston', 'S1901', 'spec', YEARS, ZIPCODES)
+
+    first = journal.claim('boston', 'S1901', 2, 1)
+    second = other.claim('boston', 'S1901', 2, 10)
+
+    claimed = [(year, zipcode) for year, batch in first + second for zipcode in batch]
+    assert len(claimed) == len(set(claimed)) == len(YEARS) * len(ZIPCODES)
+    assert other.claim('boston', 'S1901', 2, 10) == []
+
+    # Cells given back by a worker are claimable again
+    other.release('boston', 'S1901')
+    assert statuses(journal) == {CLAIMED: 2, PENDING: 4}
+    other.close()
+
+
+def test_expired_claims_are_claimed_again(tmp_path):
+    crashed = DownloadJournal(str(tmp_path / "journal.sqlite"), lease=0)
+    crashed.add('boston', 'S1901', 'spec', YEARS, ZIPCODES)
+    crashed.claim('boston', 'S1901', 3, 10)
+
+    other = DownloadJournal(str(tmp_path / "journal.sqlite"), lease=0)
+    assert len(other.claim('boston', 'S1901', 3, 10)) == 2
+    crashed.close()
+    other.close()
+
+
+def test_missing_cells_are_retried_by_the_next_run(journal):
+    journal.add('boston', 'S1901', 'spec', ['2019'], ZIPCODES)
+    journal.claim('boston', 'S1901', 3, 1)
+    journal.complete('boston', 'S1901', '2019', {'00001': 'url', '00002': 'url', '00003': None})
+
+    assert journal.remaining('boston', 'S1901') == 0
+    assert journal.urls('boston', 'S1901') == {('2019', '00001'): 'url', ('2019', '00002'): 'url'}
+
+    journal.add('boston', 'S1901', 'spec', ['2019'], ZIPCODES)
+    assert statuses(journal) == {DONE: 2, PENDING: 1}
+
+
+def test_cells_of_another_spec_are_forgotten(journal):
+    journal.add('boston', 'S1901', 'old', ['2019'], ZIPCODES)
+    journal.claim('boston', 'S1901', 3, 1)
+    journal.complete('boston', 'S1901', '2019', dict.fromkeys(ZIPCODES, 'url'))
+
+    journal.add('boston', 'S1901', 'new', ['2019'], ZIPCODES)
+    assert statuses(journal) == {PENDING: 3}
+
+
+def test_a_journal_of_an_older_schema_is_replaced(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE cells (system TEXT, census_table TEXT, year TEXT, zipcode TEXT, status TEXT, metric_values TEXT)')
+        connection.execute("INSERT INTO cells VALUES ('boston', 'S1901', '2019', '00001', 'done', '{\"income\": 1}')")
+
+    journal = DownloadJournal(path)
+    journal.add('boston', 'S1901', 'spec', ['2019'], ['00001'])
+    assert statuses(journal) == {PENDING: 1}
+    journal.close()
+
+
+def test_journaled_download_matches_a_direct_one(stub, fetcher, journal):
+    journaled = save_income(fetcher, journal)
+    requests = stub.requests
+
+    # The second run finds every cell done and reads them from the response cache
+    assert save_income(fetcher, journal).equals(journaled)
+    assert stub.requests == requests
+
+    pd.testing.assert_frame_equal(save_income(fetcher, system='direct'), journaled)
+
+
+def test_a_change_of_variables_applies_to_downloaded_cells(stub, fetcher, journal, monkeypatch):
+    before = save_income(fetcher, journal)
+    requests = stub.requests
+
+    # Another column of the same responses, so nothing is downloaded again
+    monkeypatch.setitem(CENSUS_TABLES['S1901'], 'fields', {'income': [('2013', 'S1901_X005', 5)]})
+    after = save_income(fetcher, journal)
+
+    assert stub.requests == requests
+    assert not after.equals(before)
+    pd.testing.assert_frame_equal(save_income(fetcher, system='direct'), after)
+
+
+def test_cells_without_data_are_fetched_again(stub, fetcher, journal):
+    stub.faults = [404]
+    first = save_income(fetcher, journal)
+
+    missing = statuses(journal)[MISSING]
+    assert missing in (1, 2)
+    assert first.isna().sum().sum() == missing
+
+    second = save_income(fetcher, journal)
+    assert statuses(journal) == {DONE: first.size}
+    assert second.notna().all().all()
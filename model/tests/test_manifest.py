@@ -0,0 +1,48 @@
+import shutil
+
+import pytest
+
+import preprocess
+from manifest import CODE_FILES, BuildManifest
+from registry import LOCATIONS
+
+
+@pytest.fixture
+def built(workspace):
+    assert preprocess.main() == {}
+    return workspace
+
+
+def test_code_files_include_the_registry_and_census_schema():
+    assert {'registry.py', 'census_schema.py'} <= set(CODE_FILES)
+
+
+def test_nothing_is_stale_after_a_build(built):
+    assert BuildManifest().stale_systems(LOCATIONS) == []
+
+
+def test_editing_a_code_file_makes_every_system_stale(built, tmp_path):
+    manifest = BuildManifest()
+
+    # Hash copies of the code files instead of the linked source files
+    manifest.code_paths = [shutil.copy(path, tmp_path) for path in manifest.code_paths]
+    assert manifest.stale_systems(LOCATIONS) == []
+
+    with open(tmp_path / "registry.py", 'a') as f:
+        f.write('\n# A new system\n')
+    assert manifest.stale_systems(LOCATIONS) == LOCATIONS
+
+
+def test_incremental_build_only_processes_changed_systems(built, capsys):
+    import synthetic
+    from conftest import DATA_DIR
+
+    system = LOCATIONS[0]
+    synthetic.write_raw_tables(DATA_DIR, {system: None}, 5, synthetic.year_names(8), seed=1)
+    capsys.readouterr()
+
+    assert preprocess.main(incremental=True) == {}
+    assert capsys.readouterr().out.splitlines()[0] == f'Stale systems: {system}'
+
+    assert preprocess.main(incremental=True) == {}
+    assert 'Stale systems: none' in capsys.readouterr().out
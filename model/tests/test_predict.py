@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import requests
+
+from predict import LatencyTracker, MicroBatcher, Predictor, make_handler, predict_frame
+from storage import Storage
+from train_model import FEATURES, train
+
+
+def train_kind(panel, tmp_path, kind: str) -> str:
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+    train(kind, FEATURES, str(tmp_path / "dataset"), str(tmp_path / f"{kind}.npz"))
+
+    return str(tmp_path / f"{kind}.npz")
+
+
+@contextmanager
+def serving(model_path: str):
+    predictor = Predictor(model_path, warmup=0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(predictor, MicroBatcher(predictor), LatencyTracker()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def model_path(panel, tmp_path):
+    return train_kind(panel, tmp_path, 'linear')
+
+
+@pytest.fixture
+def server(model_path):
+    with serving(model_path) as url:
+        yield url
+
+
+def test_predictions_match_the_model(panel, model_path, server):
+    rows = panel[FEATURES].dropna().iloc[:3]
+    expected = predict_frame(rows, model_path).to_numpy()
+
+    by_position = requests.post(f'{server}/predict', json={'instances': rows.to_numpy().tolist()})
+    by_name = requests.post(f'{server}/predict', json={'instances': rows.to_dict('records')})
+
+    assert by_position.status_code == by_name.status_code == 200
+    np.testing.assert_allclose(by_position.json()['predictions'], expected)
+    np.testing.assert_allclose(by_name.json()['predictions'], expected)
+
+
+@pytest.mark.parametrize('instances', [
+    np.zeros((3, len(FEATURES) - 4)).tolist(),
+    np.zeros((2, len(FEATURES) + 1)).tolist(),
+    [0.0] * len(FEATURES),
+    [[[0.0] * len(FEATURES)]],
+    [[0.0] * len(FEATURES), [0.0]],
+    {'income': 1.0},
+])
+def test_instances_of_the_wrong_shape_are_rejected(server, instances):
+    response = requests.post(f'{server}/predict', json={'instances': instances})
+
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+
+def test_instances_missing_a_feature_are_rejected(panel, server):
+    row = panel[FEATURES].iloc[0].to_dict()
+    del row['income']
+
+    assert requests.post(f'{server}/predict', json={'instances': [row]}).status_code == 400
+
+
+def test_to_matrix_names_the_expected_shape(model_path):
+    predictor = Predictor(model_path, warmup=0)
+
+    with pytest.raises(ValueError, match=f'{len(FEATURES)} features'):
+        predictor.to_matrix(np.zeros((3, 8)).tolist())
+
+    assert predictor.to_matrix([]).shape == (0, len(FEATURES))
+
+
+@pytest.mark.parametrize('kind', ['linear', 'rf'])
+def test_empty_instances_have_no_predictions_for_every_model(panel, tmp_path, kind):
+    model_path = train_kind(panel, tmp_path, kind)
+
+    with serving(model_path) as url:
+        response = requests.post(f'{url}/predict', json={'instances': []})
+
+    assert response.status_code == 200
+    assert response.json() == {'predictions': []}
+    assert Predictor(model_path, warmup=0).predict(np.empty((0, len(FEATURES)))).shape == (0,)
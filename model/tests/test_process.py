@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import preprocess
+import process
+import synthetic
+from conftest import DATA_DIR
+from registry import LOCATIONS
+from storage import Storage
+
+DATASET = os.path.join(DATA_DIR, "dataset")
+
+
+@pytest.fixture(params=['csv', 'parquet'])
+def processed(request, workspace, monkeypatch):
+    """
+    The workspace with every system processed, in each storage format, and the dataset
+    read a few rows at a time.
+    """
+    monkeypatch.setenv('TRANSIT_STORAGE', request.param)
+    monkeypatch.setattr(process, 'CHUNK_ROWS', 3)
+
+    assert preprocess.main() == {}
+    return workspace
+
+
+def in_memory_dataset(locations: list[str]) -> pd.DataFrame:
+    """
+    The dataset as it was built before streaming: every processed table concatenated at once.
+    """
+    storage = Storage()
+    df = pd.concat([storage.read(process.processed_path(system)) for system in locations])
+    df = df[df[process.TARGET].notna()]
+
+    return df.astype({column: np.float64 for column in df.columns if column != 'system'})
+
+
+def read_dataset() -> pd.DataFrame:
+    return Storage().read(DATASET)
+
+
+def test_streamed_dataset_matches_concatenating_every_table(processed, capsys):
+    process.main()
+
+    df = read_dataset()
+    pd.testing.assert_frame_equal(df, in_memory_dataset(LOCATIONS), check_index_type=False, check_names=False)
+    assert df['system'].unique().tolist() == LOCATIONS
+    assert f'Dataset written: {len(df)} rows' in capsys.readouterr().out
+
+
+def test_incremental_build_replaces_the_changed_system(processed, capsys):
+    process.main()
+    system = LOCATIONS[len(LOCATIONS) // 2]
+    synthetic.write_raw_tables(DATA_DIR, {system: None}, 7, synthetic.year_names(8), seed=2)
+    assert preprocess.main(incremental=True) == {}
+    capsys.readouterr()
+
+    process.main(incremental=True)
+
+    assert capsys.readouterr().out.splitlines()[0] == f'Changed systems: {system}'
+    pd.testing.assert_frame_equal(read_dataset(), in_memory_dataset(LOCATIONS), check_index_type=False, check_names=False)
+
+    process.main(incremental=True)
+    assert capsys.readouterr().out.splitlines() == ['Changed systems: none']
+
+
+def test_reordered_systems_rebuild_the_dataset(processed, monkeypatch, capsys):
+    process.main()
+    synthetic.write_raw_tables(DATA_DIR, {LOCATIONS[0]: None}, 7, synthetic.year_names(8), seed=2)
+    assert preprocess.main(incremental=True) == {}
+
+    locations = LOCATIONS[::-1]
+    monkeypatch.setattr(process, 'LOCATIONS', locations)
+    capsys.readouterr()
+    process.main(incremental=True)
+
+    assert 'out of order in the dataset, rebuilding the dataset' in capsys.readouterr().out
+    assert read_dataset()['system'].unique().tolist() == locations
+
+
+def test_bad_values_leave_the_dataset_untouched(processed):
+    process.main()
+    storage = Storage()
+    with open(storage.path(DATASET), 'rb') as f:
+        before = f.read()
+
+    system = LOCATIONS[-1]
+    df = storage.read(process.processed_path(system))
+    storage.write(df.assign(pop=df['pop'].astype(object).where(df.index != df.index[0], 'unknown')), process.processed_path(system))
+
+    with pytest.raises(ValueError, match=f'The rows of {system} have values that are not numbers'):
+        process.main()
+
+    with open(storage.path(DATASET), 'rb') as f:
+        assert f.read() == before
+    assert not [name for name in os.listdir(DATA_DIR) if '.tmp' in name]
+
+
+def test_chunks_are_checked_against_the_dataset_columns():
+    df = pd.DataFrame({'system': ['a', 'a'], process.TARGET: [1, 2], 'pop': ['3', '4']}, index=pd.Index([2019, 2020], name='year'))
+    columns = ['system', process.TARGET, 'pop', 'voms']
+
+    checked = process.check_chunk(df, columns, 'a')
+    assert checked.columns.tolist() == columns
+    assert checked['pop'].tolist() == [3.0, 4.0] and checked['voms'].isna().all()
+
+    with pytest.raises(ValueError, match='other systems'):
+        process.check_chunk(df, columns, 'b')
+    with pytest.raises(ValueError, match='not in the dataset'):
+        process.check_chunk(df.assign(walkscore=1), columns, 'a')
+    with pytest.raises(ValueError, match='not indexed by year'):
+        process.check_chunk(df.reset_index(drop=True).rename(index=str), columns, 'a')
+    with pytest.raises(ValueError, match=process.TARGET):
+        process.check_chunk(df.drop(columns=process.TARGET), columns, 'a')
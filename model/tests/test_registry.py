@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+import registry
+import synthetic
+from cache import ResponseCache
+from storage import Storage
+from transit_data import NTDData
+
+
+@pytest.fixture
+def agencies():
+    table = pd.DataFrame({
+        'name': ['Greater Cleveland Regional Transit Authority', 'Lane Transit District', 'Metro Transit', 'Metro Transit'],
+        'city': ['Cleveland', 'Eugene', 'Minneapolis', 'Madison'],
+        'state': ['OH', 'OR', 'MN', 'WI'],
+    }, index=pd.Index(['50015', '00001', '50027', '50005'], name='ntd_id'))
+
+    # Give the first two rows the NTD IDs of registered systems
+    return table.rename(index=dict(zip(['50015', '00001'], list(registry.NTD_IDS.values())[:2])))
+
+
+def test_zipcodes_of_a_registered_system():
+    assert registry.zipcodes('cleveland')[:2] == ['44112', '44104']
+
+
+def test_unknown_system_is_a_value_error():
+    with pytest.raises(ValueError, match='Unknown system'):
+        registry.zipcodes('atlantis')
+
+
+def test_every_system_has_an_ntd_id_and_zipcodes():
+    assert set(registry.NTD_IDS) == set(registry.LOCATIONS)
+    assert all(registry.zipcodes(system) for system in registry.LOCATIONS)
+
+
+def test_find_agencies_by_name_or_city_and_state(agencies):
+    assert find(agencies, 'metro') == ['Minneapolis', 'Madison']
+    assert find(agencies, 'EUGENE') == ['Eugene']
+    assert find(agencies, 'metro', 'wi') == ['Madison']
+    assert len(registry.find_agencies(table=agencies)) == 4
+
+
+def test_new_agencies_leaves_out_registered_systems(agencies):
+    assert registry.new_agencies(agencies)['city'].tolist() == ['Minneapolis', 'Madison']
+
+
+def find(table: pd.DataFrame, query: str, state: str = None) -> list[str]:
+    return registry.find_agencies(query, state, table)['city'].tolist()
+
+
+def test_agency_table_of_fetched_sheets(stub, tmp_path, monkeypatch):
+    member = '2019_Annual_Database_Files/Metrics_Static.xlsx'
+    stub.add_archive(2019, synthetic.make_ntd_archive(2019, 10, member))
+
+    ntd = NTDData(ResponseCache(str(tmp_path / "http")))
+    ntd.data_dir = str(tmp_path / "ntd")
+    os.makedirs(ntd.data_dir)
+    ntd.fetch_zip_data(2019, member)
+    ntd.load_existing_data()
+
+    monkeypatch.setattr(registry, 'AGENCY_TABLE', str(tmp_path / "ntd_agencies"))
+    table = registry.agency_table(ntd, Storage())
+
+    # Only the columns of NTD_COLUMNS are parsed, which must include the city
+    assert len(table) == 5
+    assert table['city'].notna().all()
+    assert table.loc['10002', ['name', 'city', 'state', 'first_year']].tolist() == ['Agency 10002', 'City 10002', 'XX', 2019]
+    assert find(registry.load_agency_table(Storage()), 'city 10004') == ['City 10004']
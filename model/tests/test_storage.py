@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from storage import FORMATS, Storage
+
+
+@pytest.fixture
+def table():
+    """
+    A table like the raw ones: indexed by year, with a numeric column read as text and a gap.
+    """
+    years = pd.Index(range(2013, 2021), name='year')
+    return pd.DataFrame({
+        '44113': [str(1000 + i) for i in range(8)],
+        '44114': [1.5 * i for i in range(8)],
+        'note': ['a', None, 'b', 'c', 'd', 'e', 'f', 'g'],
+    }, index=years)
+
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_round_trip(fmt, table, tmp_path):
+    storage = Storage(fmt)
+    path = storage.write(table, str(tmp_path / "income"))
+
+    df = storage.read(str(tmp_path / "income"))
+
+    assert path.endswith(FORMATS[fmt].extension)
+    assert df.index.tolist() == list(range(2013, 2021))
+    assert df['44113'].tolist() == list(range(1000, 1008))
+    assert df['44114'].tolist() == table['44114'].tolist()
+    assert df['note'].isna().tolist() == table['note'].isna().tolist()
+    assert storage.columns(str(tmp_path / "income")) == ['44113', '44114', 'note']
+
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_rows_and_columns_subset(fmt, table, tmp_path):
+    storage = Storage(fmt)
+    storage.write(table, str(tmp_path / "income"))
+
+    df = storage.read(str(tmp_path / "income"), columns=['44114'], rows=[2015, 2019, 2030])
+
+    assert df.index.tolist() == [2015, 2019]
+    assert df.columns.tolist() == ['44114']
+    assert df['44114'].tolist() == [3.0, 9.0]
+
+
+def test_parquet_rows_are_filtered_by_the_reader(table, tmp_path, monkeypatch):
+    storage = Storage('parquet')
+    storage.write(table, str(tmp_path / "income"))
+
+    calls = []
+    read_parquet = pd.read_parquet
+    monkeypatch.setattr(pd, 'read_parquet', lambda *args, **kwargs: calls.append(kwargs) or read_parquet(*args, **kwargs))
+
+    assert storage.read(str(tmp_path / "income"), rows=[2016]).index.tolist() == [2016]
+    assert calls[0]['filters'] == [('year', 'in', [2016])]
+
+
+def test_parquet_rows_of_a_range_index(tmp_path):
+    storage = Storage('parquet')
+    storage.write(pd.DataFrame({'value': np.arange(5.0)}), str(tmp_path / "table"))
+
+    assert storage.read(str(tmp_path / "table"), rows=[1, 3])['value'].tolist() == [1.0, 3.0]
+
+
+def test_find_prefers_the_storage_format_and_falls_back_to_the_other(table, tmp_path):
+    stem = str(tmp_path / "income")
+    Storage('csv').write(table, stem)
+
+    assert Storage('parquet').find(stem) == ('csv', stem + '.csv')
+    assert Storage('parquet').read(stem)['44113'].tolist() == list(range(1000, 1008))
+
+    Storage('parquet').write(table, stem)
+    assert Storage('parquet').find(stem) == ('parquet', stem + '.parquet')
+    assert Storage('csv').find(stem) == ('csv', stem + '.csv')
+    assert Storage().list(str(tmp_path)) == ['income']
+
+
+def test_missing_tables_and_unknown_formats(tmp_path):
+    assert Storage().find(str(tmp_path / "missing")) == (None, None)
+    assert not Storage().exists(str(tmp_path / "missing"))
+    with pytest.raises(FileNotFoundError):
+        Storage().read(str(tmp_path / "missing"))
+    with pytest.raises(ValueError, match='Unknown storage format'):
+        Storage('xlsx')
+
+
+def test_storage_format_from_the_environment(monkeypatch):
+    monkeypatch.setenv('TRANSIT_STORAGE', 'parquet')
+
+    assert Storage().fmt == 'parquet'
+
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_blocks_written_then_read_a_chunk_at_a_time(fmt, table, tmp_path):
+    storage = Storage(fmt)
+    table = table.drop(columns='note').astype(float)
+    writer = storage.writer(str(tmp_path / "dataset"))
+    for start in range(0, 8, 3):
+        writer.write(table.iloc[start:start + 3])
+    writer.close()
+
+    chunks = list(storage.read_chunks(str(tmp_path / "dataset"), 5, columns=['44114']))
+
+    assert [len(chunk) for chunk in chunks] == [5, 3]
+    pd.testing.assert_frame_equal(pd.concat(chunks), table[['44114']], check_index_type=False)
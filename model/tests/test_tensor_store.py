@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from census_schema import METRICS
+from tensor_store import MetricStore
+from transit_data import BRTData
+
+
+def frames() -> dict:
+    income = pd.DataFrame({'44113': [50.0, 51.0], '44114': [60.0, 61.0]}, index=pd.Index([2019, 2020], name='year'))
+    # As read from a CSV with a note in place of a value, and a zipcode and year of its own
+    pop = pd.DataFrame({'44114': ['200', '(X)'], '44115': ['300', '301']}, index=pd.Index([2020, 2021], name='year'))
+
+    return {'income': income, 'pop': pop}
+
+
+def test_frames_are_aligned_and_coerced_to_numbers():
+    store = MetricStore.from_frames(frames())
+
+    assert store.metrics == ['income', 'pop']
+    assert store.years.tolist() == [2019, 2020, 2021]
+    assert store.zipcodes.tolist() == ['44113', '44114', '44115']
+    assert store.values.dtype == np.float64
+
+    np.testing.assert_array_equal(store.frame('pop').to_numpy(), [
+        [np.nan, np.nan, np.nan],
+        [np.nan, 200, 300],
+        [np.nan, np.nan, 301],
+    ])
+    assert store.frame('income').loc[2020, '44114'] == 61
+
+    assert MetricStore.from_frames(frames(), dtype=np.float32).values.dtype == np.float32
+    assert store.tensor(['pop']).shape == (1, 3, 3)
+
+
+def test_frames_and_set_share_the_store_memory():
+    store = MetricStore.from_frames(frames())
+
+    store.frame('income').loc[2019, '44115'] = 52
+    assert store.values[0, 0, 2] == 52
+
+    store.set('pop', 2021, ['44113', '44114'], ['400', 'N/A'])
+    assert store.frame('pop').loc[2021, '44113'] == 400
+    assert np.isnan(store.frame('pop').loc[2021, '44114'])
+
+    with pytest.raises(KeyError, match='44999'):
+        store.set('pop', 2021, ['44999'], [1])
+
+
+def test_saved_store_loads_back(tmp_path):
+    store = MetricStore.from_frames(frames())
+    path = str(tmp_path / "stores" / "system-1")
+
+    assert not MetricStore.exists(path)
+    store.save(path)
+    assert MetricStore.exists(path)
+
+    for mmap in [True, False]:
+        loaded = MetricStore.load(path, mmap=mmap)
+        assert loaded.metrics == store.metrics
+        assert loaded.years.equals(store.years) and loaded.years.name == 'year'
+        assert loaded.zipcodes.equals(store.zipcodes)
+        np.testing.assert_array_equal(loaded.values, store.values)
+
+
+def test_writes_to_a_mapped_store_stay_in_memory(tmp_path):
+    path = str(tmp_path / "system-1")
+    MetricStore.from_frames(frames()).save(path)
+
+    loaded = MetricStore.load(path)
+    assert isinstance(loaded.values, np.memmap)
+
+    loaded.set('income', 2019, ['44113'], [99])
+    assert loaded.frame('income').loc[2019, '44113'] == 99
+    assert np.load(path + '.npy')[0, 0, 0] == 50
+    assert MetricStore.load(path).frame('income').loc[2019, '44113'] == 50
+
+
+@pytest.fixture
+def brt(workspace, tmp_path):
+    brt = BRTData(list(workspace)[0])
+    brt.store_dir = str(tmp_path / "tensors")
+    brt.load_existing_data()
+
+    return brt
+
+
+def reload(brt: BRTData) -> BRTData:
+    reloaded = BRTData(brt.name)
+    reloaded.store_dir = brt.store_dir
+    reloaded.load_existing_data()
+
+    return reloaded
+
+
+def test_store_is_rebuilt_when_a_table_changes(brt):
+    path = brt.store_path(METRICS)
+    brt.get_store()
+    assert sorted(os.listdir(brt.store_dir)) == [os.path.basename(path) + '.json', os.path.basename(path) + '.npy']
+
+    # Unchanged tables map the saved store
+    unchanged = reload(brt)
+    assert unchanged.store_path(METRICS) == path
+    assert isinstance(unchanged.get_store().values, np.memmap)
+
+    # A table written again at the same size is still told apart by its modification time
+    table = brt.storage.find(brt.tables['income'])[1]
+    with open(table) as f:
+        content = f.read()
+    first_value = content.splitlines()[1].split(',')[1]
+    with open(table, 'w') as f:
+        f.write(content.replace(first_value, str(len(first_value) * '9'), 1))
+    stat = os.stat(table)
+    os.utime(table, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    changed = reload(brt)
+    new_path = changed.store_path(METRICS)
+    assert new_path != path
+    assert changed.get_data('income').iloc[0, 0] == float(len(first_value) * '9')
+
+    # The old store is removed
+    assert sorted(os.listdir(brt.store_dir)) == [os.path.basename(new_path) + '.json', os.path.basename(new_path) + '.npy']
+
+
+def test_get_data_matches_reading_the_csv(brt):
+    # A note in place of a value becomes NaN, like pandas.to_numeric with errors='coerce' did
+    table = brt.storage.find(brt.tables['age'])[1]
+    df = pd.read_csv(table, index_col=0, dtype=str)
+    df.iloc[1, 2] = '(X)'
+    df.to_csv(table)
+    brt = reload(brt)
+
+    for metric in METRICS:
+        expected = pd.read_csv(brt.storage.find(brt.tables[metric])[1], index_col=0)
+        expected = expected.apply(pd.to_numeric, errors='coerce').astype(np.float64).rename_axis('year')
+
+        pd.testing.assert_frame_equal(brt.get_data(metric), expected, check_names=False)
+        assert brt.get_data(metric).index.name == 'year'
+
+    assert np.isnan(brt.get_data('age').iloc[1, 2])
@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+from tracing import stage
+
+
+def read_trace(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_stages_are_not_recorded_without_a_trace_file(monkeypatch):
+    monkeypatch.delenv('TRANSIT_TRACE', raising=False)
+
+    with stage('preprocess.merge', 'boston') as record:
+        record['rows_out'] = 8
+
+    assert record == {'stage': 'preprocess.merge', 'system': 'boston', 'rows_out': 8}
+
+
+def test_each_stage_appends_a_record(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRANSIT_TRACE', str(tmp_path / "trace.jsonl"))
+
+    with stage('census.fetch', 'boston', table='S1901') as record:
+        record['bytes'] = 100
+    with pytest.raises(KeyError):
+        with stage('census.parse', 'boston'):
+            raise KeyError('income')
+
+    fetch, parse = read_trace(tmp_path / "trace.jsonl")
+    assert fetch['table'] == 'S1901' and fetch['bytes'] == 100 and fetch['seconds'] >= 0
+    assert parse['error'] == 'KeyError'
+
+
+def test_the_chosen_stage_is_profiled(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRANSIT_TRACE', str(tmp_path / "trace.jsonl"))
+    monkeypatch.setenv('TRANSIT_PROFILE', 'preprocess.clean')
+    monkeypatch.setenv('TRANSIT_TRACEMALLOC', 'preprocess.clean')
+
+    with stage('preprocess.clean', 'boston'):
+        sum(range(1000))
+    with stage('preprocess.merge', 'boston'):
+        pass
+
+    clean, merge = read_trace(tmp_path / "trace.jsonl")
+    assert os.path.exists(clean['profile']) and os.path.exists(clean['allocations'])
+    assert 'tracemalloc_peak_mb' in clean
+    assert 'profile' not in merge
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+from storage import Storage
+from train_model import FEATURES, LinearModel, load_dataset, read_dataset, train
+
+
+def test_load_dataset_reads_the_storage_format(panel, tmp_path, monkeypatch):
+    path_stem = str(tmp_path / "dataset")
+    Storage('csv').write(panel.iloc[:10], path_stem)
+    Storage('parquet').write(panel, path_stem)
+
+    monkeypatch.setenv('TRANSIT_STORAGE', 'parquet')
+    X, y, systems, years = load_dataset(path_stem, FEATURES)
+
+    # The complete rows of the Parquet table, not of the stale CSV
+    assert len(y) == len(panel) - 1
+    assert list(np.unique(systems)) == sorted(panel['system'].unique())
+
+    monkeypatch.setenv('TRANSIT_STORAGE', 'csv')
+    assert len(read_dataset(path_stem)) == 10
+
+
+def test_a_file_path_is_read_in_its_own_format(panel, tmp_path, monkeypatch):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+    Storage('parquet').write(panel.iloc[:10], str(tmp_path / "dataset"))
+
+    monkeypatch.setenv('TRANSIT_STORAGE', 'parquet')
+    assert len(read_dataset(str(tmp_path / "dataset.csv"))) == len(panel)
+
+
+def test_missing_dataset_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_dataset(str(tmp_path / "dataset"))
+
+
+def test_features_reading_the_target_are_refused(panel, tmp_path):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+
+    with pytest.raises(ValueError):
+        load_dataset(str(tmp_path / "dataset"), ['pop', 'trips_per_capita'])
+
+
+def test_train_saves_a_model(panel, tmp_path):
+    Storage('csv').write(panel, str(tmp_path / "dataset"))
+    output = str(tmp_path / "linear.npz")
+
+    model, timings = train('linear', FEATURES, str(tmp_path / "dataset"), output)
+
+    assert isinstance(model, LinearModel)
+    assert os.path.exists(output)
+    assert set(timings) == {'load', 'fit', 'score', 'save'}
@@ -0,0 +1,145 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import transit
+from conftest import DATA_DIR, WORKSPACE
+from registry import LOCATIONS
+
+TRANSIT = os.path.join(WORKSPACE, "src", "transit.py")
+
+
+def run(*args) -> str:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True).stdout
+
+
+@pytest.fixture
+def built(workspace):
+    import preprocess
+
+    assert preprocess.main() == {}
+    assert transit.main(['build']) == 0
+    return workspace
+
+
+def test_help_lists_every_stage():
+    out = run(TRANSIT, '--help')
+
+    for command in ['fetch', 'preprocess', 'build', 'train', 'predict', 'report', 'status', 'cache']:
+        assert command in out
+
+
+def test_inspection_commands_do_not_import_the_stages(built):
+    # The journal, read by status, is only opened if it exists
+    modules = run('-c', f"""
+import sys
+sys.argv = ['transit']
+sys.path.insert(0, {os.path.dirname(TRANSIT)!r})
+import transit
+for argv in [['status'], ['cache']]:
+    transit.main(argv)
+print(sorted(module for module in ['pandas', 'numpy', 'requests', 'matplotlib', 'scipy'] if module in sys.modules))
+""").splitlines()[-1]
+
+    assert modules == '[]'
+
+
+def test_unknown_command_is_a_usage_error(capsys):
+    with pytest.raises(SystemExit) as exit:
+        transit.main(['deploy'])
+
+    assert exit.value.code == 2
+    assert 'invalid choice' in capsys.readouterr().err
+
+
+def test_status_before_anything_was_built(workspace, capsys):
+    assert transit.main(['status']) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['system', 'ntd_id', 'zipcodes', 'raw', 'journal', 'processed', 'dataset']
+    assert lines[1].split()[0] == LOCATIONS[0] and lines[1].split()[-2:] == ['no', 'no']
+    assert lines[-1] == 'NTD tables: 8, dataset: missing'
+
+
+def test_status_after_a_build(built, capsys):
+    assert transit.main(['status', '--stale']) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[-1] == 'stale'
+    assert all(line.split()[-3:] == ['yes', 'yes', 'no'] for line in lines[1:1 + len(LOCATIONS)])
+    assert lines[-1] == 'NTD tables: 8, dataset: built'
+
+
+def test_cache_sizes(workspace, capsys):
+    cache_dir = os.path.join(DATA_DIR, "cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    assert transit.main(['cache']) == 0
+    assert capsys.readouterr().out.startswith('No cache in')
+
+    os.makedirs(os.path.join(cache_dir, "census"))
+    for name, size in [('census/a', 1000), ('census/b', 2000), ('journal.sqlite', 100)]:
+        with open(os.path.join(cache_dir, name), 'wb') as f:
+            f.write(b'0' * size)
+
+    assert transit.main(['cache']) == 0
+    assert capsys.readouterr().out.split('\n')[:3] == [
+        f"{'census':<32} {2:>8} files {'2.9 KB':>10}",
+        f"{'journal.sqlite':<32} {1:>8} files {'100 B':>10}",
+        f"{'total':<32} {3:>8} files {'3.0 KB':>10}",
+    ]
+
+
+def test_format_size():
+    assert transit.format_size(512) == '512 B'
+    assert transit.format_size(1536) == '1.5 KB'
+    assert transit.format_size(3 * 1024 ** 3) == '3.0 GB'
+    assert transit.format_size(5 * 1024 ** 4) == '5120.0 GB'
+
+
+def first_status_row(capsys) -> list[str]:
+    return capsys.readouterr().out.splitlines()[1].split()
+
+
+def test_status_reads_the_journal_while_a_fetch_writes_it(workspace, capsys):
+    from journal import DownloadJournal
+
+    journal_path = os.path.join(DATA_DIR, "cache", "journal.sqlite")
+    journal = DownloadJournal(journal_path)
+    journal.add(LOCATIONS[0], 'B19013', 'spec', ['2019', '2020'], ['44113', '44114'])
+    journal.complete(LOCATIONS[0], 'B19013', '2019', {'44113': 'url', '44114': 'url'})
+
+    # A fetch in the middle of a write transaction
+    writer = sqlite3.connect(journal_path, timeout=0, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        assert transit.main(['status']) == 0
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+    assert first_status_row(capsys)[4] == '2/4'
+    assert journal.counts() == {LOCATIONS[0]: {'done': 2, 'pending': 2}}
+    journal.close()
+
+
+def test_status_leaves_a_journal_of_an_older_schema_alone(workspace, capsys):
+    journal_path = os.path.join(DATA_DIR, "cache", "journal.sqlite")
+    os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    with sqlite3.connect(journal_path) as connection:
+        connection.execute('CREATE TABLE cells (system TEXT, status TEXT)')
+        connection.execute('INSERT INTO cells VALUES (?, ?)', (LOCATIONS[0], 'done'))
+    connection.close()
+
+    assert transit.main(['status']) == 0
+    assert first_status_row(capsys)[4] == '-'
+
+    # Replacing it is left to the next fetch
+    with sqlite3.connect(journal_path) as connection:
+        assert connection.execute('SELECT * FROM cells').fetchall() == [(LOCATIONS[0], 'done')]
+        assert connection.execute('PRAGMA user_version').fetchone()[0] == 0
+    connection.close()
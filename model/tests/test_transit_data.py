@@ -0,0 +1,151 @@
+import os
+
+import pandas as pd
+import pytest
+
+import synthetic
+from cache import ResponseCache
+from census_schema import METRICS
+from storage import Storage
+from transit_data import BRTData, NTDData
+
+# Archive members of the years fetched by the tests, see NTDData.save_data
+MEMBERS = {2016: '2016-NTD-Metrics_0.xlsx', 2019: '2019_Annual_Database_Files/Metrics_Static.xlsx'}
+
+
+@pytest.fixture
+def archives(stub):
+    for seed, (year, member) in enumerate(MEMBERS.items()):
+        stub.add_archive(year, synthetic.make_ntd_archive(year, 40, member, seed=seed))
+
+    return stub
+
+
+def make_ntd(tmp_path, name: str, cache: ResponseCache) -> NTDData:
+    ntd = NTDData(cache)
+    ntd.data_dir = str(tmp_path / name)
+    os.makedirs(ntd.data_dir)
+
+    return ntd
+
+
+def read_tables(ntd: NTDData) -> dict:
+    ntd.load_existing_data()
+    return {name: ntd.get_data(name) for name in ntd.tables}
+
+
+def test_parallel_ingest_matches_a_serial_run(archives, tmp_path):
+    cache = ResponseCache(str(tmp_path / "http"))
+
+    parallel = make_ntd(tmp_path, "parallel", cache)
+    parallel.save_data(max_workers=2, years=list(MEMBERS))
+
+    serial = make_ntd(tmp_path, "serial", cache)
+    for year, member in MEMBERS.items():
+        serial.fetch_zip_data(year, member)
+
+    tables = read_tables(parallel)
+    assert sorted(tables) == ['transit_data_2016_filtered', 'transit_data_2019_filtered']
+    for name, df in read_tables(serial).items():
+        pd.testing.assert_frame_equal(tables[name], df)
+
+    # Only the bus rapid transit rows, half of each sheet
+    assert len(tables['transit_data_2016_filtered']) == 20
+    assert (tables['transit_data_2016_filtered']['Mode'] == 'RB').all()
+
+
+def test_members_are_read_from_the_cached_archive(archives, tmp_path):
+    cache = ResponseCache(str(tmp_path / "http"))
+    first = make_ntd(tmp_path, "first", cache)
+    first.fetch_zip_data(2016, MEMBERS[2016])
+    requests = archives.requests
+
+    second = make_ntd(tmp_path, "second", ResponseCache(str(tmp_path / "http")))
+    report = second.fetch_zip_data(2016, MEMBERS[2016])
+
+    assert archives.requests == requests
+    assert report['rows'] == 20
+    pd.testing.assert_frame_equal(read_tables(second)['transit_data_2016_filtered'],
+                                  read_tables(first)['transit_data_2016_filtered'])
+
+
+
+class CountingStorage(Storage):
+    """
+    A Storage that records the name of every table it reads.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = []
+
+    def read(self, path_stem: str, columns: list[str] = None, rows: list = None) -> pd.DataFrame:
+        self.reads.append(os.path.basename(path_stem))
+        return super().read(path_stem, columns, rows)
+
+
+@pytest.fixture
+def brt(workspace, tmp_path):
+    system = list(workspace)[0]
+    brt = BRTData(system, storage=CountingStorage())
+    brt.store_dir = str(tmp_path / "tensors")
+
+    # A table that is not a metric is read on its own
+    Storage().write(pd.DataFrame({'44113': [50.0]}, index=pd.Index([2023], name='year')), os.path.join(brt.resultsLocation, 'walkscore'))
+    brt.load_existing_data()
+
+    return brt
+
+
+def test_brt_tables_are_read_on_first_access(brt):
+    assert brt.storage.reads == []
+    assert 'walkscore' in brt.tables
+
+    income = brt.get_data('income')
+    assert sorted(brt.storage.reads) == sorted(METRICS)
+    assert brt.get_data('pop').shape == income.shape
+    assert len(brt.storage.reads) == len(METRICS)
+
+    assert brt.get_data('walkscore')['44113'].tolist() == [50.0]
+    assert brt.get_data('walkscore') is brt.get_data('walkscore')
+    assert brt.storage.reads.count('walkscore') == 1
+
+
+def test_brt_tables_are_read_again_after_unload(brt):
+    income = brt.get_data('income').copy()
+    brt.get_data('walkscore')
+
+    brt.unload('walkscore')
+    assert not hasattr(brt, 'walkscore')
+    brt.get_data('walkscore')
+    assert brt.storage.reads.count('walkscore') == 2
+
+    # Unloading one metric unloads them all, they come back from the tensor cache
+    brt.unload('pop')
+    assert not brt.loaded & set(METRICS)
+    pd.testing.assert_frame_equal(brt.get_data('income'), income)
+    assert len(brt.storage.reads) == len(METRICS) + 2
+
+    brt.unload()
+    assert brt.loaded == set()
+
+
+def test_ntd_tables_are_read_on_first_access_and_after_unload(workspace):
+    ntd = NTDData(storage=CountingStorage())
+    ntd.load_existing_data()
+    assert ntd.storage.reads == [] and len(ntd.tables) == 8
+
+    first = ntd.get_data('transit_data_2016_filtered')
+    ntd.get_data('transit_data_2016_filtered')
+    assert ntd.storage.reads == ['transit_data_2016_filtered']
+
+    ntd.unload()
+    assert ntd.loaded == set()
+    pd.testing.assert_frame_equal(ntd.get_data('transit_data_2016_filtered'), first)
+    assert ntd.storage.reads == ['transit_data_2016_filtered'] * 2
+
+
+def test_unknown_tables_are_a_value_error(brt):
+    with pytest.raises(ValueError, match='no attribute'):
+        brt.get_data('ridership')
+    with pytest.raises(ValueError, match='no attribute'):
+        NTDData().get_data('transit_data_1999_filtered')
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from visualization import TARGET, Summary, data_hash, downsample
+
+
+@pytest.fixture
+def data(panel):
+    # 3 systems keep the rendering short
+    return panel[panel['system'].isin(['system_0', 'system_1', 'system_2'])]
+
+
+@pytest.fixture
+def summary(data, tmp_path):
+    return Summary(data, output_dir=str(tmp_path))
+
+
+def rendered(capsys) -> str:
+    """
+    Returns the 'Rendered n of m figures' part of the last render's output.
+    """
+    return capsys.readouterr().out.splitlines()[-1].split(' in ')[0]
+
+
+def test_downsample_keeps_peaks_and_dips():
+    x = np.arange(10000)
+    y = np.sin(x / 100)
+    y[1234], y[8765] = 5, -5
+
+    dx, dy = downsample(x, y, max_points=200)
+
+    assert len(dx) <= 200
+    assert dy.max() == 5 and dy.min() == -5
+    assert (np.diff(dx) > 0).all()
+    assert downsample(x[:100], y[:100], max_points=200)[0].tolist() == x[:100].tolist()
+
+
+def test_data_hash_ignores_the_index_but_not_the_values(panel):
+    assert data_hash(panel) == data_hash(panel.reset_index(drop=True))
+    assert data_hash(panel) != data_hash(panel.assign(pop=panel['pop'] + 1))
+    assert data_hash(panel) != data_hash(panel.rename(columns={'pop': 'population'}))
+
+
+def test_every_figure_is_rendered_then_cached(summary, tmp_path, capsys):
+    hashes = summary.render()
+
+    # Ridership and features per system, trends and distributions across systems
+    assert len(hashes) == 2 * 3 + 2
+    assert all(os.path.exists(tmp_path / filename) for filename in hashes)
+    assert rendered(capsys) == 'Rendered 8 of 8 figures'
+
+    assert summary.render() == hashes
+    assert rendered(capsys) == 'Rendered 0 of 8 figures'
+
+
+def test_only_changed_figures_are_rendered_again(data, summary, tmp_path, capsys):
+    summary.render()
+    mtime = os.path.getmtime(tmp_path / "system_1-ridership.png")
+
+    changed = data.copy()
+    changed.loc[changed['system'] == 'system_0', TARGET] *= 2
+    Summary(changed, output_dir=str(tmp_path)).render()
+
+    # The changed system's figures and the cross-system ones
+    assert rendered(capsys) == 'Rendered 4 of 8 figures'
+    assert os.path.getmtime(tmp_path / "system_1-ridership.png") == mtime
+
+
+def test_figures_of_removed_systems_are_deleted(data, summary, tmp_path):
+    summary.render()
+
+    Summary(data[data['system'] != 'system_2'], output_dir=str(tmp_path)).render()
+
+    assert not os.path.exists(tmp_path / "system_2-ridership.png")
+    assert os.path.exists(tmp_path / "system_1-ridership.png")
+
+
+def test_deleted_figures_are_rendered_again(summary, tmp_path, capsys):
+    summary.render()
+    os.remove(tmp_path / "all-trends.png")
+
+    summary.render()
+
+    assert rendered(capsys) == 'Rendered 1 of 8 figures'
+    assert os.path.exists(tmp_path / "all-trends.png")
+
+
+def test_report_with_predictions_in_a_process_pool(data, tmp_path):
+    predictions = pd.Series(data[TARGET].to_numpy() * 1.1, index=data.index)
+
+    path = Summary(data, predictions, str(tmp_path)).report(workers=2)
+
+    page = open(path).read()
+    assert os.path.exists(tmp_path / "all-scatter.png")
+    assert 'system_2-predicted.png?v=' in page
+    assert page.index('all-trends.png') < page.index('id="system_0"') < page.index('system_0-ridership.png')
@@ -0,0 +1,172 @@
+import json
+import os
+import time
+
+import pytest
+
+from cache import ResponseCache
+from walkability import DailyQuota, QuotaExceeded, WalkScoreClient, WalkScoreError
+
+POINTS = {f'4411{i}': (41.5 + i / 100, -81.6 - i / 100) for i in range(6)}
+
+
+def make_client(tmp_path, **kwargs) -> WalkScoreClient:
+    kwargs = {'rate': 1000, 'cache': ResponseCache(str(tmp_path / "walkscore")),
+              'quota_path': str(tmp_path / "quota.json"), **kwargs}
+    return WalkScoreClient('test-key', **kwargs)
+
+
+def test_scores_are_fetched_then_served_from_the_cache(stub, tmp_path):
+    client = make_client(tmp_path)
+
+    scores = client.fetch_many(POINTS)
+    assert list(scores) == list(POINTS)
+    assert all(0 <= score <= 100 for score in scores.values())
+
+    assert make_client(tmp_path).fetch_many(POINTS) == scores
+    assert stub.requests == len(POINTS)
+
+
+def test_requests_are_rate_limited(stub, tmp_path):
+    client = make_client(tmp_path, max_workers=4, rate=5)
+
+    start = time.monotonic()
+    client.fetch_many(POINTS)
+
+    # A burst of 5, then 5 per second
+    assert time.monotonic() - start >= 1 / 5 - 0.01
+
+
+def test_daily_quota_stops_requests_and_is_persisted(stub, tmp_path):
+    client = make_client(tmp_path, daily_quota=2)
+    client.fetch(41.5, -81.6)
+    client.fetch(41.6, -81.7)
+
+    with pytest.raises(QuotaExceeded):
+        client.fetch(41.7, -81.8)
+    assert stub.requests == 2
+
+    # Another run of the same day draws from the same quota, cached scores are free
+    with pytest.raises(QuotaExceeded):
+        make_client(tmp_path, daily_quota=2).fetch(41.7, -81.8)
+    assert make_client(tmp_path, daily_quota=2).fetch(41.5, -81.6) is not None
+    assert json.load(open(tmp_path / "quota.json"))['used'] == 2
+
+
+def test_quota_reported_by_the_api_exhausts_the_local_quota(stub, tmp_path):
+    client = make_client(tmp_path)
+    stub.walkscore_status = 41
+
+    with pytest.raises(QuotaExceeded):
+        client.fetch(41.5, -81.6)
+
+    stub.walkscore_status = 1
+    with pytest.raises(QuotaExceeded):
+        client.fetch(41.5, -81.6)
+    assert stub.requests == 1
+    assert DailyQuota(path=str(tmp_path / "quota.json")).used == DailyQuota().limit
+
+
+@pytest.mark.parametrize('status', [40, 42])
+def test_rejected_requests_raise(stub, tmp_path, status):
+    stub.walkscore_status = status
+
+    with pytest.raises(WalkScoreError):
+        make_client(tmp_path).fetch(41.5, -81.6)
+
+
+def test_scores_being_calculated_are_not_cached(stub, tmp_path):
+    client = make_client(tmp_path)
+    stub.walkscore_status = 2
+
+    assert client.fetch(41.5, -81.6) is None
+
+    stub.walkscore_status = 1
+    assert client.fetch(41.5, -81.6) is not None
+    assert stub.requests == 2
+
+
+def test_server_errors_are_not_cached(stub, tmp_path):
+    client = make_client(tmp_path)
+    stub.faults = [503]
+
+    assert client.fetch(41.5, -81.6) is None
+    assert client.fetch(41.5, -81.6) is not None
+    assert stub.requests == 2
+
+
+def test_missing_gazetteer_skips_walk_scores(tmp_path, monkeypatch, capsys):
+    import make_dataset
+
+    monkeypatch.setenv('WALKSCORE_API_KEY', 'test-key')
+    monkeypatch.setenv('TRANSIT_GAZETTEER', str(tmp_path / "missing.txt"))
+
+    assert make_dataset.walkscore_client() == (None, None)
+    assert 'skipping Walk Scores' in capsys.readouterr().err
+
+
+def test_walk_scores_are_fetched_with_a_gazetteer(tmp_path, monkeypatch):
+    import make_dataset
+    from conftest import FIXTURES_DIR
+
+    monkeypatch.setenv('WALKSCORE_API_KEY', 'test-key')
+    monkeypatch.setenv('TRANSIT_GAZETTEER', os.path.join(FIXTURES_DIR, "zcta_centroids.txt"))
+
+    client, index = make_dataset.walkscore_client()
+    client.close()
+    assert isinstance(client, WalkScoreClient)
+    assert '44113' in index.centroids(['44113'])
+
+    assert make_dataset.walkscore_client(offline=True) == (None, None)
+
+
+def test_scores_fetched_before_the_quota_ran_out_are_kept(stub, tmp_path):
+    client = make_client(tmp_path, max_workers=1)
+    stub.walkscore_quota = 4
+
+    with pytest.raises(QuotaExceeded) as error:
+        client.fetch_many(POINTS)
+
+    scores = error.value.scores
+    assert list(scores) == list(POINTS)
+    assert [score is not None for score in scores.values()] == [True] * 4 + [False] * 2
+    assert stub.requests == 5
+
+    # The scores are cached, the next day only the rest is requested
+    stub.walkscore_quota = None
+    os.remove(tmp_path / "quota.json")
+    rest = make_client(tmp_path).fetch_many(POINTS)
+    assert all(rest[key] == score for key, score in scores.items() if score is not None)
+    assert None not in rest.values()
+    assert stub.requests == 7
+
+
+class Centroids(object):
+    def centroids(self, zipcodes: list[str]) -> dict:
+        return {zipcode: (41.5 + i / 100, -81.6 - i / 100) for i, zipcode in enumerate(zipcodes)}
+
+
+def test_fetch_run_goes_on_without_walk_scores_once_the_quota_is_exceeded(workspace, stub, tmp_path, monkeypatch, capsys):
+    import make_dataset
+    from registry import LOCATIONS, zipcodes
+    from transit_data import BRTData, NTDData
+
+    systems = LOCATIONS[:3]
+    monkeypatch.setattr(make_dataset, 'LOCATIONS', systems)
+    monkeypatch.setattr(make_dataset, 'save_brt_data', lambda brt: None)
+    monkeypatch.setattr(NTDData, 'save_data', lambda self: None)
+    monkeypatch.setattr(make_dataset, 'walkscore_client', lambda offline: (make_client(tmp_path, max_workers=1), Centroids()))
+
+    # Enough for the first system and two zipcodes of the second
+    stub.walkscore_quota = len(zipcodes(systems[0])) + 2
+    make_dataset.main()
+
+    assert f'skipping Walk Scores from {systems[1]} on' in capsys.readouterr().err
+    assert stub.requests == len(zipcodes(systems[0])) + 3
+
+    walkscores = [BRTData(system) for system in systems]
+    for brt in walkscores:
+        brt.load_existing_data()
+    assert walkscores[0].get_data('walkscore').notna().all(axis=None)
+    assert walkscores[1].get_data('walkscore').iloc[0].notna().tolist() == [True] * 2 + [False] * (len(zipcodes(systems[1])) - 2)
+    assert 'walkscore' not in walkscores[2].tables
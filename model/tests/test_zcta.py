@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from zcta import ZCTAIndex, read_gazetteer
+
+GAZETTEER = os.path.join(FIXTURES_DIR, "zcta_centroids.txt")
+
+# Public Square to University Circle, along Euclid Avenue
+HEALTHLINE = [(41.4995, -81.6937), (41.5016, -81.6540), (41.5088, -81.6045)]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ZCTAIndex.load(GAZETTEER, cache_path=str(tmp_path / "zcta_index.pkl"))
+
+
+def test_gazetteer_columns_are_read_despite_the_padded_header():
+    df = read_gazetteer(GAZETTEER)
+
+    assert list(df['zipcode'][:2]) == ['44113', '44114']
+    assert '02116' in set(df['zipcode'])
+    assert df['lon'].between(-124, -71).all()
+
+
+def test_within_returns_nearby_zipcodes_nearest_first(index):
+    zipcodes = index.within(41.5055, -81.6052, 3)
+
+    assert zipcodes[0] == '44106'
+    assert set(zipcodes) <= {'44106', '44103', '44104', '44108', '44112', '44120'}
+    assert '02116' not in index.within(41.5055, -81.6052, 500)
+
+
+def test_nearest_returns_the_k_nearest_zipcodes(index):
+    assert index.nearest(42.35, -71.07) == ['02116']
+    assert index.nearest(42.35, -71.07, k=2) == ['02116', '02118']
+
+
+def test_along_keeps_the_corridor_order(index):
+    zipcodes = index.along(HEALTHLINE, 2.5)
+
+    assert zipcodes[0] in {'44113', '44114'}
+    assert zipcodes.index('44115') < zipcodes.index('44103') < zipcodes.index('44106')
+    assert '44102' not in zipcodes and '97401' not in zipcodes
+    assert index.along([(0.0, 0.0), (0.1, 0.1)], 1) == []
+
+
+def test_centroids_leave_out_unknown_zipcodes(index):
+    centroids = index.centroids(['44113', '99999'])
+
+    assert list(centroids) == ['44113']
+    assert centroids['44113'] == pytest.approx((41.481649, -81.700146))
+
+
+def test_index_is_cached_until_the_gazetteer_changes(tmp_path):
+    gazetteer = tmp_path / "gazetteer.txt"
+    gazetteer.write_bytes(open(GAZETTEER, 'rb').read())
+    cache_path = str(tmp_path / "zcta_index.pkl")
+
+    first = ZCTAIndex.load(str(gazetteer), cache_path=cache_path)
+    assert os.path.exists(cache_path)
+    assert ZCTAIndex.load(str(gazetteer), cache_path=cache_path).zipcodes.tolist() == first.zipcodes.tolist()
+
+    # A new Gazetteer file rebuilds the index
+    with open(gazetteer, 'a') as f:
+        f.write('10001\t0\t0\t0.000\t0.000\t40.750649\t-73.997298\n')
+    assert len(ZCTAIndex.load(str(gazetteer), cache_path=cache_path)) == len(first) + 1